@@ -42,7 +42,7 @@ class UserAdmin(DjangoUserAdmin):
 
 class EmotionalNeedStateAdmin(admin.ModelAdmin):
     list_filter = ('emotional_need', )
-    list_display = ('__str__', 'created_at', 'is_current')
+    list_display = ('__str__', 'created_at')
     ordering = ('-created_at', )
 
 
@@ -51,7 +51,22 @@ class EmotionalLetterAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    ordering = ('-created_at',)
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status_code', 'query_count', 'user', 'created_at')
+    list_filter = ('method', 'status_code')
+    ordering = ('-created_at',)
+    exclude = ('stats',)
+
+
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.EmotionalNeed)
 admin.site.register(models.EmotionalNeedState, EmotionalNeedStateAdmin)
 admin.site.register(models.EmotionalLetter, EmotionalLetterAdmin)
+admin.site.register(models.Job, JobAdmin)
+admin.site.register(models.RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,220 @@
+"""
+Archival of old emotional need states.
+
+States older than settings.EMOTIONAL_NEED_STATE_ARCHIVE_DAYS are moved
+out of EmotionalNeedState into EmotionalNeedStateArchive rows, zlib
+compressed JSON chunks of at most ARCHIVE_CHUNK_SIZE states, so that the
+hot table only holds recent history.
+
+The current state and the states of its day are never archived, and
+archiving cuts at a day boundary: rollups of archived days are kept
+as they are and never recomputed from a partial day. States with an
+appreciation text are not archived either, so that received
+appreciations keep being read from the table alone, nor are the states
+of the sample user's needs. Archived states are
+read-only, they are merged back into exports and into state_history
+when it is requested since before the archive cutoff. Without since,
+state_history starts after the archives, see get_unarchived_since.
+
+Each archive keeps the value_abs of its last state, cumulated over the
+whole history including the appreciations left in the table, so that a
+state_history starting after the archive continues the values without
+decompressing it, see get_previous_state.
+"""
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from sacred_garden import models
+
+
+ARCHIVE_CHUNK_SIZE = 5000
+
+ARCHIVED_STATE_FIELDS = [
+    'id', 'status', 'value_type', 'value_abs', 'value_rel', 'partner_user_id',
+    'text', 'appreciation_text', 'created_at',
+]
+
+
+def get_archive_cutoff(days):
+    """Start of the local day `days` ago."""
+    day = timezone.localdate() - timedelta(days=days)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def archive_emotional_need_states(emotional_need_id, before):
+    """Move the states of the emotional need created before `before` to archives, returns their number."""
+    states = models.EmotionalNeedState.objects.filter(emotional_need_id=emotional_need_id)
+
+    with transaction.atomic():
+        eneed = models.EmotionalNeed.objects.filter(
+            id=emotional_need_id,
+        ).values(
+            'user_id', 'user__is_sample', 'sample_user_partner_id', 'current_state_id', 'current_state__created_at'
+        ).get()
+
+        # Written once and shown to every new demo user, see sample_data
+        if eneed['user__is_sample']:
+            return 0
+
+        current_state_id, current_state_created_at = eneed['current_state_id'], eneed['current_state__created_at']
+
+        if current_state_created_at is not None:
+            current_day = timezone.localtime(current_state_created_at).date()
+            before = min(before, timezone.make_aware(datetime.combine(current_day, time.min)))
+
+        old_states = states.filter(created_at__lt=before).exclude(id=current_state_id)
+
+        rows = list(old_states.filter(
+            Q(appreciation_text__isnull=True) | Q(appreciation_text=''),
+        ).order_by('created_at', 'id').values(*ARCHIVED_STATE_FIELDS))
+        if not rows:
+            return 0
+
+        previous_state = get_previous_state(emotional_need_id, rows[0]['created_at'])
+
+        # Cumulated on copies, the archived value_abs stay as stored, along
+        # with the appreciations in between which stay in the table
+        states_since = list(old_states.filter(
+            created_at__gte=rows[0]['created_at'],
+        ).order_by('created_at', 'id').only('id', 'value_type', 'value_abs', 'value_rel'))
+        models.cumulate_value_abs(states_since, previous_state)
+        cumulated_value_abs = {state.id: state.value_abs for state in states_since}
+
+        for row in rows:
+            # DjangoJSONEncoder would drop microseconds
+            row['created_at'] = row['created_at'].isoformat()
+
+        for i in range(0, len(rows), ARCHIVE_CHUNK_SIZE):
+            chunk = rows[i:i + ARCHIVE_CHUNK_SIZE]
+
+            models.EmotionalNeedStateArchive.objects.create(
+                emotional_need_id=emotional_need_id,
+                first_created_at=parse_datetime(chunk[0]['created_at']),
+                last_created_at=parse_datetime(chunk[-1]['created_at']),
+                count=len(chunk),
+                last_value_abs=cumulated_value_abs[chunk[-1]['id']],
+                data=zlib.compress(json.dumps(chunk).encode()),
+            )
+
+            # Only what was archived, not states created meanwhile by an import
+            states.filter(id__in=[row['id'] for row in chunk]).delete()
+
+        # The default state_history now starts after the new archives
+        models.bump_data_version([eneed['user_id'], eneed['sample_user_partner_id']])
+
+    return len(rows)
+
+
+def iter_archived_states(archive):
+    """Unsaved EmotionalNeedState instances of the archive."""
+    for row in json.loads(zlib.decompress(archive.data)):
+        row['created_at'] = parse_datetime(row['created_at'])
+        # Written before EmotionalNeed.current_state replaced the flag
+        row.pop('is_current', None)
+        yield models.EmotionalNeedState(emotional_need_id=archive.emotional_need_id, **row)
+
+
+def get_unarchived_since(emotional_need_id):
+    """Start of the history after the archives of the emotional need, None when nothing is archived."""
+    last_created_at = models.EmotionalNeedStateArchive.objects.filter(
+        emotional_need_id=emotional_need_id,
+    ).aggregate(
+        last_created_at=Max('last_created_at')
+    )['last_created_at']
+
+    if last_created_at is None:
+        return None
+
+    return last_created_at + timedelta(microseconds=1)
+
+
+def get_previous_state(emotional_need_id, before):
+    """
+    Unsaved state with the value_abs, cumulated over the whole history, of
+    the last state created before `before`, None when there is none.
+
+    Starts from last_value_abs of the latest archive before, only
+    decompresses the archive which `before` falls in, and cumulates the
+    hot states in the database.
+    """
+    if before is None:
+        return None
+
+    archives = list(models.EmotionalNeedStateArchive.objects.filter(
+        emotional_need_id=emotional_need_id, first_created_at__lt=before,
+    ).defer('data').order_by('-last_created_at')[:2])
+
+    previous_state = None
+    after = None
+
+    overlapping_archive = archives.pop(0) if archives and archives[0].last_created_at >= before else None
+
+    if archives:
+        previous_state = models.EmotionalNeedState(value_abs=archives[0].last_value_abs)
+        after = archives[0].last_created_at
+
+    states = models.EmotionalNeedState.objects.filter(emotional_need_id=emotional_need_id, created_at__lt=before)
+    if after is not None:
+        states = states.filter(created_at__gt=after)
+
+    if overlapping_archive is not None:
+        # Only the appreciations in the archive's period are still in the table
+        states = merge_archived_states([overlapping_archive], states)
+        return models.cumulate_value_abs(
+            [state for state in states if state.created_at < before], previous_state)
+
+    # Absolute states restart the cumulation
+    last_absolute = states.filter(
+        value_type=models.EmotionalNeed.StateValueType.ABSOLUTE,
+    ).order_by(
+        'created_at', 'id'
+    ).values_list(
+        'created_at', 'value_abs'
+    ).last()
+
+    relative_states = states.filter(value_type=models.EmotionalNeed.StateValueType.RELATIVE)
+    if last_absolute is not None:
+        created_at, value_abs = last_absolute
+        previous_state = models.EmotionalNeedState(value_abs=value_abs)
+        relative_states = relative_states.filter(created_at__gt=created_at)
+
+    relative = relative_states.aggregate(count=Count('id'), value_rel=Sum('value_rel'))
+    if relative['count']:
+        # models.cumulate_value_abs of the relative states, summed by the database
+        if previous_state is None:
+            value_abs = relative['value_rel']
+        else:
+            value_abs = (previous_state.value_abs or 0) + (relative['value_rel'] or 0)
+        previous_state = models.EmotionalNeedState(value_abs=value_abs)
+
+    return previous_state
+
+
+def find_emotional_need_state_archives(eneed, since=None):
+    archives = models.EmotionalNeedStateArchive.objects.filter(emotional_need=eneed)
+
+    if since is not None:
+        archives = archives.filter(last_created_at__gte=since)
+
+    return archives.order_by('first_created_at')
+
+
+def merge_archived_states(archives, states, since=None):
+    """Archived states newer than `since` and hot states, ordered by creation."""
+    archived_states = [
+        state
+        for archive in archives
+        for state in iter_archived_states(archive)
+        if since is None or state.created_at >= since
+    ]
+
+    if not archived_states:
+        return states
+
+    return sorted(archived_states + list(states), key=lambda state: (state.created_at, state.id))
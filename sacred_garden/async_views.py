@@ -0,0 +1,119 @@
+"""
+Async versions of the read-heavy endpoints, served under /async/.
+
+DRF views are sync only, so these are plain Django async views which use
+the async ORM and reuse the DRF serializers on fully loaded instances.
+They run outside ATOMIC_REQUESTS: every endpoint here is read-only.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import JsonResponse
+from rest_framework import exceptions
+
+from sacred_garden import archive
+from sacred_garden import authentication
+from sacred_garden import models
+from sacred_garden import serializers
+
+
+authenticator = authentication.CachedJSONWebTokenAuthentication()
+
+
+def error_response(exc):
+    response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response['WWW-Authenticate'] = authenticator.authenticate_header(None)
+
+    return response
+
+
+def jwt_required(view):
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            # Only hits the database when the user is not cached
+            result = await sync_to_async(authenticator.authenticate)(request)
+            if result is None:
+                raise exceptions.NotAuthenticated()
+
+            request.user = result[0]
+            return await view(request, *args, **kwargs)
+
+        except exceptions.APIException as e:
+            return error_response(e)
+
+    return transaction.non_atomic_requests(wrapper)
+
+
+async def alist(qs):
+    return [obj async for obj in qs]
+
+
+@jwt_required
+async def me(request):
+    user = await models.get_user_with_unread_letters_count(request.user.id).aget()
+
+    emotional_needs, partner_emotional_needs = models.split_emotional_needs_for_viewer(
+        user, await alist(models.get_emotional_needs_for_viewer(user)))
+
+    return JsonResponse(serializers.serialize_me(user, emotional_needs, partner_emotional_needs))
+
+
+@jwt_required
+async def state_history(request, pk):
+    try:
+        eneed = await models.get_visible_emotional_needs(request.user).aget(pk=pk)
+    except models.EmotionalNeed.DoesNotExist:
+        raise exceptions.NotFound()
+
+    query_serializer = serializers.StateHistoryQuerySerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return JsonResponse(query_serializer.errors, status=400)
+    since = query_serializer.validated_data.get('since')
+
+    shift = await sync_to_async(models.get_emotional_need_sample_data_shift)(request.user, eneed)
+    if since is None:
+        # Without decompressing the archives
+        since = await sync_to_async(archive.get_unarchived_since)(eneed.id)
+    else:
+        since -= shift
+
+    if eneed.user_id == request.user.id:
+        eneed_statuses = models.find_emotional_need_statuses(eneed, user=request.user, since=since)
+    else:
+        eneed_statuses = models.find_emotional_need_statuses(eneed, partner_user=request.user, since=since)
+
+    eneed_statuses = archive.merge_archived_states(
+        await alist(archive.find_emotional_need_state_archives(eneed, since)), await alist(eneed_statuses), since)
+    eneed_statuses = models.shift_created_at(eneed_statuses, shift)
+
+    serializer = serializers.EmotionalNeedStateSerializer(
+        many=True, instance=eneed_statuses,
+        context={'previous_state': await sync_to_async(archive.get_previous_state)(eneed.id, since)})
+
+    return JsonResponse(serializer.data, safe=False)
+
+
+@jwt_required
+async def appreciations(request):
+    letters, eneed_states = models.find_received_appreciations(request.user)
+
+    eneed_states = await sync_to_async(models.shift_received_sample_states)(request.user, await alist(eneed_states))
+
+    data = serializers.serialize_appreciations(await alist(letters), eneed_states)
+
+    return JsonResponse(data, safe=False)
+
+
+@jwt_required
+async def emotional_letters(request):
+    letters = await alist(models.find_emotional_letters(request.user))
+
+    serializer = serializers.EmotionalLetterSerializer(
+        instance=letters, many=True, context={'request': request})
+
+    return JsonResponse(serializer.data, safe=False)
@@ -0,0 +1,132 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.authentication import jwt_get_username_from_payload
+
+
+class UserCache:
+    """
+    Per-process cache of users resolved from JWT payloads.
+
+    Entries expire after `ttl` seconds and are dropped as soon as the user
+    is saved or deleted, so a password change or deactivation takes effect
+    on the next request handled by this process. The least recently used
+    entries are evicted beyond `max_size`, and expired ones are swept at
+    most once per `ttl`.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self._usernames_by_id = {}
+        self._next_sweep_at = time.monotonic() + ttl
+
+    def get(self, username):
+        with self._lock:
+            entry = self._users.get(username)
+
+            if entry is None:
+                return None
+
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                self._remove(username)
+                return None
+
+            self._users.move_to_end(username)
+
+        # Every request gets its own instance: views mutate and save request.user
+        return copy.copy(user)
+
+    def set(self, username, user):
+        user = copy.copy(user)
+        user._state.fields_cache = {}
+
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._next_sweep_at:
+                self._sweep(now)
+
+            self._users[username] = (now + self.ttl, user)
+            self._users.move_to_end(username)
+            self._usernames_by_id[user.pk] = username
+
+            while len(self._users) > self.max_size:
+                self._remove(next(iter(self._users)))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            username = self._usernames_by_id.get(user_id)
+            if username is not None:
+                self._remove(username)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._usernames_by_id.clear()
+
+    def _sweep(self, now):
+        expired = [username for username, (expires_at, _) in self._users.items() if expires_at <= now]
+        for username in expired:
+            self._remove(username)
+
+        self._next_sweep_at = now + self.ttl
+
+    def _remove(self, username):
+        _, user = self._users.pop(username)
+        # Unless the id now maps to another username, e.g. after an email change
+        if self._usernames_by_id.get(user.pk) == username:
+            del self._usernames_by_id[user.pk]
+
+
+user_cache = UserCache(
+    ttl=getattr(settings, 'JWT_USER_CACHE_TTL', 30), max_size=getattr(settings, 'JWT_USER_CACHE_SIZE', 10000))
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    JWT authentication which resolves the user from `user_cache`
+    and only hits the database on a cache miss.
+    """
+
+    def authenticate_credentials(self, payload):
+        username = jwt_get_username_from_payload(payload)
+
+        if not username:
+            raise exceptions.AuthenticationFailed('Invalid payload.')
+
+        user = user_cache.get(username)
+
+        if user is None:
+            user = super().authenticate_credentials(payload)
+            user_cache.set(username, user)
+
+        elif not user.is_active:
+            raise exceptions.AuthenticationFailed('User account is disabled.')
+
+        return user
+
+
+class QueryParamJSONWebTokenAuthentication(CachedJSONWebTokenAuthentication):
+    """
+    Reads the token from the `token` query parameter,
+    for clients like EventSource which can not send headers.
+    """
+
+    def get_jwt_value(self, request):
+        return request.GET.get('token')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(instance, **kwargs):
+    user_cache.invalidate(instance.pk)
@@ -0,0 +1,97 @@
+"""
+Statuses of the emails checked by CheckUserView, most of them repeated
+checks from the login screen, including of emails of no user.
+
+The statuses are cached per process: entries expire after
+settings.EMAIL_STATUS_CACHE_TTL seconds, the least recently used ones are
+evicted beyond settings.EMAIL_STATUS_CACHE_SIZE entries, and saving or
+deleting a user (creation, invite, activation) drops the entry of their
+email in this process, and again once the transaction commits. Other
+processes see the change once their entry expires, keep the TTL short.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from sacred_garden import models
+
+
+MISSING = object()
+
+
+class EmailStatusCache:
+    """Bounded LRU cache of email statuses, thread-safe."""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._statuses = OrderedDict()
+
+    def get(self, email):
+        """The status of the email, MISSING when not cached."""
+        with self._lock:
+            entry = self._statuses.get(email)
+
+            if entry is None:
+                return MISSING
+
+            expires_at, status = entry
+            if expires_at <= time.monotonic():
+                del self._statuses[email]
+                return MISSING
+
+            self._statuses.move_to_end(email)
+            return status
+
+    def set(self, email, status):
+        if self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._statuses[email] = (time.monotonic() + self.ttl, status)
+            self._statuses.move_to_end(email)
+
+            while len(self._statuses) > self.max_size:
+                self._statuses.popitem(last=False)
+
+    def invalidate(self, email):
+        with self._lock:
+            self._statuses.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._statuses.clear()
+
+
+email_status_cache = EmailStatusCache(
+    ttl=settings.EMAIL_STATUS_CACHE_TTL, max_size=settings.EMAIL_STATUS_CACHE_SIZE)
+
+
+def get_email_status(email):
+    """(is_invited, is_active) of the user with the email, None when there is none."""
+    status = email_status_cache.get(email)
+
+    if status is MISSING:
+        try:
+            status = models.User.objects.filter(email=email).values_list('is_invited', 'is_active').get()
+        except models.User.DoesNotExist:
+            status = None
+
+        email_status_cache.set(email, status)
+
+    return status
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_email_status(instance, **kwargs):
+    email_status_cache.invalidate(instance.email)
+    # Again once committed, concurrent requests may have cached the status from before
+    transaction.on_commit(partial(email_status_cache.invalidate, instance.email))
@@ -0,0 +1,205 @@
+"""
+Pub/sub of per-user events streamed to clients by views.EventsView.
+
+Events are published once the surrounding transaction commits. The broker
+is chosen by settings.EVENTS_BROKER:
+
+- InProcessBroker delivers only to clients connected to the same process;
+- PostgresBroker sends events with NOTIFY so that every process LISTENing
+  on the channel delivers them to its own clients. The listener reconnects
+  when its connection is lost, the events notified meanwhile are missed.
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+# Backoff of the PostgresBroker listener reconnections
+LISTEN_RETRY_SECONDS = 1
+LISTEN_MAX_RETRY_SECONDS = 60
+# Idle time after which the listener checks its connection
+LISTEN_PING_SECONDS = 60
+
+class Subscription:
+
+    def __init__(self, broker, user_id, maxsize=100):
+        self.broker = broker
+        self.user_id = user_id
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def deliver(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Slow client, it will have to re-fetch anyway
+            pass
+
+    def get(self, timeout=None):
+        """Next event or None when nothing arrived within the timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_ids, event):
+        self.deliver(user_ids, event)
+
+    def deliver(self, user_ids, event):
+        with self._lock:
+            subscriptions = [s for user_id in user_ids for s in self._subscriptions.get(user_id, ())]
+
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+class PostgresBroker(InProcessBroker):
+
+    channel = 'sacred_garden_events'
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def subscribe(self, user_id):
+        self.ensure_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_ids, event):
+        payload = json.dumps({'user_ids': list(user_ids), 'event': event})
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    def ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self.listen, daemon=True)
+                self._listener.start()
+
+    def listen(self):
+        """Delivers the notifications, reconnecting with a backoff when the connection fails."""
+        retry_seconds = LISTEN_RETRY_SECONDS
+
+        while True:
+            try:
+                pg_connection = self.connect_listener()
+            except Exception:
+                logger.exception('Events listener failed to connect, retrying in %s s', retry_seconds)
+            else:
+                retry_seconds = LISTEN_RETRY_SECONDS
+                try:
+                    self.receive(pg_connection)
+                except Exception:
+                    # Events notified until LISTEN again are lost, clients re-fetch on reconnecting
+                    logger.exception('Events listener connection lost, reconnecting in %s s', retry_seconds)
+                finally:
+                    pg_connection.close()
+
+            time.sleep(retry_seconds)
+            retry_seconds = min(retry_seconds * 2, LISTEN_MAX_RETRY_SECONDS)
+
+    def connect_listener(self):
+        # Dedicated psycopg2 connection, not managed by Django
+        pg_connection = connection.Database.connect(**connection.get_connection_params())
+        pg_connection.autocommit = True
+
+        try:
+            with pg_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+        except Exception:
+            pg_connection.close()
+            raise
+
+        return pg_connection
+
+    def receive(self, pg_connection):
+        while True:
+            if select.select([pg_connection], [], [], LISTEN_PING_SECONDS) == ([], [], []):
+                # A connection dropped without a reset is only noticed when used
+                with pg_connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+
+            pg_connection.poll()
+
+            while pg_connection.notifies:
+                message = json.loads(pg_connection.notifies.pop(0).payload)
+                self.deliver(message['user_ids'], message['event'])
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENTS_BROKER)()
+
+        return _broker
+
+
+def publish(user_ids, event_type, **data):
+    """Publish an event to the given users after the current transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    event = {'type': event_type, **data}
+
+    if user_ids:
+        transaction.on_commit(lambda: get_broker().publish(user_ids, event))
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def stream(subscription, heartbeat):
+    """Server-sent events for the subscription, with a comment line as heartbeat."""
+    try:
+        yield f'retry: {int(heartbeat * 1000)}\n\n'
+
+        while True:
+            event = subscription.get(timeout=heartbeat)
+
+            if event is None:
+                yield ': heartbeat\n\n'
+            else:
+                yield format_sse(event)
+    finally:
+        subscription.close()
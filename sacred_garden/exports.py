@@ -0,0 +1,91 @@
+"""
+Streaming export of a user's emotional needs, their states and letters.
+
+Rows are read with .values().iterator(), which uses server-side cursors on
+PostgreSQL, and written out one by one, so memory stays constant whatever
+the size of the history.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+
+from sacred_garden import archive
+from sacred_garden import models
+
+
+CHUNK_SIZE = 2000
+
+EMOTIONAL_NEED_FIELDS = ['id', 'user_id', 'name', 'state_value_type']
+EMOTIONAL_NEED_STATE_FIELDS = [
+    'id', 'emotional_need_id', 'status', 'value_type', 'value_abs', 'value_rel',
+    'partner_user_id', 'is_current', 'text', 'appreciation_text', 'created_at',
+]
+EMOTIONAL_LETTER_FIELDS = [
+    'id', 'sender_id', 'recipient_id', 'text', 'appreciation_text', 'advice_text',
+    'created_at', 'is_read', 'is_acknowledged',
+]
+
+# Every record type in a single CSV: the union of the fields, in order
+CSV_FIELDS = ['type'] + list(dict.fromkeys(
+    EMOTIONAL_NEED_FIELDS + EMOTIONAL_NEED_STATE_FIELDS + EMOTIONAL_LETTER_FIELDS))
+
+
+def iter_records(user):
+    """Dicts of every exported row, each with its `type`."""
+    sources = [
+        ('emotional_need', EMOTIONAL_NEED_FIELDS, models.EmotionalNeed.objects.filter(
+            user=user,
+        )),
+        ('emotional_need_state', EMOTIONAL_NEED_STATE_FIELDS, models.EmotionalNeedState.objects.filter(
+            emotional_need__user=user,
+        ).annotate(
+            is_current=ExpressionWrapper(Q(emotional_need__current_state=F('id')), output_field=BooleanField()),
+        )),
+        ('emotional_letter', EMOTIONAL_LETTER_FIELDS, models.EmotionalLetter.objects.filter(
+            Q(sender=user) | Q(recipient=user),
+        )),
+    ]
+
+    for record_type, fields, queryset in sources:
+        for row in queryset.order_by('id').values(*fields).iterator(chunk_size=CHUNK_SIZE):
+            yield {'type': record_type, **row}
+
+    # One archive, at most archive.ARCHIVE_CHUNK_SIZE states, in memory at a time
+    archives = models.EmotionalNeedStateArchive.objects.filter(emotional_need__user=user).order_by('id')
+    for archive_row in archives.iterator(chunk_size=1):
+        for state in archive.iter_archived_states(archive_row):
+            yield {
+                'type': 'emotional_need_state',
+                **{field: getattr(state, field) for field in EMOTIONAL_NEED_STATE_FIELDS if field != 'is_current'},
+                # Current states are never archived
+                'is_current': False,
+            }
+
+
+def iter_ndjson(user):
+    for record in iter_records(user):
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+class Echo:
+    """File-like object which returns what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(user):
+    writer = csv.DictWriter(Echo(), fieldnames=CSV_FIELDS)
+
+    yield writer.writeheader()
+
+    for record in iter_records(user):
+        yield writer.writerow(record)
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', iter_ndjson),
+    'csv': ('text/csv', iter_csv),
+}
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class TunedPBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = settings.PASSWORD_HASHING_PBKDF2_ITERATIONS
+
+
+class TunedScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = settings.PASSWORD_HASHING_SCRYPT_WORK_FACTOR
+
+
+class TunedArgon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Requires argon2-cffi to be installed."""
+
+    time_cost = settings.PASSWORD_HASHING_ARGON2_TIME_COST
+    memory_cost = settings.PASSWORD_HASHING_ARGON2_MEMORY_COST
+    parallelism = settings.PASSWORD_HASHING_ARGON2_PARALLELISM
+
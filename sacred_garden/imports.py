@@ -0,0 +1,287 @@
+"""
+Bulk import of histories in the format written by exports, to restore
+backups or to migrate couples from another tool.
+
+Rows are read one at a time, validated in batches and written with
+bulk_create in a transaction per batch. Emotional needs are matched by
+name to the user's needs through an in-memory map, and everything which
+is usually maintained by signals (current states, rollups, couple health
+summary, data versions) is recomputed once at the end.
+
+Importing the same file twice imports its states and letters twice.
+
+Only a full history import, by the import_history command, writes rows
+on behalf of the partner: received letters, and states addressed to the
+current partner. Users importing their own files through ImportView only
+get the letters they sent, unread, and states addressed to no partner.
+"""
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from rest_framework import exceptions
+
+from sacred_garden import models
+from sacred_garden import serializers
+
+
+BATCH_SIZE = 1000
+
+# Values kept as empty strings when reading CSV, other empty values are None
+CSV_TEXT_FIELDS = {'type', 'name', 'emotional_need_name', 'text', 'appreciation_text', 'advice_text'}
+
+MAX_REPORTED_ERRORS = 100
+
+
+def iter_ndjson_rows(lines):
+    """(line number, record or None if it can't be parsed) of NDJSON lines."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def iter_csv_rows(lines):
+    reader = csv.DictReader(lines)
+
+    for record in reader:
+        yield reader.line_num, {
+            key: value if value != '' or key in CSV_TEXT_FIELDS else None
+            for key, value in record.items()
+        }
+
+
+ROW_READERS = {
+    'ndjson': iter_ndjson_rows,
+    'csv': iter_csv_rows,
+}
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.imported = Counter()
+        self.skipped = 0
+        self.errors_count = 0
+        self.errors = []
+        self.seconds = 0
+
+    @property
+    def rows_count(self):
+        return sum(self.imported.values()) + self.skipped + self.errors_count
+
+    @property
+    def rows_per_second(self):
+        return self.rows_count / self.seconds if self.seconds else 0
+
+    def add_error(self, line_number, errors):
+        self.errors_count += 1
+
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'imported': dict(self.imported),
+            'skipped': self.skipped,
+            'errors_count': self.errors_count,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class HistoryImporter:
+
+    serializer_classes = {
+        'emotional_need': serializers.ImportEmotionalNeedSerializer,
+        'emotional_need_state': serializers.ImportEmotionalNeedStateSerializer,
+        'emotional_letter': serializers.ImportEmotionalLetterSerializer,
+    }
+
+    def __init__(self, user, source_user_id=None, batch_size=BATCH_SIZE, full_history=False):
+        self.user = user
+        self.source_user_id = source_user_id
+        self.batch_size = batch_size
+        self.full_history = full_history
+
+        # name -> (id, state_value_type) of the user's emotional needs
+        self.emotional_needs_by_name = {
+            name: (eneed_id, state_value_type)
+            for eneed_id, name, state_value_type in models.EmotionalNeed.objects.filter(
+                user=user,
+            ).values_list('id', 'name', 'state_value_type')
+        }
+        # id in the file -> name
+        self.emotional_need_names_by_source_id = {}
+        self.imported_emotional_need_ids = set()
+
+        self.result = ImportResult()
+
+    def run(self, rows):
+        start = time.perf_counter()
+
+        batch = []
+        for line_number, record in rows:
+            batch.append((line_number, record))
+
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+
+        if batch:
+            self.import_batch(batch)
+
+        with transaction.atomic():
+            self.finish()
+
+        self.result.seconds = time.perf_counter() - start
+
+        return self.result
+
+    def import_batch(self, batch):
+        valid_rows = self.validate_batch(batch)
+
+        with transaction.atomic():
+            self.import_emotional_needs(valid_rows['emotional_need'])
+            self.import_emotional_need_states(valid_rows['emotional_need_state'])
+            self.import_emotional_letters(valid_rows['emotional_letter'])
+
+    def validate_batch(self, batch):
+        """Valid rows of the batch by type, one serializer per type validates all of its rows."""
+        validators = {
+            record_type: serializer_class()
+            for record_type, serializer_class in self.serializer_classes.items()
+        }
+        valid_rows = defaultdict(list)
+
+        for line_number, record in batch:
+            if record is None:
+                self.result.add_error(line_number, ['Invalid row'])
+                continue
+
+            validator = validators.get(record.get('type'))
+            if validator is None:
+                self.result.add_error(line_number, {'type': ['Unknown type']})
+                continue
+
+            try:
+                valid_rows[record['type']].append((line_number, validator.run_validation(record)))
+            except exceptions.ValidationError as e:
+                self.result.add_error(line_number, e.detail)
+
+        return valid_rows
+
+    def import_emotional_needs(self, rows):
+        new_emotional_needs = {}
+
+        for _, data in rows:
+            if self.source_user_id is None:
+                self.source_user_id = data.get('user_id')
+
+            if data.get('id') is not None:
+                self.emotional_need_names_by_source_id[data['id']] = data['name']
+
+            if data['name'] in self.emotional_needs_by_name or data['name'] in new_emotional_needs:
+                self.result.skipped += 1
+                continue
+
+            new_emotional_needs[data['name']] = models.EmotionalNeed(
+                user=self.user, name=data['name'], state_value_type=data['state_value_type'])
+
+        models.EmotionalNeed.objects.bulk_create(new_emotional_needs.values())
+
+        for eneed in new_emotional_needs.values():
+            self.emotional_needs_by_name[eneed.name] = (eneed.id, eneed.state_value_type)
+
+        self.result.imported['emotional_need'] += len(new_emotional_needs)
+
+    def import_emotional_need_states(self, rows):
+        states = []
+
+        for line_number, data in rows:
+            name = data.get('emotional_need_name') or self.emotional_need_names_by_source_id.get(
+                data.get('emotional_need_id'))
+
+            if name not in self.emotional_needs_by_name:
+                self.result.add_error(line_number, {'emotional_need_id': ['Unknown emotional need']})
+                continue
+
+            eneed_id, state_value_type = self.emotional_needs_by_name[name]
+            self.imported_emotional_need_ids.add(eneed_id)
+
+            states.append(models.EmotionalNeedState(
+                emotional_need_id=eneed_id,
+                status=data['status'],
+                value_type=state_value_type,
+                value_abs=data.get('value_abs'),
+                value_rel=data.get('value_rel'),
+                partner_user_id=self.user.partner_user_id if self.full_history else None,
+                text=data['text'],
+                appreciation_text=data['appreciation_text'],
+                created_at=data['created_at'],
+            ))
+
+        models.EmotionalNeedState.objects.bulk_create(states)
+        self.result.imported['emotional_need_state'] += len(states)
+
+    def import_emotional_letters(self, rows):
+        letters = []
+
+        for line_number, data in rows:
+            # Letters are only exchanged between partners
+            if self.user.partner_user_id is None:
+                self.result.skipped += 1
+                continue
+
+            if data['sender_id'] == self.source_user_id:
+                sender_id, recipient_id = self.user.id, self.user.partner_user_id
+            elif data['recipient_id'] == self.source_user_id:
+                # Would be written as sent by the partner
+                if not self.full_history:
+                    self.result.skipped += 1
+                    continue
+                sender_id, recipient_id = self.user.partner_user_id, self.user.id
+            else:
+                self.result.add_error(line_number, {'sender_id': ['Unknown sender and recipient']})
+                continue
+
+            letters.append(models.EmotionalLetter(
+                sender_id=sender_id,
+                recipient_id=recipient_id,
+                text=data['text'],
+                appreciation_text=data['appreciation_text'],
+                advice_text=data['advice_text'],
+                created_at=data['created_at'],
+                # Flags set by the recipient
+                is_read=data['is_read'] if self.full_history else False,
+                is_acknowledged=data['is_acknowledged'] if self.full_history else False,
+            ))
+
+        models.EmotionalLetter.objects.bulk_create(letters)
+        self.result.imported['emotional_letter'] += len(letters)
+
+    def finish(self):
+        """Recompute what signals maintain for the rows created one by one."""
+        models.refresh_emotional_need_current_states(self.imported_emotional_need_ids)
+        models.rebuild_emotional_need_state_rollups(self.imported_emotional_need_ids)
+
+        models.refresh_couple_health_summary([self.user.id])
+        for summary in models.find_couple_health_summaries([self.user.id]):
+            models.refresh_couple_health_summary_history(summary)
+
+        models.bump_data_version([self.user.id, self.user.partner_user_id])
+
+
+def import_history(user, lines, import_format, source_user_id=None, batch_size=BATCH_SIZE, full_history=False):
+    rows = ROW_READERS[import_format](lines)
+    return HistoryImporter(
+        user, source_user_id=source_user_id, batch_size=batch_size, full_history=full_history).run(rows)
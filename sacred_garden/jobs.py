@@ -0,0 +1,218 @@
+"""
+Database backed queue of per-user operations too slow for a request.
+
+Views enqueue a models.Job in the request transaction and answer 202 with
+it, the run_jobs command runs the jobs in a pool of threads. Jobs are
+claimed with SELECT ... FOR UPDATE SKIP LOCKED, so that any number of
+workers in any number of processes never claim the same job, and run in
+a transaction of their own. The jobs of a user run one at a time, in the
+order they were enqueued.
+
+A job which raised is retried after settings.JOBS_RETRY_DELAY_SECONDS,
+doubled on every attempt, up to settings.JOBS_MAX_ATTEMPTS attempts. A
+running job's lease is renewed by a heartbeat thread, so that a job whose
+worker died is claimed again once its lease expired. Workers only record
+the outcome of a job while the lease is theirs: a job claimed again
+meanwhile is rolled back.
+"""
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from sacred_garden import models
+from sacred_garden import sample_data
+
+
+logger = logging.getLogger(__name__)
+
+
+def populate_sample_data(user):
+    # The user may have connected with a partner since the job was enqueued
+    if user.partner_user_id is not None:
+        return
+
+    sample_data.populate_sample_user_data(user)
+
+
+# Functions of the jobs by name, called with the user and the job's kwargs
+JOBS = {
+    'populate_sample_data': populate_sample_data,
+    'clean_sample_data': sample_data.clean_sample_user_data,
+}
+
+
+def enqueue(user, name, **kwargs):
+    """Job which runs JOBS[name] for the user once the current transaction commits."""
+    if name not in JOBS:
+        raise ValueError(f'Unknown job {name}')
+
+    return models.Job.objects.create(user=user, name=name, kwargs=kwargs)
+
+
+def claim_job(lease_seconds=None):
+    """Next job due, marked as running for the lease, or None."""
+    if lease_seconds is None:
+        lease_seconds = settings.JOBS_LEASE_SECONDS
+
+    now = timezone.now()
+    unfinished_statuses = [models.Job.StatusChoices.PENDING, models.Job.StatusChoices.RUNNING]
+
+    with transaction.atomic():
+        job = models.Job.objects.select_for_update(
+            skip_locked=True,
+        ).filter(
+            Q(status=models.Job.StatusChoices.PENDING, run_after__lte=now) |
+            Q(status=models.Job.StatusChoices.RUNNING, locked_until__lte=now)
+        ).exclude(
+            # The jobs of a user run one at a time, in order, even when an earlier one awaits a retry
+            Exists(models.Job.objects.filter(
+                user_id=OuterRef('user_id'), id__lt=OuterRef('id'), status__in=unfinished_statuses))
+        ).order_by(
+            'run_after', 'id'
+        ).first()
+
+        if job is None:
+            return None
+
+        job.status = models.Job.StatusChoices.RUNNING
+        job.attempts += 1
+        job.locked_until = now + timedelta(seconds=lease_seconds)
+        job.save(update_fields=['status', 'attempts', 'locked_until'])
+
+    return job
+
+
+class LeaseLost(Exception):
+    """The job was claimed again by another worker after its lease expired."""
+
+
+class LeaseHeartbeat(threading.Thread):
+    """Renews the lease of a running job every third of the lease until stopped."""
+
+    def __init__(self, job, lease_seconds):
+        super().__init__(name=f'job-{job.id}-heartbeat', daemon=True)
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.stop_event = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stop_event.wait(self.lease_seconds / 3):
+                if not renew_lease(self.job, self.lease_seconds):
+                    logger.warning('Job %s lost its lease while running', self.job.id)
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def renew_lease(job, lease_seconds):
+    """Extends the lease of a claimed job, False if it is no longer ours."""
+    locked_until = timezone.now() + timedelta(seconds=lease_seconds)
+
+    if not update_claimed_job(job, locked_until=locked_until):
+        return False
+
+    job.locked_until = locked_until
+    return True
+
+
+def run_job(job, lease_seconds=None):
+    """Runs a claimed job and records its outcome, True if it succeeded."""
+    if lease_seconds is None:
+        lease_seconds = settings.JOBS_LEASE_SECONDS
+
+    heartbeat = LeaseHeartbeat(job, lease_seconds)
+    heartbeat.start()
+
+    try:
+        if job.name not in JOBS:
+            raise ValueError(f'Unknown job {job.name}')
+
+        if job.attempts > settings.JOBS_MAX_ATTEMPTS:
+            raise RuntimeError('Lease expired on the last attempt')
+
+        with transaction.atomic():
+            # Until committed, e.g. against the user's requests connecting a partner
+            user = models.User.objects.select_for_update().get(id=job.user_id)
+            JOBS[job.name](user, **job.kwargs)
+
+            heartbeat.stop()
+            # Committed with the job's changes, rolled back with them if the lease was lost
+            finished = update_claimed_job(
+                job,
+                status=models.Job.StatusChoices.DONE,
+                locked_until=None,
+                error='',
+                finished_at=timezone.now(),
+            )
+            if not finished:
+                raise LeaseLost(f'Job {job.id} was claimed again')
+    except LeaseLost:
+        logger.warning('Job %s rolled back, claimed again by another worker', job.id)
+        return False
+    except Exception:
+        heartbeat.stop()
+        logger.exception('Job %s failed on attempt %s', job.id, job.attempts)
+        fail_job(job, traceback.format_exc())
+        return False
+
+    return True
+
+
+def fail_job(job, error):
+    if job.name in JOBS and job.attempts < settings.JOBS_MAX_ATTEMPTS:
+        update_claimed_job(
+            job,
+            status=models.Job.StatusChoices.PENDING,
+            run_after=timezone.now() + timedelta(
+                seconds=settings.JOBS_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1)),
+            locked_until=None,
+            error=error,
+        )
+    else:
+        update_claimed_job(
+            job,
+            status=models.Job.StatusChoices.FAILED,
+            locked_until=None,
+            error=error,
+            finished_at=timezone.now(),
+        )
+
+
+def update_claimed_job(job, **fields):
+    """Updates the job while its lease is ours, the number of updated jobs."""
+    # Unless another worker claimed the job again after the lease expired
+    return models.Job.objects.filter(
+        id=job.id,
+        status=models.Job.StatusChoices.RUNNING,
+        locked_until=job.locked_until,
+    ).update(**fields)
+
+
+def work(stop_event, poll_interval, burst=False):
+    """Worker thread of the run_jobs command, until stop_event is set or, in burst mode, no job is due."""
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+
+            job = claim_job()
+            if job is None:
+                if burst:
+                    return
+
+                stop_event.wait(poll_interval)
+                continue
+
+            run_job(job)
+    finally:
+        connection.close()
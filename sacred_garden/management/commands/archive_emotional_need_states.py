@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sacred_garden import archive
+from sacred_garden import models
+
+
+class Command(BaseCommand):
+    help = "Move emotional need states older than the archive horizon to compressed archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.EMOTIONAL_NEED_STATE_ARCHIVE_DAYS)
+
+    def handle(self, *args, **options):
+        before = archive.get_archive_cutoff(options['days'])
+
+        emotional_need_ids = models.EmotionalNeedState.objects.filter(
+            created_at__lt=before,
+        ).exclude(
+            emotional_need__user__is_sample=True,
+        ).values_list(
+            'emotional_need_id', flat=True
+        ).distinct()
+
+        start = time.perf_counter()
+        needs_count = states_count = 0
+
+        # One transaction per emotional need
+        for emotional_need_id in list(emotional_need_ids):
+            archived_count = archive.archive_emotional_need_states(emotional_need_id, before)
+            if archived_count:
+                needs_count += 1
+                states_count += archived_count
+
+        self.stdout.write(
+            f'Archived {states_count} states of {needs_count} emotional needs created before {before} '
+            f'in {time.perf_counter() - start:.2f} s')
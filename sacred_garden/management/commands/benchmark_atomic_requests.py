@@ -0,0 +1,93 @@
+import time
+from unittest import mock
+
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import models
+
+
+def make_every_view_atomic(handler, view):
+    """BaseHandler.make_view_atomic ignoring transaction.non_atomic_requests, as before the read-only views used it."""
+    return transaction.atomic(using=DEFAULT_DB_ALIAS)(view)
+
+
+class Command(BaseCommand):
+    help = ("Compare the read-only endpoints run outside of a transaction and in the ATOMIC_REQUESTS "
+            "transaction. The data is committed and deleted afterwards, so that requests BEGIN and COMMIT "
+            "real transactions rather than savepoints.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--states', type=int, default=20, help="States per emotional need")
+
+    def handle(self, *args, **options):
+        user, eneed = self.create_data(options['states'])
+
+        try:
+            self.run_benchmarks(user, eneed, options['requests'])
+        finally:
+            models.User.objects.filter(email__startswith='benchmark-atomic').delete()
+
+    def create_data(self, states_count):
+        user = models.User.objects.create_user('benchmark-atomic@example.com', 'benchmark-password')
+        partner = models.User.objects.create_user('benchmark-atomic-partner@example.com', 'benchmark-password')
+        models.connect_partners(user, partner)
+
+        for owner in [user, partner]:
+            eneed = models.EmotionalNeed.objects.create(user=owner, name='Hugs', state_value_type=0)
+            for i in range(states_count):
+                models.create_emotional_need_state(
+                    owner.partner_user, eneed, -10, None, 0, f'text {i}', f'appreciation {i}')
+
+        return models.User.objects.get(id=user.id), eneed
+
+    def run_benchmarks(self, user, eneed, n):
+        requests = [
+            ('me', 'get', reverse('user-me'), {}),
+            ('state_history', 'get', reverse('emotionalneed-state-history', args=[eneed.id]), {}),
+            ('appreciations', 'get', reverse('appreciations'), {}),
+            ('check-user', 'post', reverse('check-user'), {'data': {'email': user.email}}),
+        ]
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = Client(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(user))}')
+
+            self.stdout.write(f'{n} requests per endpoint on {connection.vendor}\n')
+
+            for name, method, url, kwargs in requests:
+                request = lambda: getattr(client, method)(url, **kwargs)
+
+                with mock.patch.object(BaseHandler, 'make_view_atomic', make_every_view_atomic):
+                    atomic = self.measure(request, n)
+                non_atomic = self.measure(request, n)
+
+                self.report(f'{name}, atomic', atomic)
+                self.report(f'{name}, non-atomic', non_atomic)
+                self.stdout.write(
+                    f'{"":<28} saved {(atomic[0] - non_atomic[0]) * 1000:8.3f} ms/request '
+                    f'{atomic[2] - non_atomic[2]:6.2f} transactions/request\n')
+
+    def measure(self, request, n):
+        # Warm up
+        request()
+
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch.object(connection, 'commit', wraps=connection.commit) as commit:
+            start = time.perf_counter()
+            for _ in range(n):
+                request()
+            elapsed = time.perf_counter() - start
+
+        return elapsed / n, len(queries) / n, commit.call_count / n
+
+    def report(self, name, result):
+        seconds, queries, transactions = result
+        self.stdout.write(
+            f'{name:<28} {seconds * 1000:8.3f} ms/request {queries:6.2f} queries/request '
+            f'{transactions:6.2f} transactions/request')
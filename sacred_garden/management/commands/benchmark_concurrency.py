@@ -0,0 +1,68 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import models
+
+
+class Command(BaseCommand):
+    help = """Load a running server with concurrent authenticated GET requests.
+
+Compare one sync worker against one ASGI worker, e.g.:
+
+    gunicorn sacred_garden_server.wsgi:application -w 1 --bind :8000
+    uvicorn sacred_garden_server.asgi:application --workers 1 --port 8001
+
+    manage.py benchmark_concurrency --email user@example.com \\
+        --url http://localhost:8000/api/sacred_garden/v1/users/me/
+    manage.py benchmark_concurrency --email user@example.com \\
+        --url http://localhost:8001/api/sacred_garden/v1/async/users/me/
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', required=True)
+        parser.add_argument('--email', required=True, help="User to issue a JWT for")
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user = models.User.objects.get(email=options['email'])
+        token = jwt_encode_handler(jwt_payload_handler(user))
+
+        request = urllib.request.Request(options['url'], headers={'Authorization': f'JWT {token}'})
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            start = time.perf_counter()
+            results = list(executor.map(lambda _: self.fetch(request), range(options['requests'])))
+            elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for status, latency in results if status == 200)
+        errors = len(results) - len(latencies)
+
+        self.stdout.write(f"{options['url']} with {options['concurrency']} concurrent clients")
+        self.stdout.write(f'{len(results) / elapsed:10.1f} requests/sec, {errors} errors')
+
+        if latencies:
+            self.stdout.write(
+                f'latency ms: median {statistics.median(latencies) * 1000:.1f}, '
+                f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}, '
+                f'max {latencies[-1] * 1000:.1f}')
+
+    def fetch(self, request):
+        start = time.perf_counter()
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = None
+
+        return status, time.perf_counter() - start
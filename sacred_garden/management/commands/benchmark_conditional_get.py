@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import models
+
+
+class Command(BaseCommand):
+    help = "Compare full and conditional (If-None-Match) GETs of the read endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--states', type=int, default=50, help="States per emotional need")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user, eneed = self.create_data(options['states'])
+            self.run_benchmarks(user, eneed, options['requests'])
+            transaction.set_rollback(True)
+
+    def create_data(self, states_count):
+        user = models.User.objects.create_user('benchmark@example.com', 'benchmark-password')
+        partner = models.User.objects.create_user('benchmark-partner@example.com', 'benchmark-password')
+        models.connect_partners(user, partner)
+
+        for owner in [user, partner]:
+            for name in ['Hugs', 'Talks', 'Walks']:
+                eneed = models.EmotionalNeed.objects.create(user=owner, name=name, state_value_type=0)
+                for i in range(states_count):
+                    models.create_emotional_need_state(
+                        owner.partner_user, eneed, -10, None, 0, f'text {i}', f'appreciation {i}')
+
+        for i in range(states_count):
+            models.EmotionalLetter.objects.create(
+                sender=partner, recipient=user, text=f'text {i}', appreciation_text=f'appreciation {i}')
+
+        return models.User.objects.get(id=user.id), eneed
+
+    def run_benchmarks(self, user, eneed, n):
+        urls = [
+            ('me', reverse('user-me')),
+            ('state_history', reverse('emotionalneed-state-history', args=[eneed.id])),
+            ('appreciations', reverse('appreciations')),
+        ]
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = Client(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(user))}')
+
+            self.stdout.write(f'{n} requests per endpoint\n')
+
+            for name, url in urls:
+                etag = client.get(url)['ETag']
+
+                full = self.measure(client, url, n)
+                conditional = self.measure(client, url, n, HTTP_IF_NONE_MATCH=etag)
+
+                self.report(f'{name}, full', full)
+                self.report(f'{name}, If-None-Match', conditional)
+                self.stdout.write(
+                    f'{"":<30} saved {(full[0] - conditional[0]) * 1000:8.3f} ms/request '
+                    f'{full[1] - conditional[1]:8.0f} bytes/request\n')
+
+    def measure(self, client, url, n, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(n):
+                response = client.get(url, **headers)
+            elapsed = time.perf_counter() - start
+
+        return elapsed / n, len(response.content), len(queries) / n, response.status_code
+
+    def report(self, name, result):
+        seconds, size, queries, status_code = result
+        self.stdout.write(
+            f'{name:<30} HTTP {status_code} {seconds * 1000:8.3f} ms/request '
+            f'{size:8d} bytes {queries:6.2f} queries/request')
@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.utils import ConnectionHandler
+
+
+MODES = {
+    # name: (ENGINE override, CONN_MAX_AGE)
+    'new connection per request': (None, 0),
+    'persistent connection': (None, 60),
+    'in-process pool': ('sacred_garden_server.postgresql_pool', 0),
+}
+
+
+class Command(BaseCommand):
+    help = ("Measure per-request connection overhead of the connection modes. "
+            "Run against a local Postgres, e.g. `docker-compose -f docker-compose.dev.yml up -d db`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        default = settings.DATABASES['default']
+        is_postgresql = 'postgresql' in default['ENGINE']
+
+        self.stdout.write(f"{n} requests, one query each, against {default['ENGINE']}")
+
+        results = {}
+        for name, (engine, conn_max_age) in MODES.items():
+            if engine and not is_postgresql:
+                self.stdout.write(f'{name:<28} skipped: PostgreSQL only')
+                continue
+
+            results[name] = self.measure(
+                {**default, 'ENGINE': engine or default['ENGINE'], 'CONN_MAX_AGE': conn_max_age}, n)
+            self.stdout.write(f'{name:<28} {results[name] * 1000:8.3f} ms/request')
+
+        baseline = results.pop('new connection per request')
+        for name, seconds in results.items():
+            self.stdout.write(f'Saved per request with {name}: {(baseline - seconds) * 1000:.3f} ms')
+
+    def measure(self, settings_dict, n):
+        handler = ConnectionHandler({'default': settings_dict})
+        connection = handler['default']
+
+        try:
+            start = time.perf_counter()
+
+            for _ in range(n):
+                # Same as the request_started / request_finished signal handlers
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.close_if_unusable_or_obsolete()
+
+            return (time.perf_counter() - start) / n
+        finally:
+            handler.close_all()
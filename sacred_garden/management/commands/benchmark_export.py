@@ -0,0 +1,64 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sacred_garden import exports
+from sacred_garden import models
+from sacred_garden import serializers
+
+
+class Command(BaseCommand):
+    help = "Compare peak memory of the streaming export and of serializing the whole history at once"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                user = self.create_data(size)
+
+                self.report(f'{size} states, streaming NDJSON', self.measure(lambda: self.consume(exports.iter_ndjson(user))))
+                self.report(f'{size} states, streaming CSV', self.measure(lambda: self.consume(exports.iter_csv(user))))
+                self.report(f'{size} states, serializers', self.measure(lambda: self.serialize(user)))
+
+                transaction.set_rollback(True)
+
+    def create_data(self, size):
+        user = models.User.objects.create_user('benchmark@example.com', 'benchmark-password')
+        eneed = models.EmotionalNeed.objects.create(user=user, name='Hugs', state_value_type=0)
+
+        models.EmotionalNeedState.objects.bulk_create([
+            models.EmotionalNeedState(
+                emotional_need=eneed, status=-10, value_type=0, value_rel=1,
+                text='text ' * 20, appreciation_text='appreciation ' * 10)
+            for _ in range(size)
+        ], batch_size=1000)
+
+        return user
+
+    def consume(self, chunks):
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+        return size
+
+    def serialize(self, user):
+        states = models.EmotionalNeedState.objects.filter(emotional_need__user=user)
+        return len(serializers.EmotionalNeedStateSerializer(many=True, instance=states).data)
+
+    def measure(self, func):
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return elapsed, peak
+
+    def report(self, name, result):
+        seconds, peak = result
+        self.stdout.write(f'{name:<36} {seconds * 1000:10.1f} ms {peak / 1024:10.0f} KiB peak')
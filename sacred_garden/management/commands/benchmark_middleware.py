@@ -0,0 +1,77 @@
+import time
+from base64 import b64encode
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import models
+from sacred_garden import views
+
+
+class Command(BaseCommand):
+    help = "Compare per-request overhead of the default and the API-only middleware/authentication stacks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        n = options['requests']
+
+        with transaction.atomic():
+            user = models.User.objects.create_user('benchmark@example.com', 'benchmark-password')
+            self.run_benchmarks(user, n)
+            transaction.set_rollback(True)
+
+    def run_benchmarks(self, user, n):
+        url = reverse('user-me')
+        jwt_header = f'JWT {jwt_encode_handler(jwt_payload_handler(user))}'
+        basic_header = 'Basic ' + b64encode(b'benchmark@example.com:benchmark-password').decode()
+
+        default_auth = [import_string(c) for c in settings.REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES']]
+        lean_auth = [import_string(c) for c in settings.API_ONLY_AUTHENTICATION_CLASSES]
+
+        self.stdout.write(f'{n} requests to {url}\n')
+
+        with mock.patch.object(views.UserViewSet, 'authentication_classes', default_auth):
+            full = self.measure(settings.MIDDLEWARE, url, jwt_header, n)
+            basic = self.measure(settings.MIDDLEWARE, url, basic_header, n // 10 or 1)
+
+        with mock.patch.object(views.UserViewSet, 'authentication_classes', lean_auth):
+            lean = self.measure(settings.API_ONLY_MIDDLEWARE, url, jwt_header, n)
+            lean_basic = self.measure(settings.API_ONLY_MIDDLEWARE, url, basic_header, n // 10 or 1)
+
+        self.report('default stack, JWT', full)
+        self.report('API-only stack, JWT', lean)
+        self.report('default stack, Basic', basic)
+        self.report('API-only stack, Basic (rejected)', lean_basic)
+
+        self.stdout.write(
+            f'\nSaved per JWT request: {(full[0] - lean[0]) * 1000:.3f} ms\n'
+            f'Saved per Basic request: {(basic[0] - lean_basic[0]) * 1000:.3f} ms\n')
+
+    def measure(self, middleware, url, auth_header, n):
+        with override_settings(MIDDLEWARE=middleware, ALLOWED_HOSTS=['testserver']):
+            client = Client(HTTP_AUTHORIZATION=auth_header)
+
+            # Warm up middleware chain, caches and connection
+            status_code = client.get(url).status_code
+
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(n):
+                    client.get(url)
+                elapsed = time.perf_counter() - start
+
+        return elapsed / n, len(queries) / n, status_code
+
+    def report(self, name, result):
+        seconds, queries, status_code = result
+        self.stdout.write(
+            f'{name:<36} HTTP {status_code} {seconds * 1000:8.3f} ms/request {queries:6.2f} queries/request')
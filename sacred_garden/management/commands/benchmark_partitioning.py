@@ -0,0 +1,150 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from sacred_garden import models
+from sacred_garden import partitioning
+
+
+PLAIN_TABLE = 'benchmark_state_plain'
+PARTITIONED_TABLE = 'benchmark_state_partitioned'
+
+LOAD_CHUNK_SIZE = 1000000
+
+
+class Command(BaseCommand):
+    help = ("Compare insert, state history read and VACUUM latency of a plain and of a monthly partitioned "
+            "copy of the emotional need states table, PostgreSQL only. "
+            "Run against a local Postgres, e.g. `docker-compose -f docker-compose.dev.yml up -d db`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000000)
+        parser.add_argument('--emotional-needs', type=int, default=20000)
+        parser.add_argument('--months', type=int, default=36)
+        parser.add_argument('--inserts', type=int, default=1000)
+        parser.add_argument('--reads', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is only supported on PostgreSQL')
+
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=30 * options['months'])
+
+        try:
+            for table, partitioned in [(PLAIN_TABLE, False), (PARTITIONED_TABLE, True)]:
+                self.create_table(table, partitioned)
+                self.load(table, options['rows'], options['emotional_needs'])
+
+            self.stdout.write(f"{options['rows']} states over {options['months']} months, "
+                              f"{options['emotional_needs']} emotional needs")
+
+            for name, measure in [
+                ('insert', lambda table: self.measure_inserts(table, options['inserts'], options['emotional_needs'])),
+                ('history, all', lambda table: self.measure_reads(table, options['reads'], options['emotional_needs'], None)),
+                ('history, last 30 days', lambda table: self.measure_reads(
+                    table, options['reads'], options['emotional_needs'], self.now - timedelta(days=30))),
+            ]:
+                for table in [PLAIN_TABLE, PARTITIONED_TABLE]:
+                    self.report(name, table, measure(table))
+
+            self.report('VACUUM', PLAIN_TABLE, [self.measure_vacuum(PLAIN_TABLE)])
+            self.report('VACUUM, current month', PARTITIONED_TABLE, [self.measure_vacuum(
+                partitioning.get_partition_name(PARTITIONED_TABLE, partitioning.get_month(self.now)))])
+        finally:
+            with connection.cursor() as cursor:
+                for table in [PLAIN_TABLE, PARTITIONED_TABLE]:
+                    cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def create_table(self, table, partitioned):
+        source_table = models.EmotionalNeedState._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+            if not partitioned:
+                cursor.execute(f'CREATE TABLE {table} (LIKE {source_table} INCLUDING DEFAULTS, PRIMARY KEY (id))')
+            else:
+                cursor.execute(
+                    f'CREATE TABLE {table} (LIKE {source_table} INCLUDING DEFAULTS, PRIMARY KEY (id, created_at)) '
+                    f'PARTITION BY RANGE (created_at)')
+                cursor.execute(f'CREATE TABLE {partitioning.get_default_partition_name(table)} PARTITION OF {table} DEFAULT')
+
+                for month in partitioning.iter_months(
+                        partitioning.get_month(self.start), partitioning.add_months(partitioning.get_month(self.now), 1)):
+                    start, end = partitioning.get_month_bounds(month)
+                    cursor.execute(
+                        f'CREATE TABLE {partitioning.get_partition_name(table, month)} PARTITION OF {table} '
+                        f'FOR VALUES FROM (%s) TO (%s)',
+                        [start, end])
+
+            # The emotional_need_id index Django creates for the foreign key
+            cursor.execute(f'CREATE INDEX {table}_emotional_need_id ON {table} (emotional_need_id)')
+
+    def load(self, table, rows, emotional_needs):
+        """Rows in creation order, spread evenly over the months, as the application appends them."""
+        span = (self.now - self.start).total_seconds()
+
+        with connection.cursor() as cursor:
+            for first in range(1, rows + 1, LOAD_CHUNK_SIZE):
+                last = min(first + LOAD_CHUNK_SIZE - 1, rows)
+                cursor.execute(
+                    f"INSERT INTO {table} (id, emotional_need_id, status, value_type, value_rel, "
+                    f"appreciation_text, text, created_at) "
+                    f"SELECT i, 1 + (i * 7919) %% %s, -10, 0, 1, '', 'benchmark state', "
+                    f"%s + (i * %s / %s) * interval '1 second' "
+                    f"FROM generate_series(%s, %s) AS i",
+                    [emotional_needs, self.start, span, rows, first, last])
+
+            cursor.execute(f'VACUUM ANALYZE {table}')
+
+    def measure_inserts(self, table, n, emotional_needs):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT max(id) FROM {table}')
+            next_id = cursor.fetchone()[0] + 1
+
+            timings = []
+            for i in range(n):
+                start = time.perf_counter()
+                cursor.execute(
+                    f"INSERT INTO {table} (id, emotional_need_id, status, value_type, value_rel, "
+                    f"appreciation_text, text, created_at) "
+                    f"VALUES (%s, %s, -10, 0, 1, '', 'benchmark state', now())",
+                    [next_id + i, random.randint(1, emotional_needs)])
+                timings.append(time.perf_counter() - start)
+
+        return timings
+
+    def measure_reads(self, table, n, emotional_needs, since):
+        query = f'SELECT * FROM {table} WHERE emotional_need_id = %s'
+        if since is not None:
+            query += ' AND created_at >= %s'
+        query += ' ORDER BY created_at'
+
+        with connection.cursor() as cursor:
+            timings = []
+            for _ in range(n):
+                params = [random.randint(1, emotional_needs)] + ([since] if since is not None else [])
+
+                start = time.perf_counter()
+                cursor.execute(query, params)
+                cursor.fetchall()
+                timings.append(time.perf_counter() - start)
+
+        return timings
+
+    def measure_vacuum(self, table):
+        with connection.cursor() as cursor:
+            start = time.perf_counter()
+            cursor.execute(f'VACUUM ANALYZE {table}')
+            return time.perf_counter() - start
+
+    def report(self, name, table, timings):
+        self.stdout.write(
+            f'{name:<24} {table:<30} median {statistics.median(timings) * 1000:9.3f} ms, '
+            f'max {max(timings) * 1000:9.3f} ms')
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = "Measure single-core logins/sec (password verifications) for each password hashing policy"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=3.0)
+
+    def handle(self, *args, **options):
+        for policy, hasher_path in settings.PASSWORD_HASHERS_BY_POLICY.items():
+            hasher = import_string(hasher_path)()
+
+            try:
+                encoded = make_password('benchmark-password', hasher=hasher)
+            except ValueError as e:
+                self.stdout.write(f'{policy:<8} skipped: {e}')
+                continue
+
+            logins, elapsed = self.measure(encoded, hasher, options['seconds'])
+
+            params = ', '.join(
+                f'{k}={v}' for k, v in hasher.safe_summary(encoded).items() if k not in ('salt', 'hash'))
+            marker = ' (current policy)' if policy == settings.PASSWORD_HASHING_POLICY else ''
+
+            self.stdout.write(
+                f'{policy:<8} {logins / elapsed:8.1f} logins/sec/core '
+                f'{elapsed / logins * 1000:8.1f} ms/login  {params}{marker}')
+
+    def measure(self, encoded, hasher, seconds):
+        logins = 0
+        start = time.perf_counter()
+
+        while time.perf_counter() - start < seconds:
+            check_password('benchmark-password', encoded, preferred=hasher)
+            logins += 1
+
+        return logins, time.perf_counter() - start
@@ -0,0 +1,75 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import models
+
+
+class Command(BaseCommand):
+    help = "Compare fetching the full state_history with the trends aggregates of a long history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--states-per-day', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user, eneed = self.create_data(options['days'], options['states_per_day'])
+            self.run_benchmarks(user, eneed, options['requests'])
+            transaction.set_rollback(True)
+
+    def create_data(self, days, states_per_day):
+        user = models.User.objects.create_user('benchmark@example.com', 'benchmark-password')
+        eneed = models.EmotionalNeed.objects.create(user=user, name='Hugs', state_value_type=0)
+
+        start = timezone.now() - timedelta(days=days)
+        for day in range(days):
+            for i in range(states_per_day):
+                state = models.create_emotional_need_state(
+                    user, eneed, [0, -10, -20][(day + i) % 3], None, [-1, 0, 1][day % 3], '', '')
+                state.created_at = start + timedelta(days=day, minutes=i)
+                state.save()
+
+        return user, eneed
+
+    def run_benchmarks(self, user, eneed, n):
+        urls = [
+            ('state_history', reverse('emotionalneed-state-history', args=[eneed.id])),
+            ('trends?period=day', reverse('emotionalneed-trends', args=[eneed.id]) + '?period=day'),
+            ('trends?period=week', reverse('emotionalneed-trends', args=[eneed.id]) + '?period=week'),
+            ('trends?period=month', reverse('emotionalneed-trends', args=[eneed.id]) + '?period=month'),
+        ]
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = Client(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(user))}')
+
+            self.stdout.write(f'{eneed.emotionalneedstate_set.count()} states, {n} requests per endpoint\n')
+
+            for name, url in urls:
+                self.report(name, self.measure(client, url, n))
+
+    def measure(self, client, url, n):
+        # Warm up
+        client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(n):
+                response = client.get(url)
+            elapsed = time.perf_counter() - start
+
+        return elapsed / n, len(response.content), len(queries) / n, response.status_code
+
+    def report(self, name, result):
+        seconds, size, queries, status_code = result
+        self.stdout.write(
+            f'{name:<22} HTTP {status_code} {seconds * 1000:8.3f} ms/request '
+            f'{size:8d} bytes {queries:6.2f} queries/request')
@@ -0,0 +1,117 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import models
+
+
+class Command(BaseCommand):
+    help = ("Compare reading the emotional needs of a user and of their real or sample partner "
+            "with one query and the viewer index, and with a query per partner and the previous user index")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--needs', type=int, default=7)
+        parser.add_argument('--other-users', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        n = options['requests']
+
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+            viewers = self.create_data(options['needs'], options['other_users'])
+
+            self.stdout.write(
+                f"{models.EmotionalNeed.objects.count()} emotional needs, "
+                f"{options['other_users']} other users with the sample partner, {n} requests\n")
+
+            for schema in ['viewer index', 'previous user index']:
+                if schema == 'previous user index':
+                    self.use_previous_index()
+
+                for case, viewer in viewers.items():
+                    client = Client(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(viewer))}')
+
+                    self.report(case, schema, 'one query', self.measure(lambda: self.read_for_viewer(viewer), n))
+                    self.report(case, schema, 'query per partner', self.measure(lambda: self.read_per_partner(viewer), n))
+                    self.report(case, schema, 'GET me', self.measure(lambda: client.get(reverse('user-me')), n))
+
+            transaction.set_rollback(True)
+
+    def create_data(self, needs, other_users):
+        sample_user = models.User.objects.create(email='benchmark-sample@example.com', is_sample=True)
+        users = models.User.objects.bulk_create([
+            models.User(email=f'benchmark-{i}@example.com', partner_user=sample_user)
+            for i in range(other_users)
+        ])
+
+        real_viewer = models.User.objects.create(email='benchmark-viewer@example.com')
+        real_partner = models.User.objects.create(email='benchmark-partner@example.com')
+        models.connect_partners(real_viewer, real_partner)
+
+        sample_viewer = models.User.objects.create(email='benchmark-sample-viewer@example.com', partner_user=sample_user)
+
+        # The sample partner's needs, shared by the users
+        eneeds = [
+            models.EmotionalNeed(user=sample_user, name=f'Sample need {i}', state_value_type=0, is_sample=True)
+            for i in range(needs)
+        ]
+        for user in users + [real_viewer, real_partner, sample_viewer]:
+            eneeds += [models.EmotionalNeed(user=user, name=f'Need {i}', state_value_type=0) for i in range(needs)]
+        eneeds = models.EmotionalNeed.objects.bulk_create(eneeds, batch_size=1000)
+
+        models.EmotionalNeedState.objects.bulk_create([
+            models.EmotionalNeedState(emotional_need=eneed, status=-10, value_type=0, text='', appreciation_text='')
+            for eneed in eneeds
+        ], batch_size=1000)
+        models.refresh_emotional_need_current_states([eneed.id for eneed in eneeds])
+
+        return {
+            'real partner': models.get_user_with_unread_letters_count(real_viewer.id).get(),
+            'sample partner': models.get_user_with_unread_letters_count(sample_viewer.id).get(),
+        }
+
+    def use_previous_index(self):
+        table = models.EmotionalNeed._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX emotional_need_viewer_idx')
+            cursor.execute(f'CREATE INDEX benchmark_emotional_need_user_id ON {table} (user_id)')
+            cursor.execute(f'ANALYZE {table}')
+
+    def read_for_viewer(self, viewer):
+        return models.split_emotional_needs_for_viewer(viewer, models.get_emotional_needs_for_viewer(viewer))
+
+    def read_per_partner(self, viewer):
+        """As before get_emotional_needs_for_viewer: own needs, then the partner's."""
+        emotional_needs = list(models.EmotionalNeed.objects.select_related('current_state').filter(user=viewer))
+
+        partner_emotional_needs = models.EmotionalNeed.objects.select_related('current_state').filter(
+            user=viewer.partner_user)
+        if viewer.partner_user.is_sample:
+            partner_emotional_needs = partner_emotional_needs.filter(sample_user_partner=None)
+        else:
+            partner_emotional_needs = partner_emotional_needs.filter(is_sample=False)
+
+        return emotional_needs, list(partner_emotional_needs)
+
+    def measure(self, func, n):
+        # Warm up
+        func()
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(n):
+                func()
+            elapsed = time.perf_counter() - start
+
+        return elapsed / n, len(queries) / n
+
+    def report(self, case, schema, path, result):
+        seconds, queries = result
+        self.stdout.write(
+            f'{case:<15} {schema:<20} {path:<18} {seconds * 1000:8.3f} ms/request {queries:6.2f} queries/request')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sacred_garden import imports
+from sacred_garden import models
+
+
+class Command(BaseCommand):
+    help = "Import an NDJSON or CSV export into the history of a user and their partner"
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(imports.ROW_READERS),
+                            help="Defaults to the extension of the file")
+        parser.add_argument('--source-user-id', type=int,
+                            help="Id of the exported user, to tell sent and received letters apart")
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = models.User.objects.get(email=options['email'])
+        except models.User.DoesNotExist:
+            raise CommandError(f"User {options['email']} does not exist")
+
+        import_format = options['format'] or options['path'].rsplit('.', 1)[-1]
+        if import_format not in imports.ROW_READERS:
+            raise CommandError(f'Unknown format {import_format}, use --format')
+
+        with open(options['path'], newline='', encoding='utf-8') as lines:
+            result = imports.import_history(
+                user, lines, import_format,
+                source_user_id=options['source_user_id'],
+                batch_size=options['batch_size'],
+                full_history=True,
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+
+        imported = ', '.join(f'{count} {record_type}' for record_type, count in result.imported.items())
+        self.stdout.write(
+            f'Imported {imported or "nothing"}, skipped {result.skipped}, {result.errors_count} errors '
+            f'in {result.seconds:.2f} s ({result.rows_per_second:.0f} rows/s)')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from sacred_garden import partitioning
+
+
+class Command(BaseCommand):
+    help = ("Create the upcoming monthly partitions of the partitioned tables, and of the months of rows "
+            "in their DEFAULT partition, PostgreSQL only. "
+            "Run it daily, e.g. from cron. --convert partitions the tables which are not partitioned yet.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true')
+        parser.add_argument('--months-ahead', type=int, default=partitioning.MONTHS_AHEAD)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is only supported on PostgreSQL')
+
+        for model in partitioning.PARTITIONED_MODELS:
+            table = model._meta.db_table
+
+            with connection.cursor() as cursor:
+                is_partitioned = partitioning.is_partitioned(cursor, table)
+
+            if not is_partitioned:
+                if not options['convert']:
+                    self.stdout.write(f'{table} is not partitioned, skipped: run with --convert to partition it')
+                    continue
+
+                partitioning.convert_to_partitioned(table, options['months_ahead'])
+                self.stdout.write(f'{table} partitioned by month of {partitioning.PARTITION_KEY}')
+
+            created = partitioning.create_partitions(table, options['months_ahead'])
+            self.stdout.write(f'{table}: {len(created)} partitions created {" ".join(created)}'.rstrip())
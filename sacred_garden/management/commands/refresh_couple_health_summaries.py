@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from sacred_garden import models
+
+
+class Command(BaseCommand):
+    help = "Recount the 30 and 90 days ago statuses of couple health summaries, run it daily"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Also refresh summaries already refreshed today")
+
+    def handle(self, *args, **options):
+        summaries = models.CoupleHealthSummary.objects.all()
+
+        if not options['all']:
+            summaries = summaries.filter(Q(history_date=None) | Q(history_date__lt=timezone.localdate()))
+
+        count = 0
+        for summary in summaries.iterator():
+            models.refresh_couple_health_summary_history(summary)
+            count += 1
+
+        self.stdout.write(f'Refreshed {count} couple health summaries')
@@ -0,0 +1,34 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sacred_garden import jobs
+
+
+class Command(BaseCommand):
+    help = "Run enqueued jobs in a pool of worker threads, see sacred_garden.jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOBS_WORKERS)
+        parser.add_argument('--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL_SECONDS)
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is due")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        self.stdout.write(f"Running jobs with {options['workers']} workers")
+
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='job-worker') as executor:
+            futures = [
+                executor.submit(jobs.work, stop_event, options['poll_interval'], options['burst'])
+                for _ in range(options['workers'])
+            ]
+
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                # Running jobs finish, their workers exit before claiming the next one
+                stop_event.set()
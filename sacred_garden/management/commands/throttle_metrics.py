@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sacred_garden import throttling
+
+
+class Command(BaseCommand):
+    help = "Print the requests rejected by the throttles of the unauthenticated endpoints, per throttle scope"
+
+    def handle(self, *args, **options):
+        for scope, count in throttling.get_rejected_counts().items():
+            self.stdout.write(f'{scope:<32} {count:8} rejected')
@@ -0,0 +1,65 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:28
+
+from itertools import groupby
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    EmotionalNeedState = apps.get_model('sacred_garden', 'EmotionalNeedState')
+    EmotionalNeedStateRollup = apps.get_model('sacred_garden', 'EmotionalNeedStateRollup')
+
+    states = EmotionalNeedState.objects.order_by(
+        'emotional_need_id', 'created_at', 'id'
+    ).values_list(
+        'emotional_need_id', 'created_at', 'status', 'value_rel'
+    ).iterator()
+
+    rollups = []
+    for (emotional_need_id, day), day_states in groupby(
+            states, key=lambda state: (state[0], timezone.localdate(state[1]))):
+        day_states = list(day_states)
+        statuses = [status for _, _, status, _ in day_states]
+        value_rels = [value_rel or 0 for _, _, _, value_rel in day_states]
+
+        rollups.append(EmotionalNeedStateRollup(
+            emotional_need_id=emotional_need_id,
+            day=day,
+            count=len(statuses),
+            min_status=min(statuses),
+            max_status=max(statuses),
+            last_status=statuses[-1],
+            value_rel_sum=sum(value_rels),
+        ))
+
+    EmotionalNeedStateRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0005_user_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmotionalNeedStateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('min_status', models.IntegerField()),
+                ('max_status', models.IntegerField()),
+                ('last_status', models.IntegerField()),
+                ('value_rel_sum', models.IntegerField(default=0)),
+                ('emotional_need', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sacred_garden.emotionalneed')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='emotionalneedstaterollup',
+            constraint=models.UniqueConstraint(fields=('emotional_need', 'day'), name='unique_emotional_need_rollup_day'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
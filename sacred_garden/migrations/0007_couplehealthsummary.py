@@ -0,0 +1,80 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:31
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+import django.db.models.deletion
+import django.utils.timezone
+
+
+STATUS_FIELDS = {0: 'good_count', -10: 'bad_count', -20: 'problem_count'}
+
+
+def populate_summaries(apps, schema_editor):
+    User = apps.get_model('sacred_garden', 'User')
+    EmotionalNeed = apps.get_model('sacred_garden', 'EmotionalNeed')
+    EmotionalNeedState = apps.get_model('sacred_garden', 'EmotionalNeedState')
+    CoupleHealthSummary = apps.get_model('sacred_garden', 'CoupleHealthSummary')
+
+    def count_statuses(user_ids, at=None):
+        states = EmotionalNeedState.objects.filter(emotional_need=OuterRef('pk'))
+        if at is not None:
+            states = states.filter(created_at__lte=at)
+
+        return Counter(EmotionalNeed.objects.filter(
+            user_id__in=user_ids,
+        ).annotate(
+            status=Subquery(states.order_by('-created_at', '-id').values('status')[:1]),
+        ).exclude(
+            status=None,
+        ).values_list('status', flat=True))
+
+    now = django.utils.timezone.now()
+    couples = User.objects.filter(partner_user__isnull=False, id__lt=F('partner_user_id')).values_list('id', 'partner_user_id')
+
+    for user_id, partner_user_id in couples:
+        summary = CoupleHealthSummary(user_id=user_id, partner_user_id=partner_user_id, history_date=now.date())
+
+        for suffix, at in [('', None), ('_30_days_ago', now - timedelta(days=30)), ('_90_days_ago', now - timedelta(days=90))]:
+            counts = count_statuses([user_id, partner_user_id], at)
+            for status, field in STATUS_FIELDS.items():
+                setattr(summary, field + suffix, counts[status])
+
+        summary.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0006_emotionalneedstaterollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoupleHealthSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('good_count', models.PositiveIntegerField(default=0)),
+                ('bad_count', models.PositiveIntegerField(default=0)),
+                ('problem_count', models.PositiveIntegerField(default=0)),
+                ('good_count_30_days_ago', models.PositiveIntegerField(default=0)),
+                ('bad_count_30_days_ago', models.PositiveIntegerField(default=0)),
+                ('problem_count_30_days_ago', models.PositiveIntegerField(default=0)),
+                ('good_count_90_days_ago', models.PositiveIntegerField(default=0)),
+                ('bad_count_90_days_ago', models.PositiveIntegerField(default=0)),
+                ('problem_count_90_days_ago', models.PositiveIntegerField(default=0)),
+                ('history_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('partner_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='couplehealthsummary',
+            constraint=models.UniqueConstraint(fields=('user', 'partner_user'), name='unique_couple_health_summary'),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
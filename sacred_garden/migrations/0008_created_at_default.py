@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0007_couplehealthsummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emotionalletter',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='emotionalneedstate',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0008_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmotionalNeedStateArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_created_at', models.DateTimeField()),
+                ('last_created_at', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('emotional_need', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sacred_garden.emotionalneed')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='emotionalneedstatearchive',
+            index=models.Index(fields=['emotional_need', 'last_created_at'], name='sacred_gard_emotion_d22d8f_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:48
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def populate_current_states(apps, schema_editor):
+    EmotionalNeed = apps.get_model('sacred_garden', 'EmotionalNeed')
+    EmotionalNeedState = apps.get_model('sacred_garden', 'EmotionalNeedState')
+
+    current_states = EmotionalNeedState.objects.filter(
+        emotional_need=OuterRef('pk'),
+        is_current=True,
+    ).order_by(
+        '-created_at', '-id'
+    ).values('id')[:1]
+
+    EmotionalNeed.objects.update(current_state=Subquery(current_states))
+
+
+def populate_is_current(apps, schema_editor):
+    EmotionalNeed = apps.get_model('sacred_garden', 'EmotionalNeed')
+    EmotionalNeedState = apps.get_model('sacred_garden', 'EmotionalNeedState')
+
+    EmotionalNeedState.objects.update(is_current=False)
+    EmotionalNeedState.objects.filter(
+        id__in=EmotionalNeed.objects.values('current_state_id'),
+    ).update(
+        is_current=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0009_emotionalneedstatearchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emotionalneed',
+            name='current_state',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='sacred_garden.emotionalneedstate'),
+        ),
+        migrations.RunPython(populate_current_states, populate_is_current),
+        migrations.RemoveField(
+            model_name='emotionalneedstate',
+            name='is_current',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:51
+
+from django.db import migrations
+import django.db.models.deletion
+import sacred_garden.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0010_emotionalneed_current_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emotionalneed',
+            name='current_state',
+            field=sacred_garden.models.CurrentStateForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='sacred_garden.emotionalneedstate'),
+        ),
+    ]
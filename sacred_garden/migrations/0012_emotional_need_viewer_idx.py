@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-19 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0011_current_state_strict_loading'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emotionalneed',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='emotionalneed',
+            index=models.Index(fields=['user', 'sample_user_partner', 'is_sample'], name='emotional_need_viewer_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.1.7 on 2026-10-19 19:02
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def share_sample_emotional_needs(apps, schema_editor):
+    """
+    Keep one of the per-user clones of the sample user's emotional needs as
+    the shared one and delete the others, the users see it as of when their
+    clone was created.
+    """
+    User = apps.get_model('sacred_garden', 'User')
+    EmotionalNeed = apps.get_model('sacred_garden', 'EmotionalNeed')
+    EmotionalNeedState = apps.get_model('sacred_garden', 'EmotionalNeedState')
+
+    for sample_user in User.objects.filter(is_sample=True):
+        clones = EmotionalNeed.objects.filter(
+            user=sample_user,
+            sample_user_partner__isnull=False,
+        ).annotate(
+            # Sample states are created from 60 days before the sample data
+            sample_data_created_at=Min('emotionalneedstate__created_at'),
+        ).order_by('id')
+
+        shared = None
+        for eneed in clones:
+            if eneed.sample_data_created_at is not None:
+                User.objects.filter(id=eneed.sample_user_partner_id).update(
+                    sample_data_created_at=eneed.sample_data_created_at + timedelta(days=60))
+
+            if shared is None and eneed.sample_data_created_at is not None:
+                shared = eneed
+
+        if shared is None:
+            continue
+
+        EmotionalNeedState.objects.filter(emotional_need=shared).update(partner_user=None)
+        EmotionalNeed.objects.filter(id=shared.id).update(sample_user_partner=None)
+        EmotionalNeed.objects.filter(user=sample_user, sample_user_partner__isnull=False).delete()
+
+        sample_user.sample_data_created_at = shared.sample_data_created_at + timedelta(days=60)
+        sample_user.save(update_fields=['sample_data_created_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0012_emotional_need_viewer_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='sample_data_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(share_sample_emotional_needs, migrations.RunPython.noop),
+    ]
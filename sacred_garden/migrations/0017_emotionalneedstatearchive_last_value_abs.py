@@ -0,0 +1,47 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:31
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+
+RELATIVE = 0
+
+
+def populate_last_value_abs(apps, schema_editor):
+    """Cumulates value_abs through the archives of each emotional need, oldest first."""
+    EmotionalNeedStateArchive = apps.get_model('sacred_garden', 'EmotionalNeedStateArchive')
+
+    emotional_need_ids = EmotionalNeedStateArchive.objects.values_list('emotional_need_id', flat=True).distinct()
+
+    for emotional_need_id in list(emotional_need_ids):
+        archives = EmotionalNeedStateArchive.objects.filter(emotional_need_id=emotional_need_id)
+
+        has_previous = False
+        value_abs = None
+        for archive in archives.order_by('first_created_at').iterator(chunk_size=1):
+            for row in json.loads(zlib.decompress(archive.data)):
+                if row['value_type'] == RELATIVE:
+                    value_abs = (value_abs or 0) + row['value_rel'] if has_previous else row['value_rel']
+                else:
+                    value_abs = row['value_abs']
+                has_previous = True
+
+            EmotionalNeedStateArchive.objects.filter(id=archive.id).update(last_value_abs=value_abs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacred_garden', '0016_emotionalneed_current_state_not_editable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emotionalneedstatearchive',
+            name='last_value_abs',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_last_value_abs, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,26 @@
 import random
 import string
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+from itertools import chain, groupby
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import ExpressionWrapper, F, Func, OuterRef, Q, Subquery, Window
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.db.models.functions import Coalesce, FirstValue, Greatest, Least, Trunc, TruncDate
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from sacred_garden import events
+from sacred_garden import routers
 from sacred_garden import managers
 
 
-PREFETCHED_CURRENT_VALUES_ATTR_NAME = "current_emotionalneedstate_set"
-
-
 class User(AbstractUser):
     username = None
     email = models.EmailField(_("email address"), unique=True)
@@ -26,6 +34,12 @@ class User(AbstractUser):
 
     is_sample = models.BooleanField(default=False)
     has_sample_data = models.BooleanField(default=False)
+    # When the user's sample data was created, for the sample user when its
+    # shared emotional needs were, see get_sample_data_shift
+    sample_data_created_at = models.DateTimeField(blank=True, null=True)
+
+    # Bumped on every write visible to the user or their partner, see bump_data_version
+    data_version = models.PositiveBigIntegerField(default=0)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -35,16 +49,47 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # data_version is only changed by bump_data_version, never write back
+        # the value of a possibly stale instance (e.g. a cached request.user)
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'data_version'
+            ]
+
+        super().save(*args, **kwargs)
+
     def populate_partner_invite_code(self):
         self.partner_invite_code = get_new_invite_code()
 
 
+class LazyLoadingError(RuntimeError):
+    pass
+
+
+class CurrentStateDescriptor(ForwardManyToOneDescriptor):
+
+    def get_object(self, instance):
+        # Only called when current_state was neither loaded with select_related nor assigned
+        if settings.STRICT_CURRENT_STATE_LOADING:
+            raise LazyLoadingError(
+                f'Current state of emotional need {instance.pk} was not loaded, use select_related("current_state")')
+
+        return super().get_object(instance)
+
+
+class CurrentStateForeignKey(models.ForeignKey):
+    forward_related_accessor_class = CurrentStateDescriptor
+
+
 class EmotionalNeed(models.Model):
     class StateValueType(models.IntegerChoices):
         RELATIVE = 0
         ABSOLUTE = 1
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Indexed first by emotional_need_viewer_idx
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=128)
     state_value_type = models.IntegerField(choices=StateValueType.choices)
 
@@ -52,18 +97,34 @@ class EmotionalNeed(models.Model):
     sample_user_partner = models.ForeignKey(
         User, related_name='foo', blank=True, null=True, on_delete=models.CASCADE)
 
+    # The latest state, maintained by post_save_emotional_need_state. No
+    # database constraint: the states table may be partitioned, see
+    # partitioning, and states are only deleted with their need or by
+    # EmotionalNeedStateViewSet which moves the pointer. Not editable, a
+    # value set in a form would be overwritten by the next state anyway.
+    current_state = CurrentStateForeignKey(
+        'EmotionalNeedState', blank=True, null=True, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='+', editable=False)
+
+    class Meta:
+        indexes = [
+            # Every lookup of get_emotional_needs_for_viewer
+            models.Index(fields=['user', 'sample_user_partner', 'is_sample'], name='emotional_need_viewer_idx'),
+        ]
+
     def __str__(self):
         return f'{self.name} ({self.user})'
 
-    @property
-    def current_state(self):
-        if not hasattr(self, PREFETCHED_CURRENT_VALUES_ATTR_NAME):
-            return self.emotionalneedstate_set.get(is_current=True)
-
-        if self.current_emotionalneedstate_set:
-            return self.current_emotionalneedstate_set[0]
+    def save(self, *args, **kwargs):
+        # current_state is only changed by set_emotional_need_current_state and
+        # refresh_emotional_need_current_states, never write back a stale value
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'current_state'
+            ]
 
-        raise EmotionalNeedState.DoesNotExist
+        super().save(*args, **kwargs)
 
 
 class EmotionalNeedState(models.Model):
@@ -84,14 +145,119 @@ class EmotionalNeedState(models.Model):
     value_rel = models.IntegerField(choices=ValueRelativeChoices.choices, blank=True, null=True)
     partner_user = models.ForeignKey(User, blank=True, null=True, on_delete=models.CASCADE,
                                      related_name='partner_emotional_need_values_set')
-    is_current = models.BooleanField(default=True)
     appreciation_text = models.TextField()
     text = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so that imports can bulk_create with the original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f'{self.status}: {self.emotional_need.name} ({self.emotional_need.user})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # Remember the rollup the state was counted in, in case it is moved
+        if 'emotional_need_id' in instance.__dict__ and 'created_at' in instance.__dict__:
+            instance._rollup_key = instance.get_rollup_key()
+
+        return instance
+
+    def get_rollup_key(self):
+        return self.emotional_need_id, timezone.localdate(self.created_at)
+
+
+class EmotionalNeedStateArchive(models.Model):
+    """
+    Chunk of old states of an emotional need moved out of
+    EmotionalNeedState as zlib compressed JSON, see sacred_garden.archive.
+    """
+
+    emotional_need = models.ForeignKey(EmotionalNeed, on_delete=models.CASCADE)
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    # value_abs of the last state, cumulated over the whole history, which
+    # seeds state_history after the archive without decompressing it
+    last_value_abs = models.IntegerField(blank=True, null=True)
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['emotional_need', 'last_created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.emotional_need_id}: {self.first_created_at} - {self.last_created_at} ({self.count})'
+
+
+class EmotionalNeedStateRollup(models.Model):
+    """
+    Per-day aggregates of the states of an emotional need, so that trends
+    of long histories are computed without scanning every state.
+    """
+
+    emotional_need = models.ForeignKey(EmotionalNeed, on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    min_status = models.IntegerField()
+    max_status = models.IntegerField()
+    last_status = models.IntegerField()
+    value_rel_sum = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['emotional_need', 'day'], name='unique_emotional_need_rollup_day'),
+        ]
+
+    def __str__(self):
+        return f'{self.emotional_need_id} {self.day}: {self.count}'
+
+
+class CoupleHealthSummary(models.Model):
+    """
+    Number of emotional needs of a couple per status, currently and 30 and
+    90 days ago, see refresh_couple_health_summary.
+
+    `user` is the partner with the lower id.
+    """
+
+    HISTORY_DAYS = [30, 90]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    partner_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    good_count = models.PositiveIntegerField(default=0)
+    bad_count = models.PositiveIntegerField(default=0)
+    problem_count = models.PositiveIntegerField(default=0)
+
+    good_count_30_days_ago = models.PositiveIntegerField(default=0)
+    bad_count_30_days_ago = models.PositiveIntegerField(default=0)
+    problem_count_30_days_ago = models.PositiveIntegerField(default=0)
+
+    good_count_90_days_ago = models.PositiveIntegerField(default=0)
+    bad_count_90_days_ago = models.PositiveIntegerField(default=0)
+    problem_count_90_days_ago = models.PositiveIntegerField(default=0)
+
+    # Day the *_days_ago counts were computed on, see refresh_couple_health_summary_history
+    history_date = models.DateField(blank=True, null=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'partner_user'], name='unique_couple_health_summary'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} & {self.partner_user_id}'
+
+
+COUPLE_HEALTH_STATUS_FIELDS = {
+    EmotionalNeedState.StatusChoices.GOOD: 'good_count',
+    EmotionalNeedState.StatusChoices.BAD: 'bad_count',
+    EmotionalNeedState.StatusChoices.PROBLEM: 'problem_count',
+}
+
 
 def invite_user(user):
     user.invite_code = get_new_invite_code(k=50)
@@ -100,24 +266,26 @@ def invite_user(user):
 
 
 def create_emotional_need_state(user, eneed, status, value_abs, value_rel, text, appreciation_text):
-    EmotionalNeedState.objects.filter(
-        emotional_need=eneed,
-        is_current=True,
-    ).update(
-        is_current=False,
-    )
-
-    return EmotionalNeedState.objects.create(
+    state = EmotionalNeedState.objects.create(
         emotional_need=eneed,
         status=status,
         value_type=eneed.state_value_type,
         value_abs=value_abs,
         value_rel=value_rel,
-        partner_user=user.partner_user,
+        partner_user_id=user.partner_user_id,
         text=text,
         appreciation_text=appreciation_text,
     )
 
+    events.publish(
+        [eneed.user_id, user.partner_user_id],
+        'emotional_need_state_created',
+        emotional_need_id=eneed.id,
+        emotional_need_state_id=state.id,
+    )
+
+    return state
+
 
 class EmotionalLetter(models.Model):
 
@@ -126,11 +294,69 @@ class EmotionalLetter(models.Model):
     appreciation_text = models.TextField()
     text = models.TextField()
     advice_text = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so that imports can bulk_create with the original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     is_read = models.BooleanField(default=False)
     is_acknowledged = models.BooleanField(default=False)
 
 
+class Job(models.Model):
+    """Operation enqueued by a request and run by the run_jobs command, see sacred_garden.jobs."""
+
+    class StatusChoices(models.IntegerChoices):
+        PENDING = 0
+        RUNNING = 1
+        DONE = 2
+        FAILED = 3
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    name = models.CharField(max_length=64)
+    kwargs = models.JSONField(default=dict, blank=True)
+
+    status = models.IntegerField(choices=StatusChoices.choices, default=StatusChoices.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Pending jobs are not claimed before, running ones are claimed again after
+    # locked_until in case their worker died
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} of {self.user_id} ({self.get_status_display()})'
+
+
+class RequestProfile(models.Model):
+    """cProfile data and query timings of a request, see sacred_garden.profiling."""
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    method = models.CharField(max_length=16)
+    path = models.CharField(max_length=2048)
+    status_code = models.PositiveSmallIntegerField()
+    duration = models.FloatField()
+
+    query_count = models.PositiveIntegerField()
+    query_duration = models.FloatField()
+    # [{"sql", "duration", "caller"}] in execution order
+    queries = models.JSONField(default=list)
+    # Self time per module and the top functions, see profiling.summarize
+    summary = models.JSONField(default=dict)
+    # zlib compressed marshal of the pstats stats, the format of a .prof file
+    stats = models.BinaryField()
+
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration * 1000:.0f} ms)'
+
+
 def get_new_invite_code(k=6):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=k))
 
@@ -148,6 +374,247 @@ def pre_save_user(instance, **kwargs):
         initialize_user(instance)
 
 
+@receiver(post_save, sender=EmotionalLetter)
+def post_save_emotional_letter(instance, created, **kwargs):
+    bump_data_version([instance.sender_id, instance.recipient_id])
+
+    if created:
+        events.publish(
+            [instance.sender_id, instance.recipient_id],
+            'emotional_letter_created',
+            emotional_letter_id=instance.id,
+        )
+
+
+def bump_data_version(user_ids):
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+
+    if user_ids:
+        User.objects.filter(id__in=user_ids).update(data_version=models.F('data_version') + 1)
+        # The users read their own and their partner's writes, not the lagging replica
+        transaction.on_commit(partial(routers.mark_written, user_ids))
+
+
+def get_data_versions(user_id):
+    """(data_version, partner_user_id, partner's data_version) of the user in one query."""
+    return User.objects.filter(
+        id=user_id
+    ).values_list(
+        'data_version', 'partner_user_id', 'partner_user__data_version'
+    ).get()
+
+
+@receiver(post_save, sender=User)
+def post_save_user(instance, **kwargs):
+    bump_data_version([instance.id])
+
+
+@receiver(post_save, sender=EmotionalNeed)
+def post_save_emotional_need(instance, **kwargs):
+    bump_data_version([instance.user_id, instance.sample_user_partner_id])
+
+
+@receiver(post_save, sender=EmotionalNeedState)
+def post_save_emotional_need_state(instance, created, **kwargs):
+    # First, so that the couple health summary counts the new state
+    if created:
+        set_emotional_need_current_state(instance)
+
+    bump_emotional_need_state_data_version(instance)
+    update_emotional_need_state_rollups(instance, created)
+    refresh_couple_health_summary(get_emotional_need_state_owner_ids(instance))
+
+
+def set_emotional_need_current_state(state):
+    EmotionalNeed.objects.filter(
+        id=state.emotional_need_id,
+    ).update(
+        current_state=state,
+    )
+
+    if EmotionalNeedState.emotional_need.is_cached(state):
+        state.emotional_need.current_state = state
+
+
+def get_emotional_need_state_owner_ids(state):
+    """Id of the owner of the state's emotional need, as a list or a subquery."""
+    if EmotionalNeedState.emotional_need.is_cached(state):
+        return [state.emotional_need.user_id]
+
+    return EmotionalNeed.objects.filter(id=state.emotional_need_id).values_list('user_id', flat=True)
+
+
+def bump_emotional_need_state_data_version(state):
+    owner_ids = get_emotional_need_state_owner_ids(state)
+
+    User.objects.filter(
+        Q(id__in=owner_ids) | Q(id=state.partner_user_id)
+    ).update(
+        data_version=models.F('data_version') + 1
+    )
+    # Lazy, the owner may only be queried once committed and if replica reads are enabled
+    transaction.on_commit(partial(routers.mark_written, chain(owner_ids, [state.partner_user_id])))
+
+
+def update_emotional_need_state_rollups(state, created):
+    rollup_key = state.get_rollup_key()
+
+    if created:
+        add_to_emotional_need_state_rollup(state)
+    else:
+        # The state could have been moved to another day or emotional need
+        for emotional_need_id, day in {rollup_key, getattr(state, '_rollup_key', rollup_key)}:
+            refresh_emotional_need_state_rollup(emotional_need_id, day)
+
+    state._rollup_key = rollup_key
+
+
+def add_to_emotional_need_state_rollup(state):
+    """Count a new state in the rollup of its day, new states are always the last ones of the day."""
+    emotional_need_id, day = state.get_rollup_key()
+
+    EmotionalNeedStateRollup.objects.bulk_create([
+        EmotionalNeedStateRollup(
+            emotional_need_id=emotional_need_id,
+            day=day,
+            min_status=state.status,
+            max_status=state.status,
+            last_status=state.status,
+        )
+    ], ignore_conflicts=True)
+
+    EmotionalNeedStateRollup.objects.filter(
+        emotional_need_id=emotional_need_id,
+        day=day,
+    ).update(
+        count=F('count') + 1,
+        min_status=Least('min_status', state.status),
+        max_status=Greatest('max_status', state.status),
+        last_status=state.status,
+        value_rel_sum=F('value_rel_sum') + (state.value_rel or 0),
+    )
+
+
+def refresh_emotional_need_state_rollup(emotional_need_id, day):
+    """Recompute the rollup of a day from its states, after states were changed or deleted."""
+    statuses = list(EmotionalNeedState.objects.filter(
+        emotional_need_id=emotional_need_id,
+        created_at__date=day,
+    ).order_by(
+        'created_at', 'id'
+    ).values_list(
+        'status', 'value_rel'
+    ))
+
+    rollups = EmotionalNeedStateRollup.objects.filter(emotional_need_id=emotional_need_id, day=day)
+
+    if not statuses:
+        rollups.delete()
+        return
+
+    values = get_rollup_values(statuses)
+
+    if not rollups.update(**values):
+        EmotionalNeedStateRollup.objects.bulk_create([
+            EmotionalNeedStateRollup(emotional_need_id=emotional_need_id, day=day, **values)
+        ], ignore_conflicts=True)
+
+
+def rebuild_emotional_need_state_rollups(emotional_need_ids):
+    """Recompute every rollup of the emotional needs, e.g. after states were bulk created."""
+    states = EmotionalNeedState.objects.filter(
+        emotional_need_id__in=emotional_need_ids,
+    ).order_by(
+        'emotional_need_id', 'created_at', 'id'
+    ).values_list(
+        'emotional_need_id', TruncDate('created_at'), 'status', 'value_rel'
+    ).iterator()
+
+    rollups = [
+        EmotionalNeedStateRollup(
+            emotional_need_id=emotional_need_id,
+            day=day,
+            **get_rollup_values([(status, value_rel) for _, _, status, value_rel in day_states]),
+        )
+        for (emotional_need_id, day), day_states in groupby(states, key=lambda state: state[:2])
+    ]
+
+    EmotionalNeedStateRollup.objects.filter(emotional_need_id__in=emotional_need_ids).delete()
+    EmotionalNeedStateRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+def refresh_emotional_need_current_states(emotional_need_ids):
+    """Point each emotional need to its last state, `emotional_need_ids` can be a queryset of ids."""
+    last_states = EmotionalNeedState.objects.filter(
+        emotional_need=OuterRef('pk'),
+    ).order_by(
+        '-created_at', '-id'
+    ).values('id')[:1]
+
+    EmotionalNeed.objects.filter(
+        id__in=emotional_need_ids,
+    ).update(
+        current_state=Subquery(last_states),
+    )
+
+
+def get_rollup_values(statuses):
+    """Rollup fields of (status, value_rel) pairs ordered by creation."""
+    return {
+        'count': len(statuses),
+        'min_status': min(status for status, _ in statuses),
+        'max_status': max(status for status, _ in statuses),
+        'last_status': statuses[-1][0],
+        'value_rel_sum': sum(value_rel or 0 for _, value_rel in statuses),
+    }
+
+
+def find_emotional_need_trends(eneed, period, shift=timedelta()):
+    """
+    Aggregates of the states of the emotional need per day, week or month.
+
+    Buckets are computed from the daily rollups with window functions:
+    every daily row gets the totals of its bucket and the running sum of
+    relative values, and the last day of each bucket represents it. Days
+    are shifted by whole days of shift first, see get_sample_data_shift.
+    """
+    day = F('day')
+    if shift:
+        day = ExpressionWrapper(day + shift, output_field=models.DateField())
+    bucket = Trunc(day, period, output_field=models.DateField())
+    bucket_window = {'partition_by': [bucket]}
+
+    rows = EmotionalNeedStateRollup.objects.filter(
+        emotional_need=eneed,
+    ).annotate(
+        bucket=bucket,
+        bucket_count=Window(models.Sum('count'), **bucket_window),
+        bucket_min_status=Window(models.Min('min_status'), **bucket_window),
+        bucket_max_status=Window(models.Max('max_status'), **bucket_window),
+        bucket_last_status=Window(FirstValue('last_status'), order_by=F('day').desc(), **bucket_window),
+        cumulative_value_rel=Window(models.Sum('value_rel_sum'), order_by=F('day').asc()),
+    ).order_by(
+        'day'
+    ).values(
+        'bucket', 'bucket_count', 'bucket_min_status', 'bucket_max_status',
+        'bucket_last_status', 'cumulative_value_rel',
+    )
+
+    # Django 4.1 can't filter on window functions, keep the last day of each bucket
+    trends = {}
+    for row in rows:
+        trends[row['bucket']] = {
+            'bucket': row['bucket'],
+            'count': row['bucket_count'],
+            'min_status': row['bucket_min_status'],
+            'max_status': row['bucket_max_status'],
+            'last_status': row['bucket_last_status'],
+            'cumulative_value_rel': row['cumulative_value_rel'],
+        }
+
+    return list(trends.values())
+
+
 def initialize_user(user):
     if user.partner_invite_code is None:
         user.populate_partner_invite_code()
@@ -157,22 +624,38 @@ def get_user_by_partner_invite_code(partner_invite_code):
     return User.objects.get(partner_invite_code=partner_invite_code)
 
 
+def lock_users(user_ids):
+    """
+    The users by id, re-read and locked until the end of the transaction,
+    in the order of their ids so that concurrent requests don't deadlock.
+    """
+    return {
+        user.id: user
+        for user in User.objects.select_for_update().filter(id__in=user_ids).order_by('id')
+    }
+
+
 def connect_partners(user1, user2):
+    # Only the partner fields, the rest of the rows may be stale
     user1.partner_user = user2
     user1.partner_invite_code = None
-    user1.save()
+    user1.save(update_fields=['partner_user', 'partner_invite_code'])
     set_current_user_emotional_need_values_to_partner(user1, user2)
 
     user2.partner_user = user1
     user2.partner_invite_code = None
-    user2.save()
+    user2.save(update_fields=['partner_user', 'partner_invite_code'])
     set_current_user_emotional_need_values_to_partner(user2, user1)
 
+    create_couple_health_summary(user1, user2)
+
+    events.publish([user1.id], 'partner_connected', partner_user_id=user2.id)
+    events.publish([user2.id], 'partner_connected', partner_user_id=user1.id)
+
 
 def set_current_user_emotional_need_values_to_partner(user, partner_user):
     EmotionalNeedState.objects.filter(
-        emotional_need__user=user,
-        is_current=True
+        id__in=EmotionalNeed.objects.filter(user=user).values('current_state_id'),
     ).update(
         partner_user=partner_user
     )
@@ -183,41 +666,182 @@ def disconnect_partner(user):
 
     user.partner_user = None
     user.populate_partner_invite_code()
-    user.save()
+    user.save(update_fields=['partner_user', 'partner_invite_code'])
 
     partner_user.partner_user = None
     partner_user.populate_partner_invite_code()
-    partner_user.save()
+    partner_user.save(update_fields=['partner_user', 'partner_invite_code'])
 
+    find_couple_health_summaries([user.id]).delete()
 
-def get_emotional_needs_with_prefetched_current_values(user, by_partner=None):
-    qs = EmotionalNeed.objects.prefetch_related(
-        models.Prefetch(
-            'emotionalneedstate_set',
-            queryset=EmotionalNeedState.objects.filter(is_current=True),
-            to_attr=PREFETCHED_CURRENT_VALUES_ATTR_NAME,
-        )
-    ).filter(user=user)
+    events.publish([user.id, partner_user.id], 'partner_disconnected')
+
+
+def find_couple_health_summaries(user_ids):
+    return CoupleHealthSummary.objects.filter(
+        Q(user_id__in=user_ids) | Q(partner_user_id__in=user_ids)
+    )
+
+
+def create_couple_health_summary(user1, user2):
+    user, partner_user = sorted([user1, user2], key=lambda u: u.id)
+
+    summary, _ = CoupleHealthSummary.objects.get_or_create(user=user, partner_user=partner_user)
+
+    refresh_couple_health_summary_history(summary)
+    refresh_couple_health_summary([user.id])
+
+
+def refresh_couple_health_summary(user_ids):
+    """
+    Recount current statuses of the needs of the couples of the users.
+
+    Single UPDATE with a counting subquery per status, `user_ids` can be
+    a queryset of ids.
+    """
+    def count_current_states(status):
+        states = EmotionalNeed.objects.filter(
+            Q(user_id=OuterRef('user_id')) | Q(user_id=OuterRef('partner_user_id')),
+            current_state__status=status,
+        ).order_by().annotate(
+            count=Func('id', function='COUNT'),
+        ).values('count')
+
+        return Coalesce(Subquery(states), 0)
+
+    find_couple_health_summaries(user_ids).update(
+        updated_at=timezone.now(),
+        **{field: count_current_states(status) for status, field in COUPLE_HEALTH_STATUS_FIELDS.items()},
+    )
+
+
+def refresh_couple_health_summary_history(summary):
+    """Recount statuses of the needs of the couple as they were 30 and 90 days ago."""
+    now = timezone.now()
+
+    for days in CoupleHealthSummary.HISTORY_DAYS:
+        counts = count_emotional_need_statuses_at([summary.user_id, summary.partner_user_id], now - timedelta(days=days))
+
+        for status, field in COUPLE_HEALTH_STATUS_FIELDS.items():
+            setattr(summary, f'{field}_{days}_days_ago', counts[status])
+
+    summary.history_date = timezone.localdate(now)
+    summary.save()
 
-    if user.is_sample:
-        assert by_partner is not None, "partner is required for sample user"
-        qs = qs.filter(sample_user_partner=by_partner)
+
+def count_emotional_need_statuses_at(user_ids, at):
+    last_states = EmotionalNeedState.objects.filter(
+        emotional_need=OuterRef('pk'),
+        created_at__lte=at,
+    ).order_by(
+        '-created_at', '-id'
+    ).values('status')[:1]
+
+    return Counter(EmotionalNeed.objects.filter(
+        user_id__in=user_ids,
+    ).annotate(
+        status=Subquery(last_states),
+    ).exclude(
+        status=None,
+    ).values_list(
+        'status', flat=True
+    ))
+
+
+def get_emotional_needs_for_viewer(user):
+    """
+    Emotional needs the user is shown, with their current states, in a
+    single query: their own and their partner's, which for the sample
+    partner are the ones created for the user. `user.partner_user` should
+    be loaded, see split_emotional_needs_for_viewer.
+    """
+    visible = Q(user=user)
+
+    partner_user = user.partner_user
+    if partner_user is not None and partner_user.is_sample:
+        visible |= Q(user=partner_user, sample_user_partner=None)
 
     # When reading partner's emotional needs, do not read their sample data (if any)
     # TODO: Remove when deleting sample data
-    elif by_partner:
-        qs = qs.filter(is_sample=False)
+    elif partner_user is not None:
+        visible |= Q(user=partner_user, is_sample=False)
 
-    return qs
+    return EmotionalNeed.objects.select_related('current_state').filter(visible).order_by('id')
+
+
+def split_emotional_needs_for_viewer(user, emotional_needs):
+    """(own emotional needs, partner's emotional needs or None without partner)"""
+    own_emotional_needs, partner_emotional_needs = [], []
+
+    for eneed in emotional_needs:
+        (own_emotional_needs if eneed.user_id == user.id else partner_emotional_needs).append(eneed)
+
+    if user.partner_user_id is None:
+        return own_emotional_needs, None
+
+    if user.partner_user.is_sample:
+        shift_created_at(
+            [eneed.current_state for eneed in partner_emotional_needs if eneed.current_state is not None],
+            get_sample_data_shift(user, user.partner_user))
+
+    return own_emotional_needs, partner_emotional_needs
+
+
+def get_sample_data_shift(user, sample_user):
+    """
+    How much later than they were created the shared emotional needs of
+    the sample user and their states are shown to the user: as if they had
+    been created with the user's sample data. Whole days, so that daily
+    rollups shift with the states.
+    """
+    if user.sample_data_created_at is None or sample_user.sample_data_created_at is None:
+        return timedelta()
+
+    return timedelta(days=(user.sample_data_created_at - sample_user.sample_data_created_at).days)
+
+
+def get_emotional_need_sample_data_shift(user, eneed):
+    """Shift of the states of the emotional need shown to the user, only queries for the partner's sample needs."""
+    if not eneed.is_sample or eneed.user_id != user.partner_user_id:
+        return timedelta()
+
+    sample_user = User.objects.filter(id=eneed.user_id, is_sample=True).first()
+    if sample_user is None:
+        return timedelta()
+
+    return get_sample_data_shift(user, sample_user)
+
+
+def shift_created_at(instances, shift):
+    instances = list(instances)
+
+    if shift:
+        for instance in instances:
+            instance.created_at += shift
+
+    return instances
 
 
-def find_emotional_need_statuses(eneed, user=None, partner_user=None):
+def get_visible_emotional_needs(user):
+    """Emotional needs the user is allowed to read: own, partner's and sample partner's."""
+    return EmotionalNeed.objects.filter(
+        Q(user=user) |
+        Q(user__partner_user=user) |
+        Q(user_id=user.partner_user_id, user__is_sample=True, sample_user_partner=None)
+    )
+
+
+def find_emotional_need_statuses(eneed, user=None, partner_user=None, since=None):
+    """States which were not archived, see archive.merge_archived_states for the older ones."""
     assert user or partner_user, "Either user or partner_user should ne specified"
 
     qs = EmotionalNeedState.objects.filter(
         emotional_need=eneed,
     )
 
+    if since is not None:
+        qs = qs.filter(created_at__gte=since)
+
     # TODO: This was removed. For now the decision is to return all states.
     # Maybe in the future there will be a better way to handle this.
     # We are still saving current partner for each state.
@@ -232,6 +856,79 @@ def find_emotional_need_statuses(eneed, user=None, partner_user=None):
     return qs
 
 
+def get_cumulated_value_abs(state, previous_state):
+    """value_abs of a relative state: the previous one's plus its value_rel."""
+    if not previous_state:
+        return state.value_rel
+
+    return (previous_state.value_abs or 0) + state.value_rel
+
+
+def cumulate_value_abs(states, previous_state=None):
+    """Sets value_abs of the relative states, cumulated after previous_state, returns the last state."""
+    for state in states:
+        if state.value_type == EmotionalNeed.StateValueType.RELATIVE:
+            state.value_abs = get_cumulated_value_abs(state, previous_state)
+        previous_state = state
+
+    return previous_state
+
+
+def find_emotional_letters(user):
+    return EmotionalLetter.objects.filter(
+        Q(sender=user) | Q(recipient=user)
+    ).order_by(
+        '-created_at'
+    )
+
+
+def find_received_appreciations(user):
+    """
+    Letters and emotional need states addressed to the user, as two
+    querysets. States of the sample partner's shared needs have no
+    partner_user, see shift_received_sample_states.
+    """
+    letters = EmotionalLetter.objects.filter(recipient=user)
+
+    # A subquery rather than a join, so that both sides of the OR use an index
+    sample_emotional_needs = EmotionalNeed.objects.filter(
+        user_id=user.partner_user_id,
+        user__is_sample=True,
+        sample_user_partner=None,
+    ).values('id')
+
+    eneed_states = EmotionalNeedState.objects.filter(
+        Q(partner_user=user) | Q(emotional_need__in=sample_emotional_needs)
+    ).exclude(
+        Q(appreciation_text__isnull=True) | Q(appreciation_text='')
+    )
+
+    return letters, eneed_states
+
+
+def shift_received_sample_states(user, eneed_states):
+    """States of find_received_appreciations, with the sample partner's ones shifted for the user."""
+    eneed_states = list(eneed_states)
+
+    sample_states = [state for state in eneed_states if state.partner_user_id is None]
+    if sample_states:
+        sample_user = User.objects.get(id=user.partner_user_id)
+        shift_created_at(sample_states, get_sample_data_shift(user, sample_user))
+
+    return eneed_states
+
+
+def get_user_with_unread_letters_count(user_id):
+    return User.objects.select_related(
+        'partner_user'
+    ).annotate(
+        unread_letters_count=models.Count(
+            'letters_received_set', filter=Q(letters_received_set__is_read=False))
+    ).filter(
+        id=user_id
+    )
+
+
 DEFAULT_EMOTIONAL_NEEDS = [
     'Sexual Intimacy',
     'Emotional Intimacy',
@@ -0,0 +1,187 @@
+"""
+Optional monthly range partitioning by created_at of the append-heavy
+tables, PostgreSQL only, see the partition_tables command.
+
+A partitioned table's primary key has to include the partition key, so
+the primary key becomes (id, created_at) in the database while Django
+keeps using `id` alone: ids are still unique as they come from a single
+sequence, and no foreign key constraint references these tables.
+
+Every partitioned table also gets a DEFAULT partition so that inserts
+never fail, e.g. imports of old histories. Rows of a month which lands
+in it are moved to the month's partition when the partition is created,
+by create_partitions for the upcoming months and for the past months of
+the rows found in the DEFAULT partition.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from sacred_garden import models
+
+
+PARTITIONED_MODELS = [models.EmotionalNeedState, models.EmotionalLetter]
+
+PARTITION_KEY = 'created_at'
+
+MONTHS_AHEAD = 3
+
+
+def get_month(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def iter_months(first_month, last_month):
+    month = first_month
+    while month <= last_month:
+        yield month
+        month = add_months(month, 1)
+
+
+def get_partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def get_default_partition_name(table):
+    return f'{table}_default'
+
+
+def get_month_bounds(month):
+    """Bounds of the month's partition, in UTC as created_at is a timestamptz."""
+    return f'{month.isoformat()} 00:00:00+00', f'{add_months(month, 1).isoformat()} 00:00:00+00'
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def get_partitions(cursor, table):
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s)",
+        [table])
+    return {name for name, in cursor.fetchall()}
+
+
+def create_partition(cursor, table, month):
+    """Create the month's partition, moving its rows out of the DEFAULT partition."""
+    name = get_partition_name(table, month)
+    start, end = get_month_bounds(month)
+    quoted_table, quoted_name = connection.ops.quote_name(table), connection.ops.quote_name(name)
+
+    cursor.execute(f'CREATE TABLE {quoted_name} (LIKE {quoted_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS ('
+        f'DELETE FROM {connection.ops.quote_name(get_default_partition_name(table))} '
+        f'WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *'
+        f') INSERT INTO {quoted_name} SELECT * FROM moved',
+        [start, end])
+    # Indexes, primary key and foreign keys of the parent are created on attach
+    cursor.execute(f'ALTER TABLE {quoted_table} ATTACH PARTITION {quoted_name} FOR VALUES FROM (%s) TO (%s)', [start, end])
+
+
+def get_default_partition_months(cursor, table):
+    """Months of the rows in the DEFAULT partition of the table."""
+    cursor.execute(
+        f"SELECT DISTINCT date_trunc('month', {PARTITION_KEY} AT TIME ZONE 'UTC')::date "
+        f"FROM {connection.ops.quote_name(get_default_partition_name(table))}")
+    return {month for month, in cursor.fetchall()}
+
+
+def create_partitions(table, months_ahead=MONTHS_AHEAD):
+    """
+    Create the missing partitions from the current month to `months_ahead`
+    months later, and of the past months of rows in the DEFAULT partition.
+    """
+    first_month = get_month(timezone.now())
+    created = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = get_partitions(cursor, table)
+
+        months = set(iter_months(first_month, add_months(first_month, months_ahead)))
+        months |= get_default_partition_months(cursor, table)
+
+        for month in sorted(months):
+            if get_partition_name(table, month) not in existing:
+                create_partition(cursor, table, month)
+                created.append(get_partition_name(table, month))
+
+    return created
+
+
+def convert_to_partitioned(table, months_ahead=MONTHS_AHEAD):
+    """
+    Replace the table by a partitioned copy with a partition per month of
+    its rows. The table is locked for the duration of the copy.
+    """
+    old_table = f'{table}_unpartitioned'
+    quote = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}')
+
+        # Non primary key indexes and foreign keys, recreated once the old table is dropped
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = to_regclass(%s) AND NOT indisprimary",
+            [old_table])
+        index_definitions = [definition.replace(old_table, table) for definition, in cursor.fetchall()]
+
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [old_table])
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(
+            "SELECT attidentity, pg_get_serial_sequence(%s, 'id') FROM pg_attribute "
+            "WHERE attrelid = to_regclass(%s) AND attname = 'id'",
+            [old_table, old_table])
+        identity, old_sequence = cursor.fetchone()
+
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(old_table)} INCLUDING DEFAULTS INCLUDING IDENTITY '
+            f'INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE ({PARTITION_KEY})')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY (id, {PARTITION_KEY})')
+        cursor.execute(f'CREATE TABLE {quote(get_default_partition_name(table))} PARTITION OF {quote(table)} DEFAULT')
+
+        cursor.execute(f'SELECT min({PARTITION_KEY}) FROM {quote(old_table)}')
+        oldest = cursor.fetchone()[0]
+        first_month = get_month(timezone.now()) if oldest is None else get_month(oldest.astimezone(datetime.timezone.utc))
+        last_month = add_months(get_month(timezone.now()), months_ahead)
+
+        for month in iter_months(first_month, last_month):
+            start, end = get_month_bounds(month)
+            cursor.execute(
+                f'CREATE TABLE {quote(get_partition_name(table, month))} PARTITION OF {quote(table)} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [start, end])
+
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}')
+
+        if identity:
+            # The new identity column has its own sequence
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) FROM {quote(table)}",
+                [table])
+        else:
+            # serial: keep the sequence of the old table, which would be dropped with it
+            cursor.execute(f'ALTER SEQUENCE {old_sequence} OWNED BY {quote(table)}.id')
+
+        cursor.execute(f'DROP TABLE {quote(old_table)}')
+
+        for definition in index_definitions:
+            cursor.execute(definition)
+
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+
+        cursor.execute(f'ANALYZE {quote(table)}')
@@ -0,0 +1,208 @@
+"""
+Opt-in profiling of requests with cProfile.
+
+ProfilingMiddleware is only installed when settings.PROFILING_ENABLED is
+set. It is sync only: under ASGI Django would run the whole middleware
+chain in a single thread, so enable it on the WSGI workers. It profiles
+the requests sent with the X-Profile header and a JWT of a staff user,
+the header of other clients is ignored before any profiling, and a
+settings.PROFILING_SAMPLE_RATE fraction of all requests.
+
+Each profile is stored as a RequestProfile with the timings of the
+queries on every database, the code of this package which ran them, and
+the self time spent per module (serializers.py, models.py,
+rest_framework, django.db, ...). Staff users get it from profiles/<id>/
+and the .prof file, for snakeviz, flameprof or pstats, from
+profiles/<id>/download/. The id is in the X-Profile-Id header of the
+profiled response.
+"""
+import cProfile
+import logging
+import marshal
+import pstats
+import random
+import sys
+import time
+import zlib
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import exceptions
+
+from sacred_garden import authentication
+from sacred_garden import models
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+PACKAGE_PREFIX = f'{PACKAGE_DIR}/'
+
+TOP_FUNCTIONS_COUNT = 30
+
+
+def get_module_name(filename):
+    """Module, or library, a profiled function or query caller belongs to."""
+    if filename == '~':
+        return 'builtins'
+
+    path = Path(filename)
+    if PACKAGE_DIR in path.parents:
+        return path.relative_to(PACKAGE_DIR.parent).as_posix()
+
+    parts = path.parts
+    for packages_dir in ['site-packages', 'dist-packages']:
+        if packages_dir in parts:
+            library = parts[parts.index(packages_dir) + 1:]
+            # The ORM apart from the rest of Django
+            if library[:2] == ('django', 'db'):
+                return 'django.db'
+            return library[0]
+
+    return 'python'
+
+
+def get_query_caller():
+    """Innermost frame of this package, but this module, running a query."""
+    # Without traceback.extract_stack, which reads the source lines
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PACKAGE_PREFIX) and filename != __file__:
+            return f'{get_module_name(filename)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+
+    return None
+
+
+class QueryRecorder:
+    """execute_wrapper of the connections timing the queries."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # Without the params, which are user data
+            self.queries.append({
+                'database': context['connection'].alias,
+                'sql': sql,
+                'duration': time.perf_counter() - start,
+                'caller': get_query_caller(),
+            })
+
+
+def summarize(stats):
+    """Self time per module and the functions of the highest cumulative time of pstats stats."""
+    self_times = {}
+    for (filename, _, _), (_, _, tottime, _, _) in stats.stats.items():
+        module_name = get_module_name(filename)
+        self_times[module_name] = self_times.get(module_name, 0) + tottime
+
+    functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+
+    return {
+        'self_time_by_module': dict(sorted(self_times.items(), key=lambda item: item[1], reverse=True)),
+        'top_functions': [
+            {
+                'function': f'{get_module_name(filename)}:{lineno}({name})',
+                'calls': calls,
+                'self_time': tottime,
+                'cumulative_time': cumtime,
+            }
+            for (filename, lineno, name), (_, calls, tottime, cumtime, _) in functions[:TOP_FUNCTIONS_COUNT]
+        ],
+    }
+
+
+def get_prof_file_content(profile):
+    """Content of the .prof file of a RequestProfile."""
+    return zlib.decompress(profile.stats)
+
+
+def get_staff_user(request):
+    """Staff user of the JWT of the request, None for other clients."""
+    for authentication_class in [
+        authentication.CachedJSONWebTokenAuthentication,
+        authentication.QueryParamJSONWebTokenAuthentication,
+    ]:
+        try:
+            user_auth = authentication_class().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return None
+
+        if user_auth is not None:
+            user, _ = user_auth
+            return user if user.is_staff else None
+
+    return None
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        staff_user = get_staff_user(request) if PROFILE_HEADER in request.META else None
+
+        if not sampled and staff_user is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        recorder = QueryRecorder()
+
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another thread is being profiled, on Python 3.12+
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        # Set by the view, DRF authenticates in it
+        user = staff_user or getattr(request, 'user', None)
+        profile = self.save_profile(request, response, user, duration, profiler, recorder)
+
+        if staff_user is not None:
+            response[PROFILE_ID_HEADER] = str(profile.id)
+
+        return response
+
+    def save_profile(self, request, response, user, duration, profiler, recorder):
+        stats = pstats.Stats(profiler)
+
+        profile = models.RequestProfile.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            method=request.method,
+            # Without the query string, which may carry a token
+            path=request.path[:2048],
+            status_code=response.status_code,
+            duration=duration,
+            query_count=len(recorder.queries),
+            query_duration=sum(query['duration'] for query in recorder.queries),
+            queries=recorder.queries,
+            summary=summarize(stats),
+            stats=zlib.compress(marshal.dumps(stats.stats)),
+        )
+
+        logger.info('Profiled %s %s in %.3f s as %s', request.method, request.path, duration, profile.id)
+
+        return profile
@@ -0,0 +1,75 @@
+"""
+Routing of reads to the read replica, configured with the SQL_REPLICA_*
+settings and enabled by settings.REPLICA_READS.
+
+Reads go to the default database unless they run in replica_reads(),
+which views.ReplicaReadsMixin enters for the safe requests of users who
+did not write recently: every write visible to a user bumps their
+data_version, see models.bump_data_version, which keeps them on the
+default database for settings.REPLICA_STICKY_SECONDS so that they read
+their own writes despite the replication lag.
+
+The sticky users are tracked in the default cache, configure a cache
+shared by the processes (e.g. Redis) when the API runs in several.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+_read_db_alias = contextvars.ContextVar('read_db_alias', default=None)
+
+
+def are_replica_reads_enabled():
+    return settings.REPLICA_READS and REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Routes the reads of the current thread or task to the replica."""
+    token = _read_db_alias.set(REPLICA_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_db_alias.reset(token)
+
+
+def get_sticky_cache_key(user_id):
+    return f'replica-sticky-{user_id}'
+
+
+def mark_written(user_ids):
+    """Keeps the reads of the users on the default database for settings.REPLICA_STICKY_SECONDS."""
+    if not are_replica_reads_enabled():
+        return
+
+    cache.set_many(
+        {get_sticky_cache_key(user_id): True for user_id in user_ids if user_id is not None},
+        timeout=settings.REPLICA_STICKY_SECONDS,
+    )
+
+
+def can_read_from_replica(user_id):
+    return are_replica_reads_enabled() and cache.get(get_sticky_cache_key(user_id)) is None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        # None falls back to the database of the instance hint or the default one
+        return _read_db_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data in both databases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DB_ALIAS
@@ -1,10 +1,18 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
 
 from sacred_garden import models
 
 
 def populate_sample_user_data(user):
-    sample_user = models.User.objects.get(is_sample=True)
+    """
+    The user's own sample emotional need and the letters are created for the
+    user, the sample partner's emotional needs are shared by all users and
+    only shown as of user.sample_data_created_at, see get_sample_data_shift.
+    """
+    sample_user = get_sample_user_with_shared_data()
 
     eneed_user = models.EmotionalNeed.objects.create(
         name="Physical Touch (Sample)",
@@ -13,25 +21,47 @@ def populate_sample_user_data(user):
         state_value_type=0,
     )
 
-    eneed_sample_user = models.EmotionalNeed.objects.create(
-        name="Acts of Service (Sample)",
-        user=sample_user,
-        is_sample=True,
-        sample_user_partner=user,
-        state_value_type=0,
-    )
-
     create_self_emotional_need_states(eneed_user, sample_user)
-    create_partner_emotional_need_states(eneed_sample_user, user)
 
     create_self_sample_emotional_letters(user, sample_user)
     create_partner_sample_emotional_letters(user, sample_user)
 
     user.has_sample_data = True
+    user.sample_data_created_at = timezone.now()
     user.partner_user = sample_user
     user.save()
 
 
+def get_sample_user_with_shared_data():
+    """
+    The sample user, with its shared emotional needs created on first use.
+
+    Only the first populate writes: it claims the creation by setting the
+    sample user's sample_data_created_at where still unset, which locks the
+    row until the needs are committed. Concurrent first populates wait for
+    it and find them created, later ones only read the sample user.
+    """
+    sample_user = models.User.objects.get(is_sample=True)
+    if sample_user.sample_data_created_at is not None:
+        return sample_user
+
+    with transaction.atomic():
+        claimed = models.User.objects.filter(id=sample_user.id, sample_data_created_at=None).update(
+            sample_data_created_at=timezone.now())
+
+        if claimed:
+            eneed_sample_user = models.EmotionalNeed.objects.create(
+                name="Acts of Service (Sample)",
+                user=sample_user,
+                is_sample=True,
+                state_value_type=0,
+            )
+            create_partner_emotional_need_states(eneed_sample_user)
+
+    sample_user.refresh_from_db(fields=['sample_data_created_at'])
+    return sample_user
+
+
 def clean_sample_user_data(user):
     sample_user = models.User.objects.get(is_sample=True)
 
@@ -44,6 +74,7 @@ def clean_sample_user_data(user):
         is_sample=True,
     ).delete()
 
+    # Clones of the sample partner's emotional needs created before they were shared
     models.EmotionalNeed.objects.filter(
         user=sample_user,
         sample_user_partner=user,
@@ -60,17 +91,11 @@ def clean_sample_user_data(user):
     ).delete()
 
     user.has_sample_data = False
+    user.sample_data_created_at = None
     user.save()
 
 
 def _create_eneed_state(eneed, partner, status, trend, text, text_appreciation, day):
-    models.EmotionalNeedState.objects.filter(
-        emotional_need=eneed,
-        is_current=True,
-    ).update(
-        is_current=False,
-    )
-
     state = models.EmotionalNeedState.objects.create(
         emotional_need=eneed,
         status=status,
@@ -82,7 +107,7 @@ def _create_eneed_state(eneed, partner, status, trend, text, text_appreciation,
         partner_user=partner,
     )
 
-    state.created_at = datetime.now() + timedelta(days=day-60)
+    state.created_at = timezone.now() + timedelta(days=day-60)
     state.save()
 
 
@@ -150,58 +175,58 @@ def create_self_emotional_need_states(eneed_user, sample_user):
         "Your willingness to take responsibility for your mistakes and work to grow from them is something that I respect so much about you.", 50)
 
 
-def create_partner_emotional_need_states(eneed_sample_user, user):
-    _create_eneed_state(eneed_sample_user, user, -20, 0, "", "", 0)
+def create_partner_emotional_need_states(eneed_sample_user):
+    _create_eneed_state(eneed_sample_user, None, -20, 0, "", "", 0)
     _create_eneed_state(
-        eneed_sample_user, user, -20, 0,
+        eneed_sample_user, None, -20, 0,
         "I would feel much more loved if you could help me with my chores",
         "I love you very much and willing to do everything I can to have you in my life", 1)
     _create_eneed_state(
-        eneed_sample_user, user, -20, 1,
+        eneed_sample_user, None, -20, 1,
         "",
         "I appreciate how you always make an effort to connect with my family and friends and build relationships with them.", 2)
     _create_eneed_state(
-        eneed_sample_user, user, -20, -1,
+        eneed_sample_user, None, -20, -1,
         "",
         "Your commitment to taking care of your health and well-being inspires me to do the same for myself.", 4)
     _create_eneed_state(
-        eneed_sample_user, user, -20, -1,
+        eneed_sample_user, None, -20, -1,
         "",
         "Your unwavering love and devotion to me make me feel so cherished and valued, and I am so grateful to have you in my life.", 5)
     _create_eneed_state(
-        eneed_sample_user, user, -20, 1,
+        eneed_sample_user, None, -20, 1,
         "",
         "I appreciate how you always show up for me, whether it's to support me through a tough time or to celebrate a happy moment.", 6)
     _create_eneed_state(
-        eneed_sample_user, user, -10, 1,
+        eneed_sample_user, None, -10, 1,
         "",
         "Thank you for being my partner in adventure and always being willing to try new things with me.", 8)
     _create_eneed_state(
-        eneed_sample_user, user, -10, 0,
+        eneed_sample_user, None, -10, 0,
         "",
         "I appreciate how you always go above and beyond to help me, like picking up groceries when I'm too busy to go myself.", 9)
     _create_eneed_state(
-        eneed_sample_user, user, -10, 1,
+        eneed_sample_user, None, -10, 1,
         "",
         "I am so lucky to have you as my partner, and I appreciate everything you do for me and our relationship.", 11)
     _create_eneed_state(
-        eneed_sample_user, user, -10, -1,
+        eneed_sample_user, None, -10, -1,
         "",
         "You have a talent for making me laugh even on my toughest days, and I appreciate your sense of humor so much.", 12)
     _create_eneed_state(
-        eneed_sample_user, user, 0, 1,
+        eneed_sample_user, None, 0, 1,
         "",
         "Thank you for planning such a thoughtful and romantic date for us last night. You always know how to make me feel special.", 15)
     _create_eneed_state(
-        eneed_sample_user, user, 0, 0,
+        eneed_sample_user, None, 0, 0,
         "",
         "Your dedication to your career is inspiring, and I am so proud of everything you have accomplished.", 16)
     _create_eneed_state(
-        eneed_sample_user, user, 0, 1,
+        eneed_sample_user, None, 0, 1,
         "",
         "Thank you for surprising me with breakfast in bed this morning. You always know how to make my day.", 18)
     _create_eneed_state(
-        eneed_sample_user, user, 0, 0,
+        eneed_sample_user, None, 0, 0,
         "",
         "I appreciate how you always take the time to listen to me and understand my feelings, even when I'm being irrational.", 20)
 
@@ -217,7 +242,7 @@ def create_self_sample_emotional_letters(user, sample_user):
         is_acknowledged=True,
     )
 
-    l.created_at = datetime.now() - timedelta(days=10)
+    l.created_at = timezone.now() - timedelta(days=10)
     l.save()
 
 
@@ -233,6 +258,6 @@ def create_partner_sample_emotional_letters(user, sample_user):
         is_acknowledged=False,
     )
 
-    l.created_at = datetime.now() - timedelta(days=20)
+    l.created_at = timezone.now() - timedelta(days=20)
     l.save()
 
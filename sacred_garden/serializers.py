@@ -1,6 +1,9 @@
+from itertools import chain
+
 from rest_framework import exceptions
 from rest_framework import serializers as drf_serializers
 
+from sacred_garden import exports
 from sacred_garden import models
 
 
@@ -8,7 +11,8 @@ class EmotionalNeedStateListSerializer(drf_serializers.ListSerializer):
 
     def to_representation(self, data):
         result = []
-        prev_el = None
+        # The state before the first one when the history starts after it, see archive.get_previous_state
+        prev_el = self.context.get('previous_state')
 
         for el in data:
             result.append(self.child.to_representation(el, prev_el, populate_value_abs=True))
@@ -44,12 +48,12 @@ class EmotionalNeedStateSerializer(drf_serializers.ModelSerializer):
             user = self.context['request'].user
             eneed = attrs['emotional_need_id']
 
-            if not eneed.user == user:
+            if eneed.user_id != user.id:
                 self.context['view'].permission_denied(self.context['request'])
 
         # for update
         else:
-            if self.instance.emotional_need.user != self.context['request'].user:
+            if self.instance.emotional_need.user_id != self.context['request'].user.id:
                 self.context['view'].permission_denied(self.context['request'])
 
         return attrs
@@ -75,7 +79,7 @@ class EmotionalNeedStateSerializer(drf_serializers.ModelSerializer):
 
     def to_representation(self, instance, prev=None, populate_value_abs=False):
         if instance.value_type == models.EmotionalNeed.StateValueType.RELATIVE and populate_value_abs:
-            instance.value_abs = get_abs_value(instance, prev)
+            instance.value_abs = models.get_cumulated_value_abs(instance, prev)
 
         return super().to_representation(instance)
 
@@ -88,15 +92,6 @@ class EmotionalNeedStateSerializer(drf_serializers.ModelSerializer):
             self.fields.pop('emotional_need_id')
 
 
-def get_abs_value(ens, ens_prev):
-    if not ens_prev:
-        return ens.value_rel
-
-    prev_value_abs = ens_prev.value_abs or 0
-
-    return prev_value_abs + ens.value_rel
-
-
 class EmotionalNeedSerializer(drf_serializers.ModelSerializer):
     """Used to read/update. To create CreateEmotionalNeedSerializer is used."""
 
@@ -126,6 +121,10 @@ class MeSerializer(drf_serializers.ModelSerializer):
                   'unread_letters_count', 'has_sample_data']
 
     def get_unread_letters_count(self, instance):
+        # Annotated by models.get_user_with_unread_letters_count
+        if hasattr(instance, 'unread_letters_count'):
+            return instance.unread_letters_count
+
         return models.EmotionalLetter.objects.filter(
             # sender=instance.partner_user,
             recipient=instance,
@@ -156,18 +155,26 @@ class ConnectPartnerSerializer(drf_serializers.Serializer):
         if self.instance.id == partner_user.id:
             raise drf_serializers.ValidationError('Can not invite self', code='invite_self')
 
-        if self.instance.partner_user:
+        # Checked and connected as in the database, the instance may come from the JWT user cache
+        users = models.lock_users([self.instance.id, partner_user.id])
+        user, partner_user = users[self.instance.id], users[partner_user.id]
+
+        if user.partner_user_id is not None:
             raise drf_serializers.ValidationError('User already has partner', code='has_partner')
 
-        if partner_user.partner_user:
+        if partner_user.partner_invite_code != attrs['invite_code']:
+            raise drf_serializers.ValidationError('Invalid invite code', code='invalid_invite_code')
+
+        if partner_user.partner_user_id is not None:
             raise drf_serializers.ValidationError('User already has partner', code='has_partner')
 
+        attrs['user'] = user
         attrs['partner_user'] = partner_user
 
         return attrs
 
     def update(self, instance, validated_data):
-        models.connect_partners(instance, validated_data['partner_user'])
+        models.connect_partners(validated_data['user'], validated_data['partner_user'])
         return instance
 
 
@@ -234,12 +241,33 @@ class EmotionalLetterSerializer(drf_serializers.ModelSerializer):
         return attrs
 
     def get_is_sent(self, instance):
-        return instance.sender == self.context['request'].user
+        return instance.sender_id == self.context['request'].user.id
 
     def get_is_received(self, instance):
         return not self.get_is_sent(instance)
 
 
+def serialize_me(user, emotional_needs, partner_emotional_needs=None):
+    data = MeSerializer(user).data
+    data['emotional_needs'] = EmotionalNeedSerializer(instance=emotional_needs, many=True).data
+
+    if partner_emotional_needs is not None:
+        data['partner_user']['emotional_needs'] = EmotionalNeedSerializer(
+            instance=partner_emotional_needs, many=True).data
+
+    return data
+
+
+def serialize_appreciations(letters, eneed_states):
+    instances = sorted(
+        chain(letters, eneed_states),
+        key=lambda x: x.created_at,
+        reverse=True,
+    )
+
+    return AppreciationSerializer(instance=instances, many=True).data
+
+
 class AppreciationSerializer(drf_serializers.Serializer):
 
     id = drf_serializers.IntegerField()
@@ -264,6 +292,118 @@ class AppreciationSerializer(drf_serializers.Serializer):
             }
 
 
+class StateHistoryQuerySerializer(drf_serializers.Serializer):
+    # Archived states are read when requested, by default the history starts after them
+    since = drf_serializers.DateTimeField(required=False)
+
+
+class EmotionalNeedTrendsQuerySerializer(drf_serializers.Serializer):
+    period = drf_serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+
+
+class EmotionalNeedTrendSerializer(drf_serializers.Serializer):
+    bucket = drf_serializers.DateField()
+    count = drf_serializers.IntegerField()
+    min_status = drf_serializers.IntegerField()
+    max_status = drf_serializers.IntegerField()
+    last_status = drf_serializers.IntegerField()
+    cumulative_value_rel = drf_serializers.IntegerField()
+
+
+class CoupleHealthSummarySerializer(drf_serializers.ModelSerializer):
+
+    current = drf_serializers.SerializerMethodField()
+    change_30_days = drf_serializers.SerializerMethodField()
+    change_90_days = drf_serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.CoupleHealthSummary
+        fields = ['current', 'change_30_days', 'change_90_days', 'history_date', 'updated_at']
+
+    def get_current(self, instance):
+        return {
+            status: getattr(instance, f'{status}_count')
+            for status in ['good', 'bad', 'problem']
+        }
+
+    def get_change_30_days(self, instance):
+        return self.get_change(instance, 30)
+
+    def get_change_90_days(self, instance):
+        return self.get_change(instance, 90)
+
+    def get_change(self, instance, days):
+        return {
+            status: getattr(instance, f'{status}_count') - getattr(instance, f'{status}_count_{days}_days_ago')
+            for status in ['good', 'bad', 'problem']
+        }
+
+
+class ExportQuerySerializer(drf_serializers.Serializer):
+    # Not `format`, DRF uses it to pick a renderer
+    export_format = drf_serializers.ChoiceField(choices=list(exports.EXPORT_FORMATS), default='ndjson')
+
+
+class ImportSerializer(drf_serializers.Serializer):
+    import_format = drf_serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    source_user_id = drf_serializers.IntegerField(required=False)
+    file = drf_serializers.FileField()
+
+
+class ImportEmotionalNeedSerializer(drf_serializers.Serializer):
+    id = drf_serializers.IntegerField(required=False, allow_null=True)
+    user_id = drf_serializers.IntegerField(required=False, allow_null=True)
+    name = drf_serializers.CharField(max_length=128)
+    state_value_type = drf_serializers.ChoiceField(choices=models.EmotionalNeed.StateValueType.choices)
+
+
+class ImportEmotionalNeedStateSerializer(drf_serializers.Serializer):
+    # Either the id of an emotional need of the same file or a name
+    emotional_need_id = drf_serializers.IntegerField(required=False, allow_null=True)
+    emotional_need_name = drf_serializers.CharField(required=False, max_length=128)
+    status = drf_serializers.ChoiceField(choices=models.EmotionalNeedState.StatusChoices.choices)
+    value_abs = drf_serializers.IntegerField(required=False, allow_null=True)
+    value_rel = drf_serializers.ChoiceField(
+        choices=models.EmotionalNeedState.ValueRelativeChoices.choices, required=False, allow_null=True)
+    text = drf_serializers.CharField(required=False, allow_blank=True, default='')
+    appreciation_text = drf_serializers.CharField(required=False, allow_blank=True, default='')
+    created_at = drf_serializers.DateTimeField()
+
+    def validate(self, attrs):
+        if attrs.get('emotional_need_id') is None and not attrs.get('emotional_need_name'):
+            raise exceptions.ValidationError(
+                'Either emotional_need_id or emotional_need_name is required', code='no_emotional_need')
+        return attrs
+
+
+class ImportEmotionalLetterSerializer(drf_serializers.Serializer):
+    sender_id = drf_serializers.IntegerField()
+    recipient_id = drf_serializers.IntegerField()
+    text = drf_serializers.CharField(required=False, allow_blank=True, default='')
+    appreciation_text = drf_serializers.CharField(required=False, allow_blank=True, default='')
+    advice_text = drf_serializers.CharField(required=False, allow_blank=True, default='')
+    created_at = drf_serializers.DateTimeField()
+    is_read = drf_serializers.BooleanField(required=False, default=False)
+    is_acknowledged = drf_serializers.BooleanField(required=False, default=False)
+
+
+class JobSerializer(drf_serializers.ModelSerializer):
+    class Meta:
+        model = models.Job
+        fields = ['id', 'name', 'status', 'attempts', 'created_at', 'finished_at']
+        read_only_fields = fields
+
+
+class RequestProfileSerializer(drf_serializers.ModelSerializer):
+    class Meta:
+        model = models.RequestProfile
+        fields = [
+            'id', 'user', 'method', 'path', 'status_code', 'duration',
+            'query_count', 'query_duration', 'queries', 'summary', 'created_at',
+        ]
+        read_only_fields = fields
+
+
 class ChangePasswordSerializer(drf_serializers.Serializer):
     password = drf_serializers.CharField(required=True)
 
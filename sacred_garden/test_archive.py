@@ -0,0 +1,164 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import archive
+from sacred_garden import exports
+from sacred_garden import models
+
+
+class TestArchiveEmotionalNeedStates(TestCase):
+
+    def setUp(self):
+        self.user = models.User.objects.create(email='user1@example.com')
+        self.eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+
+        self.states = [
+            self.create_state(-20, 1, days_ago=500),
+            self.create_state(-10, 1, days_ago=400),
+            self.create_state(-10, -1, days_ago=10),
+            self.create_state(0, 1, days_ago=1),
+        ]
+
+        # A token rather than force_authenticate, for the async view too
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(self.user))}')
+
+    def create_state(self, status, value_rel, days_ago):
+        state = models.create_emotional_need_state(self.user, self.eneed, status, None, value_rel, f'{days_ago}', '')
+        state.created_at = timezone.now() - timedelta(days=days_ago)
+        state.save()
+        return state
+
+    def get_state_history(self, urlname='emotionalneed-state-history', **params):
+        response = self.client.get(reverse(urlname, args=[self.eneed.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_old_states_are_archived(self):
+        archived_count = archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(365))
+
+        self.assertEqual(archived_count, 2)
+        self.assertEqual(
+            list(models.EmotionalNeedState.objects.order_by('created_at').values_list('id', flat=True)),
+            [self.states[2].id, self.states[3].id])
+
+        archive_row = models.EmotionalNeedStateArchive.objects.get()
+        self.assertEqual(archive_row.count, 2)
+        self.assertEqual(
+            [state.id for state in archive.iter_archived_states(archive_row)],
+            [self.states[0].id, self.states[1].id])
+
+    def test_current_state_day_is_not_archived(self):
+        archived_count = archive.archive_emotional_need_states(self.eneed.id, timezone.now())
+
+        self.assertEqual(archived_count, 3)
+        self.assertEqual(models.EmotionalNeedState.objects.get().id, self.states[3].id)
+
+    def test_state_history_merges_archives(self):
+        since = (timezone.now() - timedelta(days=1000)).isoformat()
+        history = self.get_state_history(since=since)
+
+        archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(365))
+
+        self.assertEqual(self.get_state_history(since=since), history)
+        self.assertEqual(self.get_state_history('async-emotionalneed-state-history', since=since), history)
+
+    def test_state_history_value_abs_cumulated_before_since(self):
+        self.assertEqual(
+            [state['value_abs'] for state in self.get_state_history(since=(timezone.now() - timedelta(days=1000)))],
+            [1, 2, 1, 2])
+
+        archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(450))
+        self.assertEqual(models.EmotionalNeedStateArchive.objects.get().last_value_abs, 1)
+
+        for days, expected in [(450, [2, 1, 2]), (300, [1, 2]), (5, [2])]:
+            since = (timezone.now() - timedelta(days=days)).isoformat()
+            for urlname in ['emotionalneed-state-history', 'async-emotionalneed-state-history']:
+                history = self.get_state_history(urlname, since=since)
+                self.assertEqual([state['value_abs'] for state in history], expected)
+
+    def test_default_state_history_skips_archives(self):
+        archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(365))
+
+        with mock.patch.object(archive, 'iter_archived_states') as iter_archived_states:
+            history = self.get_state_history()
+
+        iter_archived_states.assert_not_called()
+        self.assertEqual([state['id'] for state in history], [self.states[2].id, self.states[3].id])
+        self.assertEqual([state['value_abs'] for state in history], [1, 2])
+
+    def test_default_state_history_keeps_states_not_archived(self):
+        history = self.get_state_history()
+        self.assertEqual([state['id'] for state in history], [state.id for state in self.states])
+        self.assertEqual([state['value_abs'] for state in history], [1, 2, 1, 2])
+
+    def test_state_history_etag_changes_once_archived(self):
+        etag = self.client.get(reverse('emotionalneed-state-history', args=[self.eneed.id]))['ETag']
+
+        archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(365))
+
+        response = self.client.get(reverse('emotionalneed-state-history', args=[self.eneed.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+    def test_state_history_since(self):
+        archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(365))
+
+        # Within the archive
+        history = self.get_state_history(since=(timezone.now() - timedelta(days=450)).isoformat())
+        self.assertEqual([state['id'] for state in history], [state.id for state in self.states[1:]])
+        self.assertEqual([state['value_abs'] for state in history], [2, 1, 2])
+
+        history = self.get_state_history(since=(timezone.now() - timedelta(days=5)).isoformat())
+        self.assertEqual([state['id'] for state in history], [self.states[3].id])
+
+    def test_appreciations_are_not_archived(self):
+        partner = models.User.objects.create(email='user2@example.com')
+        models.connect_partners(self.user, partner)
+        appreciation = models.create_emotional_need_state(self.user, self.eneed, -10, None, -1, '', 'Thank you')
+        appreciation.created_at = timezone.now() - timedelta(days=450)
+        appreciation.save()
+        models.refresh_emotional_need_current_states([self.eneed.id])
+
+        since = (timezone.now() - timedelta(days=1000)).isoformat()
+        history = self.get_state_history(since=since)
+        self.assertEqual([state['value_abs'] for state in history], [1, 0, 1, 0, 1])
+
+        partner_client = APIClient()
+        partner_client.credentials(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(partner))}')
+        appreciations = json.loads(partner_client.get(reverse('appreciations')).content)
+        self.assertEqual([item['appreciation_text'] for item in appreciations], ['Thank you'])
+
+        self.assertEqual(archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(365)), 2)
+
+        self.assertEqual(
+            models.EmotionalNeedState.objects.filter(created_at__lt=timezone.now() - timedelta(days=365)).get(),
+            appreciation)
+        self.assertEqual(models.EmotionalNeedStateArchive.objects.get().last_value_abs, 1)
+        for urlname in ['appreciations', 'async-appreciations']:
+            response = partner_client.get(reverse(urlname))
+            self.assertEqual(json.loads(response.content), appreciations)
+
+        self.assertEqual(self.get_state_history(since=since), history)
+        for days, expected in [(475, [0, 1, 0, 1]), (420, [1, 0, 1])]:
+            since = (timezone.now() - timedelta(days=days)).isoformat()
+            self.assertEqual([state['value_abs'] for state in self.get_state_history(since=since)], expected)
+
+    def test_state_history_invalid_since(self):
+        response = self.client.get(reverse('emotionalneed-state-history', args=[self.eneed.id]), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_includes_archived_states(self):
+        archive.archive_emotional_need_states(self.eneed.id, archive.get_archive_cutoff(365))
+
+        records = [json.loads(line) for line in exports.iter_ndjson(self.user)]
+        self.assertEqual(
+            sorted(record['id'] for record in records if record['type'] == 'emotional_need_state'),
+            sorted(state.id for state in self.states))
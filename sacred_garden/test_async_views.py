@@ -0,0 +1,83 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import authentication
+from sacred_garden import models
+
+
+class TestAsyncViews(TestCase):
+    """Async endpoints must return exactly what their sync counterparts return."""
+
+    def setUp(self):
+        authentication.user_cache.clear()
+
+        self.user1 = models.User.objects.create(email='user1@example.com', first_name='John')
+        self.user2 = models.User.objects.create(email='user2@example.com', first_name='Eva')
+        self.other_user = models.User.objects.create(email='user3@example.com')
+        models.connect_partners(self.user1, self.user2)
+
+        self.eneed = models.EmotionalNeed.objects.create(user=self.user1, name='Hugs', state_value_type=0)
+        models.create_emotional_need_state(self.user1, self.eneed, -10, None, None, "", "")
+        models.create_emotional_need_state(self.user1, self.eneed, -20, None, 1, "Help", "Love you")
+
+        partner_eneed = models.EmotionalNeed.objects.create(user=self.user2, name='Gifts', state_value_type=0)
+        models.create_emotional_need_state(self.user2, partner_eneed, 0, None, -1, "", "Thanks")
+
+        models.EmotionalLetter.objects.create(
+            sender=self.user1, recipient=self.user2, text='text', appreciation_text='a1', advice_text='')
+        models.EmotionalLetter.objects.create(
+            sender=self.user2, recipient=self.user1, text='text', appreciation_text='a2', advice_text='')
+
+    def auth_header(self, user):
+        return f'JWT {jwt_encode_handler(jwt_payload_handler(user))}'
+
+    def get_sync(self, urlname, user, urlargs=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.auth_header(user))
+        response = client.get(reverse(urlname, args=urlargs))
+        return response.status_code, json.loads(response.content)
+
+    async def get_async(self, urlname, user, urlargs=None):
+        # AsyncClient turns extra kwargs into request headers
+        headers = {'authorization': self.auth_header(user)} if user else {}
+        response = await self.async_client.get(reverse(urlname, args=urlargs), **headers)
+        return response.status_code, json.loads(response.content)
+
+    async def assertSameAsSync(self, urlname, sync_urlname, user, urlargs=None):
+        expected = await sync_to_async(self.get_sync)(sync_urlname, user, urlargs)
+        actual = await self.get_async(urlname, user, urlargs)
+
+        self.assertEqual(actual[0], 200)
+        self.assertEqual(actual, expected)
+
+    async def test_me(self):
+        await self.assertSameAsSync('async-user-me', 'user-me', self.user1)
+        await self.assertSameAsSync('async-user-me', 'user-me', self.user2)
+
+    async def test_state_history(self):
+        await self.assertSameAsSync(
+            'async-emotionalneed-state-history', 'emotionalneed-state-history', self.user1, [self.eneed.id])
+        await self.assertSameAsSync(
+            'async-emotionalneed-state-history', 'emotionalneed-state-history', self.user2, [self.eneed.id])
+
+    async def test_state_history_other_user_not_found(self):
+        status_code, _ = await self.get_async(
+            'async-emotionalneed-state-history', self.other_user, [self.eneed.id])
+        self.assertEqual(status_code, 404)
+
+    async def test_appreciations(self):
+        await self.assertSameAsSync('async-appreciations', 'appreciations', self.user1)
+        await self.assertSameAsSync('async-appreciations', 'appreciations', self.user2)
+
+    async def test_emotional_letters(self):
+        await self.assertSameAsSync('async-emotionalletter-list', 'emotionalletter-list', self.user1)
+
+    async def test_unauthorized(self):
+        status_code, data = await self.get_async('async-user-me', None)
+        self.assertEqual(status_code, 401)
+        self.assertEqual(data, {'detail': 'Authentication credentials were not provided.'})
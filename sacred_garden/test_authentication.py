@@ -0,0 +1,119 @@
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import authentication
+from sacred_garden import models
+
+
+class TestCachedJSONWebTokenAuthentication(TestCase):
+
+    def setUp(self):
+        authentication.user_cache.clear()
+
+        self.user = models.User.objects.create(email='user@example.com', first_name='John')
+        self.auth_header = f'JWT {jwt_encode_handler(jwt_payload_handler(self.user))}'
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth_header)
+
+    def authenticate(self):
+        request = mock.Mock(META={'HTTP_AUTHORIZATION': self.auth_header})
+        return authentication.CachedJSONWebTokenAuthentication().authenticate(request)
+
+    def test_user_is_resolved_from_cache(self):
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertEqual(user.id, self.user.id)
+
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertEqual(user.id, self.user.id)
+
+    def test_cached_user_is_not_shared_between_requests(self):
+        user1, _ = self.authenticate()
+        user2, _ = self.authenticate()
+
+        user2.first_name = 'Jon'
+
+        self.assertIsNot(user1, user2)
+        self.assertEqual(self.authenticate()[0].first_name, 'John')
+
+    def test_cache_is_invalidated_on_save(self):
+        self.authenticate()
+
+        self.user.set_password('new_password')
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertTrue(user.check_password('new_password'))
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(reverse('user-me'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_cache_entry_expires(self):
+        with mock.patch('sacred_garden.authentication.time.monotonic', return_value=0):
+            self.authenticate()
+
+        ttl = authentication.user_cache.ttl
+        with mock.patch('sacred_garden.authentication.time.monotonic', return_value=ttl + 1):
+            with self.assertNumQueries(1):
+                self.authenticate()
+
+    def test_least_recently_used_user_is_evicted(self):
+        cache = authentication.UserCache(ttl=60, max_size=2)
+        users = [models.User.objects.create(email=f'user{i}@example.com') for i in range(3)]
+
+        cache.set(users[0].email, users[0])
+        cache.set(users[1].email, users[1])
+        self.assertIsNotNone(cache.get(users[0].email))
+
+        cache.set(users[2].email, users[2])
+
+        self.assertIsNotNone(cache.get(users[0].email))
+        self.assertIsNone(cache.get(users[1].email))
+        self.assertIsNotNone(cache.get(users[2].email))
+        self.assertNotIn(users[1].id, cache._usernames_by_id)
+
+    def test_expired_users_are_swept(self):
+        other_user = models.User.objects.create(email='other@example.com')
+
+        with mock.patch('sacred_garden.authentication.time.monotonic', return_value=1000):
+            cache = authentication.UserCache(ttl=60, max_size=100)
+            cache.set(self.user.email, self.user)
+
+        with mock.patch('sacred_garden.authentication.time.monotonic', return_value=1100):
+            cache.set(other_user.email, other_user)
+
+        self.assertEqual(list(cache._users), [other_user.email])
+        self.assertEqual(cache._usernames_by_id, {other_user.id: other_user.email})
+
+    def test_me_success(self):
+        response = self.client.get(reverse('user-me'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.user.id)
+
+
+class TestApiOnlyProfile(TestCase):
+
+    @override_settings(MIDDLEWARE=settings.API_ONLY_MIDDLEWARE)
+    def test_me_success_without_session_middleware(self):
+        user = models.User.objects.create(email='user@example.com')
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(user))}')
+
+        response = client.get(reverse('user-me'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], user.id)
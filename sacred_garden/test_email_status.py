@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from sacred_garden import email_status
+from sacred_garden import models
+from sacred_garden.test_views import ApiTestCase
+
+
+class TestEmailStatusCache(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = email_status.EmailStatusCache(ttl=60, max_size=2)
+
+    def test_least_recently_used_evicted(self):
+        self.cache.set('a@example.com', None)
+        self.cache.set('b@example.com', (True, False))
+        self.assertIsNone(self.cache.get('a@example.com'))
+
+        self.cache.set('c@example.com', (True, True))
+
+        self.assertIsNone(self.cache.get('a@example.com'))
+        self.assertIs(self.cache.get('b@example.com'), email_status.MISSING)
+        self.assertEqual(self.cache.get('c@example.com'), (True, True))
+
+    @mock.patch.object(email_status.time, 'monotonic')
+    def test_expired(self, monotonic):
+        monotonic.return_value = 100
+        self.cache.set('a@example.com', None)
+
+        monotonic.return_value = 159
+        self.assertIsNone(self.cache.get('a@example.com'))
+
+        monotonic.return_value = 160
+        self.assertIs(self.cache.get('a@example.com'), email_status.MISSING)
+
+
+class TestCheckUserCache(ApiTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            email_status, 'email_status_cache', email_status.EmailStatusCache(ttl=60, max_size=100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check_user(self):
+        response = self.request_post('check-user', data={'email': 'joe@example.com'})
+        self.assertSuccess(response)
+        return response.data['user_status']
+
+    def test_repeated_checks_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.check_user(), 'NON_EXISTING')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.check_user(), 'NON_EXISTING')
+
+    def test_invalidated_on_join_invite_and_activation(self):
+        self.assertEqual(self.check_user(), 'NON_EXISTING')
+
+        self.assertSuccess(self.request_post('join-wait-list', data={'email': 'joe@example.com'}))
+        self.assertEqual(self.check_user(), 'NOT_INVITED')
+
+        user = models.User.objects.get(email='joe@example.com')
+        models.invite_user(user)
+        self.assertEqual(self.check_user(), 'INVITED')
+
+        self.assertSuccess(self.request_post(
+            'registration', data={'email': 'joe@example.com', 'first_name': 'Joe', 'password': 'Pass-1234-word'}))
+        self.assertEqual(self.check_user(), 'ACTIVE')
+
+        user.delete()
+        self.assertEqual(self.check_user(), 'NON_EXISTING')
+
+    def test_invalidated_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            models.User.objects.create(email='joe@example.com')
+            # Cached by a concurrent request before the commit
+            email_status.email_status_cache.set('joe@example.com', None)
+
+        self.assertEqual(self.check_user(), 'NON_EXISTING')
+
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.check_user(), 'NOT_INVITED')
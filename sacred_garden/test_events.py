@@ -0,0 +1,181 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import events
+from sacred_garden import models
+
+
+class EventsTestCase(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('sacred_garden.events._broker', events.InProcessBroker())
+        self.broker = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = models.User.objects.create(email='user1@example.com')
+        self.partner = models.User.objects.create(email='user2@example.com')
+
+    def get_events(self, subscription):
+        result = []
+        while (event := subscription.get(timeout=0)) is not None:
+            result.append(event)
+        return result
+
+
+class TestInProcessBroker(EventsTestCase):
+
+    def test_publish_delivers_to_subscribed_users_only(self):
+        subscription1 = self.broker.subscribe(self.user.id)
+        subscription2 = self.broker.subscribe(self.partner.id)
+
+        self.broker.publish([self.user.id], {'type': 'test'})
+
+        self.assertEqual(self.get_events(subscription1), [{'type': 'test'}])
+        self.assertEqual(self.get_events(subscription2), [])
+
+    def test_closed_subscription_gets_no_events(self):
+        subscription = self.broker.subscribe(self.user.id)
+        subscription.close()
+
+        self.broker.publish([self.user.id], {'type': 'test'})
+
+        self.assertEqual(self.get_events(subscription), [])
+
+
+class StopListening(Exception):
+    pass
+
+
+class TestPostgresBroker(EventsTestCase):
+
+    def test_listener_reconnects_with_backoff(self):
+        broker = events.PostgresBroker()
+        # Without starting the listener thread
+        subscription = events.InProcessBroker.subscribe(broker, self.user.id)
+
+        dropped_connection = mock.MagicMock(notifies=[])
+        dropped_connection.poll.side_effect = OSError('Connection reset')
+        connection = mock.MagicMock(notifies=[])
+
+        def poll():
+            if connection.poll.call_count > 1:
+                raise OSError('Connection reset')
+            connection.notifies.append(mock.Mock(payload='{"user_ids": [%d], "event": {"type": "test"}}' % self.user.id))
+        connection.poll.side_effect = poll
+
+        with mock.patch.object(events, 'connection') as django_connection, \
+                mock.patch.object(events, 'logger') as logger, \
+                mock.patch.object(events.select, 'select', side_effect=lambda r, w, x, timeout: (r, [], [])), \
+                mock.patch.object(events.time, 'sleep', side_effect=[None, None, None, StopListening]) as sleep:
+            django_connection.Database.connect.side_effect = [
+                OSError('Connection refused'), OSError('Connection refused'), dropped_connection, connection]
+
+            with self.assertRaises(StopListening):
+                broker.listen()
+
+        self.assertEqual([c.args for c in sleep.call_args_list], [(1,), (2,), (1,), (1,)])
+        self.assertEqual(logger.exception.call_count, 4)
+        dropped_connection.cursor().__enter__().execute.assert_called_once_with('LISTEN sacred_garden_events')
+        dropped_connection.close.assert_called_once_with()
+        connection.close.assert_called_once_with()
+        self.assertEqual(self.get_events(subscription), [{'type': 'test'}])
+
+    def test_idle_connection_is_checked(self):
+        broker = events.PostgresBroker()
+        connection = mock.MagicMock(notifies=[])
+        cursor = connection.cursor().__enter__()
+        cursor.execute.side_effect = [None, OSError('Connection timed out')]
+
+        with mock.patch.object(events.select, 'select', return_value=([], [], [])):
+            with self.assertRaises(OSError):
+                broker.receive(connection)
+
+        cursor.execute.assert_called_with('SELECT 1')
+
+
+class TestPublishedEvents(EventsTestCase):
+
+    def test_events_are_published_on_commit(self):
+        subscription = self.broker.subscribe(self.user.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            events.publish([self.user.id], 'test')
+            self.assertEqual(self.get_events(subscription), [])
+
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.get_events(subscription), [{'type': 'test'}])
+
+    def test_create_emotional_need_state(self):
+        models.connect_partners(self.user, self.partner)
+        eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+        subscription = self.broker.subscribe(self.partner.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            state = models.create_emotional_need_state(self.user, eneed, -10, None, 1, "", "")
+
+        self.assertEqual(self.get_events(subscription), [{
+            'type': 'emotional_need_state_created',
+            'emotional_need_id': eneed.id,
+            'emotional_need_state_id': state.id,
+        }])
+
+    def test_create_emotional_letter(self):
+        subscription = self.broker.subscribe(self.partner.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            letter = models.EmotionalLetter.objects.create(sender=self.user, recipient=self.partner)
+
+        self.assertEqual(self.get_events(subscription), [{
+            'type': 'emotional_letter_created',
+            'emotional_letter_id': letter.id,
+        }])
+
+    def test_connect_and_disconnect_partners(self):
+        subscription1 = self.broker.subscribe(self.user.id)
+        subscription2 = self.broker.subscribe(self.partner.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.connect_partners(self.user, self.partner)
+
+        self.assertEqual(
+            self.get_events(subscription1), [{'type': 'partner_connected', 'partner_user_id': self.partner.id}])
+        self.assertEqual(
+            self.get_events(subscription2), [{'type': 'partner_connected', 'partner_user_id': self.user.id}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.disconnect_partner(self.user)
+
+        self.assertEqual(self.get_events(subscription1), [{'type': 'partner_disconnected'}])
+        self.assertEqual(self.get_events(subscription2), [{'type': 'partner_disconnected'}])
+
+
+@override_settings(EVENTS_HEARTBEAT_SECONDS=0.01)
+class TestEventsView(EventsTestCase):
+
+    def test_stream(self):
+        token = jwt_encode_handler(jwt_payload_handler(self.user))
+
+        response = APIClient().get(reverse('events'), {'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = iter(response.streaming_content)
+        self.assertEqual(next(content), b'retry: 10\n\n')
+        self.assertEqual(next(content), b': heartbeat\n\n')
+
+        self.broker.publish([self.user.id], {'type': 'partner_disconnected'})
+        self.assertEqual(
+            next(content), b'event: partner_disconnected\ndata: {"type": "partner_disconnected"}\n\n')
+
+        response.close()
+        self.assertEqual(self.broker._subscriptions, {})
+
+    def test_unauthorized(self):
+        response = APIClient().get(reverse('events'))
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from sacred_garden import models
+
+
+class TestExportView(TestCase):
+
+    def setUp(self):
+        self.user = models.User.objects.create(email='user1@example.com')
+        self.partner = models.User.objects.create(email='user2@example.com')
+        models.connect_partners(self.user, self.partner)
+
+        self.eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+        self.state = models.create_emotional_need_state(self.user, self.eneed, -10, None, 1, "Hug me", "Thanks")
+        self.letter = models.EmotionalLetter.objects.create(sender=self.partner, recipient=self.user, text='Hi')
+
+        partner_eneed = models.EmotionalNeed.objects.create(user=self.partner, name='Talks', state_value_type=0)
+        models.create_emotional_need_state(self.partner, partner_eneed, 0, None, 0, "", "")
+
+    def request_export(self, auth_user=None, **params):
+        client = APIClient()
+        if auth_user:
+            client.force_authenticate(user=auth_user)
+
+        return client.get(reverse('export'), params)
+
+    def read_content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        response = self.request_export(auth_user=self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        records = [json.loads(line) for line in self.read_content(response).splitlines()]
+
+        self.assertEqual(
+            [(record['type'], record['id']) for record in records],
+            [
+                ('emotional_need', self.eneed.id),
+                ('emotional_need_state', self.state.id),
+                ('emotional_letter', self.letter.id),
+            ])
+        self.assertEqual(records[1]['text'], 'Hug me')
+        self.assertEqual(records[1]['value_rel'], 1)
+        self.assertTrue(records[1]['is_current'])
+        self.assertEqual(records[2]['sender_id'], self.partner.id)
+
+    def test_export_csv(self):
+        response = self.request_export(auth_user=self.user, export_format='csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('sacred-garden-export.csv', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(self.read_content(response))))
+
+        self.assertEqual(
+            [(row['type'], row['id']) for row in rows],
+            [
+                ('emotional_need', str(self.eneed.id)),
+                ('emotional_need_state', str(self.state.id)),
+                ('emotional_letter', str(self.letter.id)),
+            ])
+        self.assertEqual(rows[0]['name'], 'Hugs')
+        self.assertEqual(rows[0]['status'], '')
+        self.assertEqual(rows[1]['status'], '-10')
+
+    def test_export_invalid_format(self):
+        response = self.request_export(auth_user=self.user, export_format='xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_unauthorized(self):
+        response = self.request_export()
+        self.assertEqual(response.status_code, 401)
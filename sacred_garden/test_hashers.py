@@ -0,0 +1,65 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from sacred_garden import hashers
+from sacred_garden import models
+
+
+PBKDF2_FIRST = [
+    'sacred_garden.hashers.TunedPBKDF2PasswordHasher',
+    'sacred_garden.hashers.TunedScryptPasswordHasher',
+]
+
+SCRYPT_FIRST = [
+    'sacred_garden.hashers.TunedScryptPasswordHasher',
+    'sacred_garden.hashers.TunedPBKDF2PasswordHasher',
+]
+
+
+class TestPasswordHashingPolicy(TestCase):
+
+    def login(self, email, password):
+        client = APIClient()
+        return client.post(
+            '/api/sacred_garden/v1/api-token-auth/',
+            data={'email': email, 'password': password},
+            format='json')
+
+    def get_password(self, user):
+        return models.User.objects.get(id=user.id).password
+
+    @override_settings(PASSWORD_HASHERS=PBKDF2_FIRST)
+    def test_password_is_upgraded_on_login_when_policy_changes(self):
+        user = models.User.objects.create_user('user@example.com', 'password')
+        self.assertTrue(self.get_password(user).startswith('pbkdf2_sha256$'))
+
+        with override_settings(PASSWORD_HASHERS=SCRYPT_FIRST):
+            response = self.login('user@example.com', 'password')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(self.get_password(user).startswith('scrypt$'))
+
+            # Upgraded hash keeps working
+            response = self.login('user@example.com', 'password')
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(PASSWORD_HASHERS=PBKDF2_FIRST)
+    def test_password_is_rehashed_on_login_when_cost_changes(self):
+        user = models.User.objects.create_user('user@example.com', 'password')
+
+        with mock.patch.object(hashers.TunedPBKDF2PasswordHasher, 'iterations', 1000):
+            response = self.login('user@example.com', 'password')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertTrue(self.get_password(user).startswith('pbkdf2_sha256$1000$'))
+
+    @override_settings(PASSWORD_HASHERS=SCRYPT_FIRST)
+    def test_wrong_password_does_not_rehash(self):
+        with override_settings(PASSWORD_HASHERS=PBKDF2_FIRST):
+            user = models.User.objects.create_user('user@example.com', 'password')
+        password = self.get_password(user)
+
+        response = self.login('user@example.com', 'wrong_password')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_password(user), password)
@@ -0,0 +1,147 @@
+import io
+import json
+from datetime import datetime, timezone
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from sacred_garden import exports
+from sacred_garden import imports
+from sacred_garden import models
+
+
+class TestImportHistory(TestCase):
+
+    def setUp(self):
+        self.source_user = models.User.objects.create(email='source@example.com')
+        self.source_partner = models.User.objects.create(email='source_partner@example.com')
+        models.connect_partners(self.source_user, self.source_partner)
+
+        eneed = models.EmotionalNeed.objects.create(user=self.source_user, name='Hugs', state_value_type=0)
+        for day, status in [(1, -20), (2, -10), (3, 0)]:
+            state = models.create_emotional_need_state(self.source_user, eneed, status, None, 1, f'text {day}', '')
+            state.created_at = datetime(2023, 1, day, tzinfo=timezone.utc)
+            state.save()
+
+        letter = models.EmotionalLetter.objects.create(sender=self.source_partner, recipient=self.source_user, text='Hi')
+        letter.created_at = datetime(2023, 1, 5, tzinfo=timezone.utc)
+        letter.save()
+
+        self.user = models.User.objects.create(email='user@example.com')
+        self.partner = models.User.objects.create(email='partner@example.com')
+        models.connect_partners(self.user, self.partner)
+
+        # Already existing need with the same name is reused
+        self.eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+
+    def export(self, iter_content):
+        return io.StringIO(''.join(iter_content(self.source_user)), newline='')
+
+    def assertImported(self, result):
+        self.assertEqual(dict(result.imported), {'emotional_need': 0, 'emotional_need_state': 3, 'emotional_letter': 1})
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual(result.errors, [])
+
+        states = models.EmotionalNeedState.objects.filter(emotional_need=self.eneed).order_by('created_at')
+        self.assertEqual(
+            [(state.status, state.created_at.day, state.partner_user_id) for state in states],
+            [(-20, 1, self.partner.id), (-10, 2, self.partner.id), (0, 3, self.partner.id)])
+        self.assertEqual(models.EmotionalNeed.objects.get(id=self.eneed.id).current_state_id, states.last().id)
+
+        letter = models.EmotionalLetter.objects.get(recipient=self.user)
+        self.assertEqual((letter.sender_id, letter.text, letter.created_at.day), (self.partner.id, 'Hi', 5))
+
+        self.assertEqual(models.EmotionalNeedStateRollup.objects.filter(emotional_need=self.eneed).count(), 3)
+        self.assertEqual(models.find_couple_health_summaries([self.user.id]).get().good_count, 1)
+
+    def test_import_ndjson(self):
+        result = imports.import_history(self.user, self.export(exports.iter_ndjson), 'ndjson', batch_size=2, full_history=True)
+        self.assertImported(result)
+
+    def test_import_csv(self):
+        result = imports.import_history(self.user, self.export(exports.iter_csv), 'csv', batch_size=2, full_history=True)
+        self.assertImported(result)
+
+    def test_own_rows_only_by_default(self):
+        sent = models.EmotionalLetter.objects.create(
+            sender=self.source_user, recipient=self.source_partner, text='Hello', is_read=True)
+        sent.created_at = datetime(2023, 1, 6, tzinfo=timezone.utc)
+        sent.save()
+
+        result = imports.import_history(self.user, self.export(exports.iter_ndjson), 'ndjson')
+
+        self.assertEqual(dict(result.imported), {'emotional_need': 0, 'emotional_need_state': 3, 'emotional_letter': 1})
+        # The existing need and the letter from the partner
+        self.assertEqual(result.skipped, 2)
+
+        self.assertEqual(
+            set(models.EmotionalNeedState.objects.filter(emotional_need=self.eneed).values_list(
+                'partner_user_id', flat=True)),
+            {None})
+        self.assertEqual(
+            list(models.EmotionalLetter.objects.values_list('sender_id', 'recipient_id', 'text', 'is_read').filter(
+                recipient=self.partner)),
+            [(self.user.id, self.partner.id, 'Hello', False)])
+        self.assertFalse(models.EmotionalLetter.objects.filter(recipient=self.user).exists())
+
+    def test_invalid_rows_are_reported(self):
+        lines = [
+            '{"type": "emotional_need", "name": "Talks", "state_value_type": 0}',
+            'not json',
+            '{"type": "unknown"}',
+            '{"type": "emotional_need_state", "emotional_need_name": "Talks", "status": 5, "created_at": "2023-01-01T00:00:00Z"}',
+            '{"type": "emotional_need_state", "emotional_need_name": "Walks", "status": 0, "created_at": "2023-01-01T00:00:00Z"}',
+            '{"type": "emotional_need_state", "emotional_need_name": "Talks", "status": 0, "created_at": "2023-01-01T00:00:00Z"}',
+        ]
+
+        result = imports.import_history(self.user, lines, 'ndjson')
+
+        self.assertEqual(dict(result.imported), {'emotional_need': 1, 'emotional_need_state': 1, 'emotional_letter': 0})
+        self.assertEqual([error['line'] for error in result.errors], [2, 3, 4, 5])
+        self.assertEqual(
+            models.EmotionalNeed.objects.select_related('current_state').get(user=self.user, name='Talks').current_state.status, 0)
+
+
+class TestImportView(TestCase):
+
+    def test_import_success(self):
+        user = models.User.objects.create(email='user@example.com')
+        content = json.dumps({'type': 'emotional_need', 'name': 'Hugs', 'state_value_type': 0}).encode()
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.post(
+            reverse('import'),
+            {'file': SimpleUploadedFile('export.ndjson', content), 'import_format': 'ndjson'},
+            format='multipart')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['imported'], {'emotional_need': 1, 'emotional_need_state': 0, 'emotional_letter': 0})
+        self.assertTrue(models.EmotionalNeed.objects.filter(user=user, name='Hugs').exists())
+
+    def test_letters_from_partner_not_imported(self):
+        user = models.User.objects.create(email='user@example.com')
+        partner = models.User.objects.create(email='partner@example.com')
+        models.connect_partners(user, partner)
+        content = json.dumps({
+            'type': 'emotional_letter', 'sender_id': 2, 'recipient_id': 1, 'text': 'Forged',
+            'appreciation_text': '', 'advice_text': '', 'created_at': '2023-01-01T00:00:00Z',
+            'is_read': True, 'is_acknowledged': True,
+        }).encode()
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.post(
+            reverse('import'),
+            {'file': SimpleUploadedFile('export.ndjson', content), 'import_format': 'ndjson', 'source_user_id': 1},
+            format='multipart')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['skipped'], 1)
+        self.assertFalse(models.EmotionalLetter.objects.exists())
+
+    def test_import_unauthorized(self):
+        response = APIClient().post(reverse('import'), {}, format='multipart')
+        self.assertEqual(response.status_code, 401)
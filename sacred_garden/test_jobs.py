@@ -0,0 +1,218 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from sacred_garden import jobs
+from sacred_garden import models
+from sacred_garden.test_views import ApiTestCase
+
+
+class JobsTestCase(ApiTestCase):
+
+    def setUp(self):
+        self.sample_user = models.User.objects.create(email='sample@example.com', is_active=False, is_sample=True)
+        self.user = models.User.objects.create(email='user1@example.com')
+        self.other_user = models.User.objects.create(email='user2@example.com')
+
+    def run_due_jobs(self):
+        while (job := jobs.claim_job()) is not None:
+            jobs.run_job(job)
+
+
+class TestSampleDataJobs(JobsTestCase):
+
+    def test_populate_sample_data_is_enqueued(self):
+        response = self.request_post('user-populate-sample-data', urlargs=[self.user.id], auth_user=self.user)
+        self.assertSuccess(response, expected_status_code=202)
+        self.assertEqual(response.data['status'], models.Job.StatusChoices.PENDING)
+        self.assertEqual(response['Location'], reverse('job-detail', args=[response.data['id']]))
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.has_sample_data)
+
+        self.run_due_jobs()
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.has_sample_data)
+        self.assertEqual(self.user.partner_user, self.sample_user)
+
+        response = self.request_get('job-detail', urlargs=[response.data['id']], auth_user=self.user)
+        self.assertSuccess(response)
+        self.assertEqual(response.data['status'], models.Job.StatusChoices.DONE)
+        self.assertEqual(response.data['attempts'], 1)
+        self.assertIsNotNone(response.data['finished_at'])
+
+    def test_populate_sample_data_skipped_when_connected_since(self):
+        job = jobs.enqueue(self.user, 'populate_sample_data')
+        models.connect_partners(self.user, self.other_user)
+
+        self.run_due_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.Job.StatusChoices.DONE)
+        self.assertFalse(models.EmotionalNeed.objects.filter(user=self.user).exists())
+
+    def test_clean_sample_data_is_enqueued(self):
+        jobs.enqueue(self.user, 'populate_sample_data')
+        self.run_due_jobs()
+
+        response = self.request_post('user-clean-sample-data', urlargs=[self.user.id], auth_user=self.user)
+        self.assertSuccess(response, expected_status_code=202)
+
+        self.run_due_jobs()
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.has_sample_data)
+        self.assertIsNone(self.user.partner_user)
+
+    def test_job_of_other_user_not_found(self):
+        job = jobs.enqueue(self.user, 'clean_sample_data')
+
+        self.assertNotFound(self.request_get('job-detail', urlargs=[job.id], auth_user=self.other_user))
+
+
+@override_settings(JOBS_MAX_ATTEMPTS=2, JOBS_RETRY_DELAY_SECONDS=10)
+class TestRetries(JobsTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.func = mock.Mock(side_effect=ValueError('Boom'))
+        for patcher in [mock.patch.dict(jobs.JOBS, {'test': self.func}), mock.patch.object(jobs, 'logger')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = jobs.enqueue(self.user, 'test', value=1)
+
+        self.run_due_jobs()
+
+        self.func.assert_called_once_with(self.user, value=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.Job.StatusChoices.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('Boom', job.error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+
+        # Not due yet
+        self.assertIsNone(jobs.claim_job())
+
+        models.Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        self.run_due_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.Job.StatusChoices.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(jobs.claim_job())
+
+    def test_job_with_expired_lease_is_claimed_again(self):
+        self.func.side_effect = None
+        job = jobs.enqueue(self.user, 'test')
+
+        claimed = jobs.claim_job(lease_seconds=60)
+        self.assertEqual(claimed.id, job.id)
+        self.assertIsNone(jobs.claim_job())
+
+        models.Job.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = jobs.claim_job()
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # The first worker finishing late does not overwrite the second claim
+        jobs.run_job(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.Job.StatusChoices.RUNNING)
+
+        jobs.run_job(reclaimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.Job.StatusChoices.DONE)
+
+    def test_jobs_of_a_user_run_one_at_a_time_in_order(self):
+        failing = jobs.enqueue(self.user, 'test', value=1)
+        later = jobs.enqueue(self.user, 'test', value=2)
+        other_user_job = jobs.enqueue(self.other_user, 'test', value=3)
+
+        claimed = jobs.claim_job()
+        self.assertEqual(claimed.id, failing.id)
+        # Not while the user's earlier job is running
+        self.assertEqual(jobs.claim_job().id, other_user_job.id)
+        self.assertIsNone(jobs.claim_job())
+
+        jobs.run_job(claimed)
+
+        # Nor while it waits to be retried
+        self.assertIsNone(jobs.claim_job())
+
+        self.func.side_effect = None
+        models.Job.objects.filter(id=failing.id).update(run_after=timezone.now())
+        self.run_due_jobs()
+
+        self.assertEqual([c.kwargs for c in self.func.call_args_list], [{'value': 1}, {'value': 1}, {'value': 2}])
+        self.assertEqual(models.Job.objects.get(id=later.id).status, models.Job.StatusChoices.DONE)
+
+    def test_lease_renewed_while_running(self):
+        renewed = threading.Event()
+        self.func.side_effect = lambda user: self.assertTrue(renewed.wait(timeout=5))
+        jobs.enqueue(self.user, 'test')
+        claimed = jobs.claim_job(lease_seconds=0.03)
+
+        with mock.patch.object(jobs, 'renew_lease', side_effect=lambda job, lease_seconds: renewed.set() or True):
+            self.assertTrue(jobs.run_job(claimed, lease_seconds=0.03))
+
+        self.assertEqual(models.Job.objects.get(id=claimed.id).status, models.Job.StatusChoices.DONE)
+
+    def test_renew_lease(self):
+        jobs.enqueue(self.user, 'test')
+        claimed = jobs.claim_job(lease_seconds=60)
+        locked_until = claimed.locked_until
+
+        self.assertTrue(jobs.renew_lease(claimed, 120))
+        self.assertGreater(claimed.locked_until, locked_until)
+        self.assertEqual(models.Job.objects.get(id=claimed.id).locked_until, claimed.locked_until)
+
+        models.Job.objects.filter(id=claimed.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        jobs.claim_job()
+        self.assertFalse(jobs.renew_lease(claimed, 120))
+
+    def test_job_claimed_again_while_running_is_rolled_back(self):
+        self.func.side_effect = lambda user: models.EmotionalNeed.objects.create(
+            user=user, name='Hugs', state_value_type=0)
+        jobs.enqueue(self.user, 'test')
+        claimed = jobs.claim_job(lease_seconds=60)
+
+        # Lease expired and the job claimed by another worker while running
+        models.Job.objects.filter(id=claimed.id).update(attempts=2, locked_until=timezone.now())
+
+        self.assertFalse(jobs.run_job(claimed))
+
+        self.assertFalse(models.EmotionalNeed.objects.exists())
+        job = models.Job.objects.get(id=claimed.id)
+        self.assertEqual(job.status, models.Job.StatusChoices.RUNNING)
+        self.assertEqual(job.attempts, 2)
+
+
+class TestRunJobsCommand(TransactionTestCase):
+
+    def test_burst_runs_every_due_job(self):
+        users = [models.User.objects.create(email=f'user{i}@example.com') for i in range(5)]
+        for user in users:
+            user.has_sample_data = True
+            user.save()
+            jobs.enqueue(user, 'clean_sample_data')
+        models.User.objects.create(email='sample@example.com', is_active=False, is_sample=True)
+
+        # Threads of the SQLite test database lock each other's tables
+        workers = 2 if connection.vendor == 'postgresql' else 1
+        call_command('run_jobs', '--workers', str(workers), '--burst', stdout=StringIO())
+
+        self.assertEqual(
+            list(models.Job.objects.values_list('status', 'attempts').distinct()),
+            [(models.Job.StatusChoices.DONE, 1)])
+        self.assertFalse(models.User.objects.filter(has_sample_data=True).exists())
@@ -1,6 +1,9 @@
+from datetime import timedelta
 from unittest import mock
 
-from django.test import TestCase
+from django.forms import modelform_factory
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
 from sacred_garden import models
 
@@ -84,16 +87,14 @@ class TestCreateEmotionalNeedState(TestCase):
         n = actual_values.count()
         self.assertEqual(n, len(expected_values))
 
-        values_list = actual_values.values_list('partner_user', 'status', 'is_current')
+        values_list = actual_values.values_list('partner_user', 'status')
 
-        for i, ((apartner, astatus, is_current), (epartner, estatus)) in enumerate(zip(values_list, expected_values)):
+        for (apartner, astatus), (epartner, estatus) in zip(values_list, expected_values):
             self.assertEqual(epartner, apartner)
             self.assertEqual(estatus, astatus)
 
-            if i == n-1:
-                self.assertTrue(is_current)
-            else:
-                self.assertFalse(is_current)
+        eneed.refresh_from_db()
+        self.assertEqual(eneed.current_state_id, actual_values.values_list('id', flat=True).last())
 
     def test_simple(self):
         self.assertEmotionalNeedValues(self.user_eneed, [])
@@ -114,3 +115,108 @@ class TestCreateEmotionalNeedState(TestCase):
         models.create_emotional_need_state(self.user, self.user_eneed, 0, 0, 0, "", "")
         self.assertEmotionalNeedValues(self.user_eneed, [(None, -2), (self.partner.id, -1), (self.partner.id, 0)])
         self.assertEmotionalNeedValues(self.partner_eneed, [])
+
+    def test_stale_emotional_need_save_keeps_current_state(self):
+        stale_eneed = models.EmotionalNeed.objects.get(id=self.user_eneed.id)
+        state = models.create_emotional_need_state(self.user, self.user_eneed, -1, 0, 0, "", "")
+
+        stale_eneed.name = 'Kisses'
+        stale_eneed.save()
+
+        self.assertEqual(models.EmotionalNeed.objects.get(id=self.user_eneed.id).current_state_id, state.id)
+
+
+class TestCurrentStateLoading(TestCase):
+
+    def setUp(self):
+        self.user = models.User.objects.create(email='user@example.com')
+        eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+        self.state = models.create_emotional_need_state(self.user, eneed, -10, None, 0, "", "")
+
+    def test_lazy_loading_raises_in_strict_mode(self):
+        eneed = models.EmotionalNeed.objects.get()
+
+        with self.assertRaises(models.LazyLoadingError):
+            eneed.current_state
+
+    def test_select_related(self):
+        eneed = models.EmotionalNeed.objects.select_related('current_state').get()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(eneed.current_state, self.state)
+
+    @override_settings(STRICT_CURRENT_STATE_LOADING=False)
+    def test_lazy_loading(self):
+        eneed = models.EmotionalNeed.objects.get()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(eneed.current_state, self.state)
+
+    def test_not_in_forms(self):
+        form_class = modelform_factory(models.EmotionalNeed, fields='__all__')
+
+        self.assertNotIn('current_state', form_class.base_fields)
+
+
+class TestCoupleHealthSummary(TestCase):
+
+    def setUp(self):
+        self.user1 = models.User.objects.create(email='user1@example.com')
+        self.user2 = models.User.objects.create(email='user2@example.com')
+
+        self.eneed1 = models.EmotionalNeed.objects.create(user=self.user1, name='Hugs', state_value_type=0)
+        self.eneed2 = models.EmotionalNeed.objects.create(user=self.user2, name='Talks', state_value_type=0)
+
+    def create_state(self, user, eneed, status, days_ago=0):
+        state = models.create_emotional_need_state(user, eneed, status, None, 0, "", "")
+
+        if days_ago:
+            state.created_at = timezone.now() - timedelta(days=days_ago)
+            state.save()
+
+        return state
+
+    def get_summary(self):
+        return models.find_couple_health_summaries([self.user1.id]).get()
+
+    def assertCounts(self, summary, good, bad, problem, suffix=''):
+        self.assertEqual(
+            (getattr(summary, f'good_count{suffix}'),
+             getattr(summary, f'bad_count{suffix}'),
+             getattr(summary, f'problem_count{suffix}')),
+            (good, bad, problem))
+
+    def test_summary_is_created_on_connect(self):
+        self.create_state(self.user1, self.eneed1, -20, days_ago=100)
+        self.create_state(self.user1, self.eneed1, -10, days_ago=40)
+        self.create_state(self.user1, self.eneed1, 0, days_ago=10)
+        self.create_state(self.user2, self.eneed2, -10, days_ago=60)
+
+        models.connect_partners(self.user2, self.user1)
+
+        summary = self.get_summary()
+        self.assertEqual((summary.user_id, summary.partner_user_id), (self.user1.id, self.user2.id))
+        self.assertEqual(summary.history_date, timezone.localdate())
+        self.assertCounts(summary, 1, 1, 0)
+        self.assertCounts(summary, 0, 2, 0, suffix='_30_days_ago')
+        self.assertCounts(summary, 0, 0, 1, suffix='_90_days_ago')
+
+    def test_summary_is_updated_on_state_writes(self):
+        models.connect_partners(self.user1, self.user2)
+
+        self.create_state(self.user1, self.eneed1, -10)
+        state = self.create_state(self.user2, self.eneed2, -20)
+        self.assertCounts(self.get_summary(), 0, 1, 1)
+
+        self.create_state(self.user1, self.eneed1, 0)
+        self.assertCounts(self.get_summary(), 1, 0, 1)
+
+        state.status = -10
+        state.save()
+        self.assertCounts(self.get_summary(), 1, 1, 0)
+
+    def test_summary_is_deleted_on_disconnect(self):
+        models.connect_partners(self.user1, self.user2)
+        models.disconnect_partner(self.user2)
+
+        self.assertFalse(models.CoupleHealthSummary.objects.exists())
@@ -0,0 +1,116 @@
+import datetime
+import unittest
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from sacred_garden import models
+from sacred_garden import partitioning
+
+
+class TestMonths(unittest.TestCase):
+
+    def test_add_months(self):
+        self.assertEqual(partitioning.add_months(datetime.date(2023, 11, 1), 1), datetime.date(2023, 12, 1))
+        self.assertEqual(partitioning.add_months(datetime.date(2023, 11, 1), 3), datetime.date(2024, 2, 1))
+        self.assertEqual(partitioning.add_months(datetime.date(2024, 1, 1), -1), datetime.date(2023, 12, 1))
+
+    def test_iter_months(self):
+        self.assertEqual(
+            list(partitioning.iter_months(datetime.date(2023, 12, 1), datetime.date(2024, 2, 1))),
+            [datetime.date(2023, 12, 1), datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)])
+
+    def test_partition_name_and_bounds(self):
+        month = partitioning.get_month(datetime.datetime(2023, 12, 24, 10, 30))
+
+        self.assertEqual(partitioning.get_partition_name('states', month), 'states_p202312')
+        self.assertEqual(
+            partitioning.get_month_bounds(month),
+            ('2023-12-01 00:00:00+00', '2024-01-01 00:00:00+00'))
+
+
+class TestPartitionTablesCommand(TestCase):
+
+    @unittest.skipIf(connection.vendor == 'postgresql', 'Error of other databases')
+    def test_postgresql_only(self):
+        with self.assertRaises(CommandError):
+            call_command('partition_tables', '--convert')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class TestConvertToPartitioned(TestCase):
+
+    def setUp(self):
+        self.user = models.User.objects.create(email='user1@example.com')
+        self.eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+
+        self.old_state = models.create_emotional_need_state(self.user, self.eneed, -10, None, -1, 'old', '')
+        self.old_state.created_at = timezone.now() - timedelta(days=400)
+        self.old_state.save()
+
+        self.table = models.EmotionalNeedState._meta.db_table
+
+    def get_partitions(self):
+        with connection.cursor() as cursor:
+            return partitioning.get_partitions(cursor, self.table)
+
+    def test_convert_keeps_rows_and_orm_queries(self):
+        partitioning.convert_to_partitioned(self.table, months_ahead=2)
+
+        with connection.cursor() as cursor:
+            self.assertTrue(partitioning.is_partitioned(cursor, self.table))
+
+        current_month = partitioning.get_month(timezone.now())
+        self.assertLessEqual({
+            partitioning.get_default_partition_name(self.table),
+            partitioning.get_partition_name(self.table, partitioning.get_month(self.old_state.created_at)),
+            partitioning.get_partition_name(self.table, partitioning.add_months(current_month, 2)),
+        }, self.get_partitions())
+
+        new_state = models.create_emotional_need_state(self.user, self.eneed, 0, None, 1, 'new', '')
+
+        self.assertGreater(new_state.id, self.old_state.id)
+        self.assertEqual(
+            list(models.find_emotional_need_statuses(self.eneed, user=self.user).values_list('id', flat=True)),
+            [self.old_state.id, new_state.id])
+
+        self.eneed.delete()
+        self.assertFalse(models.EmotionalNeedState.objects.exists())
+
+    def test_create_partitions_moves_rows_from_default_partition(self):
+        partitioning.convert_to_partitioned(self.table, months_ahead=0)
+
+        next_month = partitioning.add_months(partitioning.get_month(timezone.now()), 1)
+        state = models.create_emotional_need_state(self.user, self.eneed, 0, None, 1, 'next month', '')
+        state.created_at = timezone.make_aware(datetime.datetime.combine(next_month, datetime.time(12)))
+        state.save()
+
+        created = partitioning.create_partitions(self.table, months_ahead=1)
+
+        self.assertEqual(created, [partitioning.get_partition_name(self.table, next_month)])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {created[0]}')
+            self.assertEqual(cursor.fetchall(), [(state.id,)])
+
+        self.assertEqual(partitioning.create_partitions(self.table, months_ahead=1), [])
+
+    def test_create_partitions_of_past_months_in_default_partition(self):
+        partitioning.convert_to_partitioned(self.table, months_ahead=0)
+
+        # Imported, older than every row when converted
+        imported_month = partitioning.add_months(partitioning.get_month(self.old_state.created_at), -3)
+        state = models.create_emotional_need_state(self.user, self.eneed, 0, None, 1, 'imported', '')
+        state.created_at = timezone.make_aware(datetime.datetime.combine(imported_month, datetime.time(12)))
+        state.save()
+
+        created = partitioning.create_partitions(self.table, months_ahead=0)
+
+        self.assertEqual(created, [partitioning.get_partition_name(self.table, imported_month)])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {created[0]}')
+            self.assertEqual(cursor.fetchall(), [(state.id,)])
+            self.assertEqual(partitioning.get_default_partition_months(cursor, self.table), set())
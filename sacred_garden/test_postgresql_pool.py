@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.test import TestCase
+
+from sacred_garden_server.postgresql_pool import base as pool_base
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_get_returns_last_put_connection(self):
+        pool = pool_base.ConnectionPool(size=2)
+        conn1, conn2 = mock.Mock(), mock.Mock()
+
+        self.assertIsNone(pool.get())
+
+        pool.put(conn1)
+        pool.put(conn2)
+
+        self.assertIs(pool.get(), conn2)
+        self.assertIs(pool.get(), conn1)
+        self.assertIsNone(pool.get())
+
+    def test_put_closes_connection_when_full(self):
+        pool = pool_base.ConnectionPool(size=1)
+        conn1, conn2 = mock.Mock(), mock.Mock()
+
+        pool.put(conn1)
+        pool.put(conn2)
+
+        conn1.close.assert_not_called()
+        conn2.close.assert_called_once()
+
+    def test_pool_is_not_shared_with_forked_process(self):
+        pool = pool_base.get_pool('test_fork', 1)
+        self.assertIs(pool_base.get_pool('test_fork', 1), pool)
+
+        with mock.patch('os.getpid', return_value=pool.pid + 1):
+            self.assertIsNot(pool_base.get_pool('test_fork', 1), pool)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class TestPooledDatabaseWrapper(TestCase):
+
+    def setUp(self):
+        self.handler = ConnectionHandler({
+            'default': {
+                **connection.settings_dict,
+                'ENGINE': 'sacred_garden_server.postgresql_pool',
+                'CONN_MAX_AGE': 0,
+                'CONN_HEALTH_CHECKS': True,
+            },
+        })
+        self.addCleanup(self.handler.close_all)
+
+    def get_backend_pid(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_connection_is_reused_after_close(self):
+        conn = self.handler['default']
+
+        pid = self.get_backend_pid(conn)
+        conn.close()
+
+        self.assertEqual(self.get_backend_pid(conn), pid)
+
+    def test_open_transaction_is_rolled_back_before_reuse(self):
+        conn = self.handler['default']
+
+        conn.set_autocommit(False)
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pool_test (id int)')
+        conn.close()
+
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pool_test')")
+            self.assertIsNone(cursor.fetchone()[0])
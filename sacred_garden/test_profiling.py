@@ -0,0 +1,91 @@
+import marshal
+from unittest import mock
+
+from django.conf import settings
+from django.db import transaction
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
+
+from sacred_garden import models
+from sacred_garden import profiling
+from sacred_garden.test_views import ApiTestCase
+
+
+class TestGetModuleName(SimpleTestCase):
+
+    def test_module_names(self):
+        self.assertEqual(
+            profiling.get_module_name(str(profiling.PACKAGE_DIR / 'serializers.py')), 'sacred_garden/serializers.py')
+        self.assertEqual(
+            profiling.get_module_name('/usr/lib/python3/site-packages/django/db/models/query.py'), 'django.db')
+        self.assertEqual(
+            profiling.get_module_name('/usr/lib/python3/site-packages/django/core/handlers/base.py'), 'django')
+        self.assertEqual(
+            profiling.get_module_name('/usr/lib/python3/site-packages/rest_framework/views.py'), 'rest_framework')
+        self.assertEqual(profiling.get_module_name('/usr/lib/python3/json/encoder.py'), 'python')
+        self.assertEqual(profiling.get_module_name('~'), 'builtins')
+
+
+@mock.patch.object(profiling, 'logger', mock.Mock())
+@override_settings(MIDDLEWARE=['sacred_garden.profiling.ProfilingMiddleware'] + settings.MIDDLEWARE)
+class TestProfilingMiddleware(ApiTestCase):
+
+    def setUp(self):
+        self.staff_user = models.User.objects.create(email='staff@example.com', is_staff=True)
+        self.user = models.User.objects.create(email='user1@example.com')
+        models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+
+    def get(self, urlname, user, urlargs=None, query='', **headers):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'JWT {jwt_encode_handler(jwt_payload_handler(user))}')
+        # DRF rolls back the errors of the non-atomic views, keep it from breaking the test transaction
+        with transaction.atomic():
+            return client.get(reverse(urlname, args=urlargs) + query, **headers)
+
+    def test_staff_request_with_header_is_profiled(self):
+        response = self.get('user-me', self.staff_user, query='?token=secret', HTTP_X_PROFILE='1')
+        self.assertSuccess(response)
+
+        profile = models.RequestProfile.objects.get(id=response[profiling.PROFILE_ID_HEADER])
+        self.assertEqual(profile.user, self.staff_user)
+        self.assertEqual((profile.method, profile.path, profile.status_code), ('GET', reverse('user-me'), 200))
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertEqual({query['database'] for query in profile.queries}, {'default'})
+        self.assertTrue(any(query['caller'] for query in profile.queries))
+        self.assertIn('sacred_garden/views.py', profile.summary['self_time_by_module'])
+        self.assertIn('rest_framework', profile.summary['self_time_by_module'])
+
+        response = self.get('request-profile-detail', self.staff_user, urlargs=[profile.id])
+        self.assertSuccess(response)
+        self.assertEqual(response.data['summary'], profile.summary)
+
+        response = self.get('request-profile-download', self.staff_user, urlargs=[profile.id])
+        self.assertEqual(response.status_code, 200)
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(filename.endswith('views.py') for filename, _, _ in stats))
+
+    def test_header_of_other_clients_is_ignored_before_profiling(self):
+        for user, expected_status_code in [(self.user, 200), (None, 401)]:
+            with mock.patch.object(profiling.cProfile, 'Profile') as profile_class:
+                response = self.get('user-me', user, HTTP_X_PROFILE='1')
+            self.assertEqual(response.status_code, expected_status_code)
+
+            profile_class.assert_not_called()
+            self.assertNotIn(profiling.PROFILE_ID_HEADER, response)
+            self.assertFalse(models.RequestProfile.objects.exists())
+
+    def test_sampled_requests_are_profiled(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1):
+            response = self.get('user-me', self.user)
+        self.assertSuccess(response)
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, response)
+
+        profile = models.RequestProfile.objects.get()
+        self.assertEqual(profile.user, self.user)
+
+        # Only for staff
+        self.assertForbidden(self.get('request-profile-detail', self.user, urlargs=[profile.id]))
+        self.assertForbidden(self.get('request-profile-download', self.user, urlargs=[profile.id]))
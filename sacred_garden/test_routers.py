@@ -0,0 +1,113 @@
+import unittest
+from contextlib import nullcontext
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from sacred_garden import models
+from sacred_garden import routers
+from sacred_garden.test_views import ApiTestCase
+
+
+class TestReplicaRouter(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_from_replica_only_in_replica_reads(self):
+        self.assertIsNone(self.router.db_for_read(models.User))
+
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(models.User), routers.REPLICA_DB_ALIAS)
+            self.assertEqual(self.router.db_for_write(models.User), DEFAULT_DB_ALIAS)
+
+        self.assertIsNone(self.router.db_for_read(models.User))
+
+    def test_migrates_default_only(self):
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'sacred_garden'))
+        self.assertFalse(self.router.allow_migrate(routers.REPLICA_DB_ALIAS, 'sacred_garden'))
+
+
+class TestStickiness(ApiTestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(routers, 'are_replica_reads_enabled', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = models.User.objects.create(email='user1@example.com')
+        self.partner = models.User.objects.create(email='user2@example.com')
+        models.connect_partners(self.user, self.partner)
+        self.other_user = models.User.objects.create(email='user3@example.com')
+        cache.clear()
+
+    def test_write_keeps_both_partners_on_default_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+            models.create_emotional_need_state(self.user, eneed, -10, None, 0, '', '')
+
+            # Not before the write is committed
+            self.assertTrue(routers.can_read_from_replica(self.user.id))
+
+        self.assertFalse(routers.can_read_from_replica(self.user.id))
+        self.assertFalse(routers.can_read_from_replica(self.partner.id))
+        self.assertTrue(routers.can_read_from_replica(self.other_user.id))
+
+    def test_safe_requests_read_from_replica_unless_sticky(self):
+        with mock.patch.object(routers, 'replica_reads', side_effect=nullcontext) as replica_reads:
+            self.assertSuccess(self.request_get('user-me', auth_user=self.user))
+            self.assertSuccess(self.request_get('appreciations', auth_user=self.user))
+            self.assertEqual(replica_reads.call_count, 2)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertSuccess(self.request_patch(
+                    'user-detail', urlargs=[self.user.id], auth_user=self.user, data={'first_name': 'Jon'}))
+            self.assertEqual(replica_reads.call_count, 2)
+
+            self.assertSuccess(self.request_get('user-me', auth_user=self.user))
+            self.assertEqual(replica_reads.call_count, 2)
+
+
+@unittest.skipUnless(routers.REPLICA_DB_ALIAS in settings.DATABASES, 'Replica not configured')
+@override_settings(REPLICA_READS=True)
+class TestReplicaReads(TransactionTestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = models.User.objects.create(email='user1@example.com')
+        models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+        cache.clear()
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_me(self):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as default_queries, \
+                CaptureQueriesContext(connections[routers.REPLICA_DB_ALIAS]) as replica_queries:
+            response = self.client.get(reverse('user-me'))
+        self.assertEqual(response.status_code, 200)
+
+        return response, len(default_queries), len(replica_queries)
+
+    def test_reads_own_writes(self):
+        response, default_count, replica_count = self.get_me()
+        self.assertEqual(len(response.data['emotional_needs']), 1)
+        self.assertEqual(default_count, 0)
+        self.assertGreater(replica_count, 0)
+
+        response = self.client.post(
+            reverse('emotionalneed-list'), {'name': 'Talks', 'state_value_type': 0}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        response, default_count, replica_count = self.get_me()
+        self.assertEqual(len(response.data['emotional_needs']), 2)
+        self.assertGreater(default_count, 0)
+        self.assertEqual(replica_count, 0)
@@ -1,15 +1,23 @@
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import exceptions
 from rest_framework.test import APIClient
 from rest_framework_jwt.serializers import jwt_decode_handler
 
 from collections import OrderedDict
+from io import StringIO
 
+from sacred_garden import archive
 from sacred_garden import models
+from sacred_garden import sample_data
 
 from unittest import mock
 
@@ -41,12 +49,9 @@ class TestSampleData(ApiTestCase):
 
         self.eneed_user = models.EmotionalNeed.objects.create(user=self.user, name='hugs', state_value_type=0)
         self.eneed_other_user = models.EmotionalNeed.objects.create(user=self.other_user, name='hugs', state_value_type=0)
-        self.eneed_sample_user_user = models.EmotionalNeed.objects.create(
-            user=self.sample_user, name='hugs_user', state_value_type=0,
-            is_sample=True, sample_user_partner=self.user)
-        self.eneed_sample_user_other_user = models.EmotionalNeed.objects.create(
-            user=self.sample_user, name='hugs_other_user', state_value_type=0,
-            is_sample=True, sample_user_partner=self.other_user)
+        # Shared by the users with the sample partner
+        self.eneed_sample_user = models.EmotionalNeed.objects.create(
+            user=self.sample_user, name='hugs_sample', state_value_type=0, is_sample=True)
 
         models.create_emotional_need_state(self.user, self.eneed_user, 0, 0, 0, "", "")
         self.eneed_state_user = models.create_emotional_need_state(self.user, self.eneed_user, -10, -1, 0, "", "")
@@ -54,21 +59,21 @@ class TestSampleData(ApiTestCase):
         models.create_emotional_need_state(self.other_user, self.eneed_other_user, 0, 0, 0, "", "")
         models.create_emotional_need_state(self.other_user, self.eneed_other_user, -20, -2, 0, "", "")
 
-        models.create_emotional_need_state(self.sample_user, self.eneed_sample_user_user, 0, 0, 0, "", "")
-        self.eneed_state_sample_user = models.create_emotional_need_state(self.sample_user, self.eneed_sample_user_user, 0, 0, 0, "", "")
-
-        models.create_emotional_need_state(self.sample_user, self.eneed_sample_user_other_user, 0, 0, 0, "", "")
-        models.create_emotional_need_state(self.sample_user, self.eneed_sample_user_other_user, 0, 0, 0, "", "")
+        models.create_emotional_need_state(self.sample_user, self.eneed_sample_user, 0, 0, 0, "", "")
+        self.eneed_state_sample_user = models.create_emotional_need_state(
+            self.sample_user, self.eneed_sample_user, 0, 0, 0, "", "Thank you")
 
     def test_counts(self):
         self.assertEqual(models.User.objects.filter(partner_user=self.sample_user).count(), 2)
 
         self.assertEqual(models.EmotionalLetter.objects.count(), 4)
-        self.assertEqual(models.EmotionalNeed.objects.count(), 4)
-        self.assertEqual(models.EmotionalNeedState.objects.count(), 8)
+        self.assertEqual(models.EmotionalNeed.objects.count(), 3)
+        self.assertEqual(models.EmotionalNeedState.objects.count(), 6)
 
     def test_user_api(self):
-        response = self.request_get('user-me', auth_user=self.user)
+        # Own and sample partner's needs are read by a single query, as for a real partner
+        with self.assertNumQueries(3):
+            response = self.request_get('user-me', auth_user=self.user)
         self.assertSuccess(response)
 
         del response.data['emotional_needs'][0]['current_state']['created_at']
@@ -87,16 +92,16 @@ class TestSampleData(ApiTestCase):
                     ('first_name', ''),
                     ('emotional_needs', [
                         OrderedDict([
-                            ('id', self.eneed_sample_user_user.id),
-                            ('name', 'hugs_user'),
+                            ('id', self.eneed_sample_user.id),
+                            ('name', 'hugs_sample'),
                             ('current_state', OrderedDict([
-                                ('emotional_need_id', self.eneed_sample_user_user.id),
+                                ('emotional_need_id', self.eneed_sample_user.id),
                                 ('status', 0),
                                 ('value_abs', 0),
                                 ('value_rel', 0),
                                 ('id', self.eneed_state_sample_user.id),
                                 ('text', ''),
-                                ('appreciation_text', ''),
+                                ('appreciation_text', 'Thank you'),
                                 # ('created_at', '2023-04-18T05:00:55.147223Z'),
                                 ('is_initial_state', False)])),
                             ('state_value_type', 0),
@@ -123,3 +128,106 @@ class TestSampleData(ApiTestCase):
                 ]
             }
         )
+
+    def test_sample_partner_needs_shown_as_of_sample_data_created_at(self):
+        self.sample_user.sample_data_created_at = timezone.now() - timedelta(days=30)
+        self.sample_user.save()
+        self.user.sample_data_created_at = timezone.now()
+        self.user.save()
+
+        shown_created_at = self.eneed_state_sample_user.created_at + timedelta(days=30)
+
+        response = self.request_get('user-me', auth_user=self.user)
+        self.assertSuccess(response)
+        self.assertEqual(
+            parse_datetime(response.data['partner_user']['emotional_needs'][0]['current_state']['created_at']),
+            shown_created_at)
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(
+            reverse('emotionalneed-state-history', args=[self.eneed_sample_user.id]),
+            {'since': (timezone.now() + timedelta(days=29)).isoformat()})
+        self.assertSuccess(response)
+        self.assertEqual(
+            [parse_datetime(state['created_at']) for state in response.data][-1:], [shown_created_at])
+        self.assertEqual(len(response.data), 2)
+
+        response = self.request_get('appreciations', auth_user=self.user)
+        self.assertSuccess(response)
+        self.assertEqual(
+            [parse_datetime(a['created_at']) for a in response.data if a['appreciation_text'] == 'Thank you'],
+            [shown_created_at])
+
+        # Other users see it as of their own sample data
+        response = self.request_get('appreciations', auth_user=self.other_user)
+        self.assertEqual(
+            [parse_datetime(a['created_at']) for a in response.data if a['appreciation_text'] == 'Thank you'],
+            [self.eneed_state_sample_user.created_at])
+
+    def test_sample_partner_needs_not_visible_to_other_users(self):
+        self.assertEqual(
+            list(models.get_visible_emotional_needs(self.user).order_by('id')),
+            [self.eneed_user, self.eneed_sample_user])
+
+        stranger = models.User.objects.create(email='stranger@example.com')
+        self.assertEqual(list(models.get_visible_emotional_needs(stranger)), [])
+
+    def test_populate_shares_sample_partner_needs(self):
+        new_users = [models.User.objects.create(email=f'new{i}@example.com') for i in range(3)]
+
+        for user in new_users:
+            sample_data.populate_sample_user_data(user)
+
+        # Created once for the sample user, only the users' own needs per user
+        self.assertEqual(models.EmotionalNeed.objects.filter(user=self.sample_user).count(), 2)
+        self.assertEqual(models.EmotionalNeed.objects.filter(user__in=new_users).count(), 3)
+
+        shared = models.EmotionalNeed.objects.get(user=self.sample_user, name="Acts of Service (Sample)")
+        for user in new_users:
+            response = self.request_get('user-me', auth_user=user)
+            self.assertEqual(
+                [eneed['id'] for eneed in response.data['partner_user']['emotional_needs']],
+                [self.eneed_sample_user.id, shared.id])
+
+        sample_data.clean_sample_user_data(new_users[0])
+        self.assertEqual(models.EmotionalNeed.objects.filter(user=self.sample_user).count(), 2)
+        self.assertEqual(models.EmotionalNeed.objects.filter(user=new_users[0]).count(), 0)
+
+    def test_populate_only_reads_sample_user_once_shared_needs_exist(self):
+        sample_data.populate_sample_user_data(models.User.objects.create(email='first@example.com'))
+
+        with self.assertNumQueries(1):
+            sample_user = sample_data.get_sample_user_with_shared_data()
+
+        self.assertEqual(sample_user, self.sample_user)
+        self.assertIsNotNone(sample_user.sample_data_created_at)
+
+    def test_shared_needs_created_once_by_concurrent_populate(self):
+        # Read before another populate claimed the creation
+        stale_sample_user = models.User.objects.get(id=self.sample_user.id)
+        sample_data.populate_sample_user_data(models.User.objects.create(email='first@example.com'))
+
+        with mock.patch.object(models.User.objects, 'get', return_value=stale_sample_user):
+            sample_user = sample_data.get_sample_user_with_shared_data()
+
+        self.assertEqual(
+            models.EmotionalNeed.objects.filter(user=self.sample_user, name="Acts of Service (Sample)").count(), 1)
+        self.assertEqual(
+            sample_user.sample_data_created_at,
+            models.User.objects.get(id=self.sample_user.id).sample_data_created_at)
+
+    def test_shared_needs_are_not_archived(self):
+        sample_data.populate_sample_user_data(models.User.objects.create(email='first@example.com'))
+        models.EmotionalNeedState.objects.update(created_at=timezone.now() - timedelta(days=1000))
+        letters, eneed_states = models.find_received_appreciations(self.user)
+        appreciations_count = eneed_states.count()
+
+        call_command('archive_emotional_need_states', stdout=StringIO())
+        for eneed in models.EmotionalNeed.objects.filter(user=self.sample_user):
+            self.assertEqual(archive.archive_emotional_need_states(eneed.id, timezone.now()), 0)
+
+        self.assertFalse(
+            models.EmotionalNeedStateArchive.objects.filter(emotional_need__user=self.sample_user).exists())
+        letters, eneed_states = models.find_received_appreciations(self.user)
+        self.assertEqual(eneed_states.count(), appreciations_count)
@@ -23,8 +23,8 @@ class TestEmotionalNeedSerializer(TestCase):
         models.create_emotional_need_state(user, eneed2, 3, None, 1, "", "")
         ens2 = models.create_emotional_need_state(user, eneed2, 4, None, 1, "", "")
 
-        with self.assertNumQueries(2) as c:
-            emotional_needs = models.get_emotional_needs_with_prefetched_current_values(user=user)
+        with self.assertNumQueries(1) as c:
+            emotional_needs = models.get_emotional_needs_for_viewer(user)
 
             serializer = serializers.EmotionalNeedSerializer(instance=emotional_needs, many=True)
             data = serializer.data
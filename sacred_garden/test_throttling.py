@@ -0,0 +1,196 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from sacred_garden import models
+from sacred_garden import throttling
+from sacred_garden.test_views import ApiTestCase
+from sacred_garden_server.file_cache import FileBasedCache
+
+
+class ThrottlingTestCase(ApiTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        self.now = 1000.0
+        patcher = mock.patch.object(throttling.TokenBucketThrottle, 'timer', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(throttling, 'logger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, urlname, email, ip='10.0.0.1'):
+        # DRF rolls back the errors of the non-atomic CheckUserView, keep it from breaking the test transaction
+        with transaction.atomic():
+            return APIClient().post(reverse(urlname), data={'email': email}, format='json', REMOTE_ADDR=ip)
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, 429)
+
+
+class TestEmailThrottle(ThrottlingTestCase):
+
+    def test_burst_then_refill(self):
+        rates = {'check_user_email': '3/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            for i in range(3):
+                self.assertSuccess(self.post('check-user', 'joe@example.com', ip=f'10.0.0.{i}'))
+
+            response = self.post('check-user', 'Joe@Example.com', ip='10.0.0.9')
+            self.assertThrottled(response)
+            self.assertEqual(response['Retry-After'], '20')
+
+            # Other emails are not throttled
+            self.assertSuccess(self.post('check-user', 'ann@example.com'))
+
+            # One token per 20 seconds
+            self.now += 20
+            self.assertSuccess(self.post('check-user', 'joe@example.com'))
+            self.assertThrottled(self.post('check-user', 'joe@example.com'))
+
+    def test_request_without_email_is_not_throttled_by_email(self):
+        rates = {'join_wait_list_email': '1/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            for _ in range(3):
+                self.assertBadRequest(APIClient().post(reverse('join-wait-list'), data={}, format='json'))
+
+    def test_body_other_than_an_object_is_a_bad_request(self):
+        rates = {'check_user_email': '1/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            for data in [['joe@example.com'], 'joe@example.com']:
+                with transaction.atomic():
+                    response = APIClient().post(reverse('check-user'), data=data, format='json')
+                self.assertBadRequest(response)
+
+
+class TestIPThrottle(ThrottlingTestCase):
+
+    def test_throttled_before_querying_the_database(self):
+        rates = {'check_user_ip': '2/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            self.assertSuccess(self.post('check-user', 'joe@example.com'))
+            self.assertSuccess(self.post('check-user', 'ann@example.com'))
+
+            with CaptureQueriesContext(connection) as queries:
+                self.assertThrottled(self.post('check-user', 'eva@example.com'))
+            self.assertEqual([query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']], [])
+
+            self.assertSuccess(self.post('check-user', 'eva@example.com', ip='10.0.0.2'))
+
+    @mock.patch('sacred_garden.emails.send_mail')
+    def test_scopes_of_views_are_separate(self, mocked_send_mail):
+        models.User.objects.create(email='joe@example.com')
+
+        rates = {'check_user_ip': '1/min', 'request_password_reset_ip': '1/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            self.assertSuccess(self.post('check-user', 'joe@example.com'))
+            self.assertSuccess(self.post('request-password-reset', 'joe@example.com'))
+
+            self.assertThrottled(self.post('request-password-reset', 'joe@example.com'))
+            self.assertEqual(mocked_send_mail.call_count, 1)
+
+
+class TestBucketLock(ThrottlingTestCase):
+
+    def allow_request(self):
+        request = mock.Mock(META={'REMOTE_ADDR': '10.0.0.1'})
+        return throttling.IPThrottle().allow_request(request, mock.Mock(throttle_scope='check_user'))
+
+    def test_concurrent_requests_spend_distinct_tokens(self):
+        def get(*args, **kwargs):
+            value = cache.get(*args, **kwargs)
+            # Lets the other threads run between reading and writing the bucket
+            time.sleep(0.001)
+            return value
+
+        slow_cache = mock.Mock(wraps=cache, get=get)
+
+        rates = {'check_user_ip': '5/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}), \
+                mock.patch.object(throttling, 'cache', slow_cache), \
+                mock.patch.object(throttling, 'LOCK_ATTEMPTS', 10000):
+            with ThreadPoolExecutor(max_workers=20) as executor:
+                allowed = list(executor.map(lambda _: self.allow_request(), range(20)))
+
+        self.assertEqual(allowed.count(True), 5)
+
+    @mock.patch.object(throttling.time, 'sleep')
+    def test_rejected_while_locked(self, sleep):
+        rates = {'check_user_ip': '5/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            cache.set('throttle-check_user_ip-10.0.0.1-lock', True)
+            self.assertFalse(self.allow_request())
+            self.assertEqual(sleep.call_count, throttling.LOCK_ATTEMPTS)
+
+            cache.delete('throttle-check_user_ip-10.0.0.1-lock')
+            self.assertTrue(self.allow_request())
+
+
+class TestRejectedMetrics(ThrottlingTestCase):
+
+    def test_rejected_requests_are_counted_per_scope(self):
+        rates = {'registration_ip': '1/min', 'registration_email': '5/min', 'check_user_ip': '5/min'}
+        with self.settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            for _ in range(3):
+                self.post('registration', 'joe@example.com')
+
+            self.assertEqual(
+                throttling.get_rejected_counts(),
+                {'registration_ip': 2, 'registration_email': 0, 'check_user_ip': 0})
+
+            stdout = StringIO()
+            call_command('throttle_metrics', stdout=stdout)
+            self.assertIn('registration_ip', stdout.getvalue())
+
+
+class TestFileBasedCache(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Two processes sharing the directory
+        self.caches = [FileBasedCache(directory.name, {}) for _ in range(2)]
+
+    def test_add_once(self):
+        self.assertTrue(self.caches[0].add('lock', True, timeout=60))
+        self.assertFalse(self.caches[1].add('lock', True, timeout=60))
+
+        self.caches[0].delete('lock')
+        self.assertTrue(self.caches[1].add('lock', True, timeout=60))
+
+    def test_add_expired(self):
+        self.caches[0].add('lock', True, timeout=60)
+
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertTrue(self.caches[1].add('lock', False, timeout=60))
+            self.assertFalse(self.caches[1].get('lock'))
+
+    def test_concurrent_adds_and_increments(self):
+        def add_and_incr(i):
+            cache = self.caches[i % 2]
+            cache.add('count', 0, timeout=None)
+            cache.incr('count')
+            return cache.add('lock', i, timeout=60)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            added = list(executor.map(add_and_incr, range(50)))
+
+        self.assertEqual(added.count(True), 1)
+        self.assertEqual(self.caches[0].get('count'), 50)
+
+    def test_incr_missing(self):
+        with self.assertRaises(ValueError):
+            self.caches[0].incr('count')
@@ -1,13 +1,18 @@
+from datetime import datetime, timezone
+
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import exceptions
 from rest_framework.test import APIClient
 from rest_framework_jwt.serializers import jwt_decode_handler
 
 from sacred_garden import models
+from sacred_garden import views
 
 from unittest import mock
 
@@ -177,6 +182,46 @@ class TestUserViewSet(ApiTestCase):
 
         self.assertSuccess(response, expected_data=expected_data)
 
+    def test_me_num_queries_with_partner(self):
+        models.connect_partners(self.user1, self.user2)
+
+        eneed1 = models.EmotionalNeed.objects.create(user=self.user1, name='Hugs', state_value_type=0)
+        eneed2 = models.EmotionalNeed.objects.create(user=self.user2, name='Talks', state_value_type=0)
+        models.EmotionalNeed.objects.create(user=self.user2, name='Sample', state_value_type=0, is_sample=True)
+        models.create_emotional_need_state(self.user1, eneed1, -10, None, 0, "", "")
+        models.create_emotional_need_state(self.user2, eneed2, 0, None, 0, "", "")
+
+        # select data versions for the ETag, select user with unread letters count,
+        # select both partners' needs joined with their current states, outside of a transaction
+        with self.assertNumQueries(3):
+            response = self.request_get('user-me', auth_user=self.user1)
+        self.assertSuccess(response)
+
+        self.assertEqual([eneed['id'] for eneed in response.data['emotional_needs']], [eneed1.id])
+        self.assertEqual([eneed['id'] for eneed in response.data['partner_user']['emotional_needs']], [eneed2.id])
+
+    def test_health_summary_success(self):
+        models.connect_partners(self.user1, self.user2)
+
+        eneed1 = models.EmotionalNeed.objects.create(user=self.user1, name='Hugs', state_value_type=0)
+        eneed2 = models.EmotionalNeed.objects.create(user=self.user2, name='Talks', state_value_type=0)
+        models.create_emotional_need_state(self.user1, eneed1, -10, None, 0, "", "")
+        models.create_emotional_need_state(self.user1, eneed1, 0, None, 1, "", "")
+        models.create_emotional_need_state(self.user2, eneed2, -20, None, 0, "", "")
+
+        # select summary, outside of a transaction
+        with self.assertNumQueries(1):
+            response = self.request_get('user-health-summary', auth_user=self.user2)
+        self.assertSuccess(response)
+
+        self.assertEqual(response.data['current'], {'good': 1, 'bad': 0, 'problem': 1})
+        self.assertEqual(response.data['change_30_days'], {'good': 1, 'bad': 0, 'problem': 1})
+        self.assertEqual(response.data['change_90_days'], {'good': 1, 'bad': 0, 'problem': 1})
+
+    def test_health_summary_no_partner_not_found(self):
+        response = self.request_get('user-health-summary', auth_user=self.user1)
+        self.assertNotFound(response)
+
     def assertPartnersConnected(self, user1, user2):
         user1 = models.User.objects.get(id=user1.id)
         user2 = models.User.objects.get(id=user2.id)
@@ -225,6 +270,33 @@ class TestUserViewSet(ApiTestCase):
         self.assertPartnersConnected(self.user1, self.user2)
         self.assertNoPartner(user3)
 
+    def test_connect_partner_stale_user_already_connected(self):
+        stale_user1 = models.User.objects.get(id=self.user1.id)
+        user3 = models.User.objects.create(email='user3@example.com', partner_invite_code='USER3_CODE')
+        models.connect_partners(models.User.objects.get(id=self.user1.id), user3)
+
+        response = self.request_post(
+            'user-connect-partner',
+            data={'invite_code': 'USER2_CODE'},
+            auth_user=stale_user1)
+
+        self.assertBadRequest(response)
+        self.assertPartnersConnected(self.user1, user3)
+        self.assertNoPartner(self.user2)
+
+    def test_connect_partner_keeps_other_fields(self):
+        stale_user1 = models.User.objects.get(id=self.user1.id)
+        models.User.objects.filter(id=self.user1.id).update(first_name='Changed elsewhere')
+
+        response = self.request_post(
+            'user-connect-partner',
+            data={'invite_code': 'USER2_CODE'},
+            auth_user=stale_user1)
+
+        self.assertSuccess(response)
+        self.assertPartnersConnected(self.user1, self.user2)
+        self.assertEqual(models.User.objects.get(id=self.user1.id).first_name, 'Changed elsewhere')
+
     def test_connect_partner_self(self):
         response = self.request_post(
             'user-connect-partner',
@@ -259,6 +331,18 @@ class TestUserViewSet(ApiTestCase):
         self.assertNoPartner(self.user1)
         self.assertNoPartner(self.user2)
 
+    def test_disconnect_partner_stale_user(self):
+        stale_user1 = models.User.objects.get(id=self.user1.id)
+        models.connect_partners(models.User.objects.get(id=self.user1.id), self.user2)
+        models.User.objects.filter(id=self.user1.id).update(first_name='Changed elsewhere')
+
+        response = self.request_post('user-disconnect-partner', auth_user=stale_user1)
+
+        self.assertSuccess(response)
+        self.assertNoPartner(self.user1)
+        self.assertNoPartner(self.user2)
+        self.assertEqual(models.User.objects.get(id=self.user1.id).first_name, 'Changed elsewhere')
+
     def test_disconnect_partner_error_no_partner(self):
         response = self.request_post(
             'user-disconnect-partner',
@@ -305,6 +389,30 @@ class TestUserViewSet(ApiTestCase):
 
         self.assertIsNone(authenticate(email='user1@example.com', password='new_password'))
 
+    def test_change_password_other_user_not_found(self):
+        self.user2.set_password('old_password')
+        self.user2.save()
+
+        response = self.request_post(
+            'user-change-password',
+            urlargs=[self.user2.id],
+            data={'password': 'new_password'},
+            auth_user=self.user1,
+        )
+        self.assertNotFound(response)
+
+        self.assertIsNone(authenticate(email='user2@example.com', password='new_password'))
+
+    def test_update_other_user_not_found(self):
+        response = self.request_patch(
+            'user-detail',
+            urlargs=[self.user2.id],
+            auth_user=self.user1,
+            data={'first_name': 'Jon'})
+        self.assertNotFound(response)
+
+        self.assertEqual(models.User.objects.get(id=self.user2.id).first_name, 'Eva')
+
 
 class TestCheckUserView(ApiTestCase):
 
@@ -586,11 +694,105 @@ class TestEmotionalNeedViewSet(ApiTestCase):
         self.assertEqual(response.data[1]['id'], ens2.id)
         self.assertEqual(response.data[2]['id'], ens3.id)
 
-    def test_history_forbidden(self):
+    def test_history_other_user_not_found(self):
         eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
         response = self.request_get(
             'emotionalneed-state-history', urlargs=[eneed.id], auth_user=self.partner)
-        self.assertForbidden(response)
+        self.assertNotFound(response)
+
+    def create_state_at(self, eneed, created_at, status, value_rel):
+        state = models.create_emotional_need_state(self.user, eneed, status, None, value_rel, "", "")
+        state.created_at = created_at
+        state.save()
+        return state
+
+    def create_trend_states(self):
+        eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+
+        self.create_state_at(eneed, datetime(2023, 1, 2, 10, tzinfo=timezone.utc), -10, 1)
+        self.create_state_at(eneed, datetime(2023, 1, 2, 12, tzinfo=timezone.utc), 0, 1)
+        self.create_state_at(eneed, datetime(2023, 1, 3, 10, tzinfo=timezone.utc), -20, -1)
+        self.create_state_at(eneed, datetime(2023, 1, 9, 10, tzinfo=timezone.utc), 0, 1)
+        self.create_state_at(eneed, datetime(2023, 2, 1, 10, tzinfo=timezone.utc), -10, 0)
+
+        return eneed
+
+    def request_trends(self, eneed, period, auth_user):
+        url = reverse('emotionalneed-trends', args=[eneed.id])
+
+        client = APIClient()
+        client.force_authenticate(user=auth_user)
+
+        return client.get(url, {'period': period})
+
+    def trend(self, bucket, count, min_status, max_status, last_status, cumulative_value_rel):
+        return {
+            'bucket': bucket,
+            'count': count,
+            'min_status': min_status,
+            'max_status': max_status,
+            'last_status': last_status,
+            'cumulative_value_rel': cumulative_value_rel,
+        }
+
+    def test_trends_by_day(self):
+        eneed = self.create_trend_states()
+
+        response = self.request_trends(eneed, 'day', auth_user=self.user)
+        self.assertSuccess(response, expected_data=[
+            self.trend('2023-01-02', 2, -10, 0, 0, 2),
+            self.trend('2023-01-03', 1, -20, -20, -20, 1),
+            self.trend('2023-01-09', 1, 0, 0, 0, 2),
+            self.trend('2023-02-01', 1, -10, -10, -10, 2),
+        ])
+
+    def test_trends_by_week(self):
+        eneed = self.create_trend_states()
+
+        response = self.request_trends(eneed, 'week', auth_user=self.user)
+        self.assertSuccess(response, expected_data=[
+            self.trend('2023-01-02', 3, -20, 0, -20, 1),
+            self.trend('2023-01-09', 1, 0, 0, 0, 2),
+            self.trend('2023-01-30', 1, -10, -10, -10, 2),
+        ])
+
+    def test_trends_by_month_as_partner(self):
+        eneed = self.create_trend_states()
+        models.connect_partners(self.user, self.partner)
+
+        response = self.request_trends(eneed, 'month', auth_user=self.partner)
+        self.assertSuccess(response, expected_data=[
+            self.trend('2023-01-01', 4, -20, 0, 0, 2),
+            self.trend('2023-02-01', 1, -10, -10, -10, 2),
+        ])
+
+    def test_trends_invalid_period(self):
+        eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+        response = self.request_trends(eneed, 'year', auth_user=self.user)
+        self.assertBadRequest(response)
+
+    def test_trends_other_user_not_found(self):
+        eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+        response = self.request_trends(eneed, 'day', auth_user=self.partner)
+        self.assertNotFound(response)
+
+    def test_trends_rollups_follow_state_writes(self):
+        eneed = self.create_trend_states()
+        state = models.EmotionalNeedState.objects.get(created_at=datetime(2023, 1, 3, 10, tzinfo=timezone.utc))
+
+        response = self.request_patch(
+            'emotionalneedstate-detail', urlargs=[state.id], data={'status': 0}, auth_user=self.user)
+        self.assertSuccess(response)
+
+        response = self.request_trends(eneed, 'day', auth_user=self.user)
+        self.assertEqual(response.data[1], self.trend('2023-01-03', 1, 0, 0, 0, 1))
+
+        response = self.request_delete('emotionalneedstate-detail', urlargs=[state.id], auth_user=self.user)
+        self.assertSuccess(response, expected_status_code=204)
+
+        response = self.request_trends(eneed, 'day', auth_user=self.user)
+        self.assertEqual([trend['bucket'] for trend in response.data], ['2023-01-02', '2023-01-09', '2023-02-01'])
+        self.assertEqual(response.data[1], self.trend('2023-01-09', 1, 0, 0, 0, 3))
 
     def test_get_success(self):
         eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
@@ -661,7 +863,7 @@ class TestEmotionalNeedViewSet(ApiTestCase):
             }
         )
 
-    def test_get_forbidden(self):
+    def test_get_other_user_not_found(self):
         eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
 
         ens1 = models.create_emotional_need_state(self.user, eneed, -1, None, 0, "", "")
@@ -669,7 +871,18 @@ class TestEmotionalNeedViewSet(ApiTestCase):
 
         response = self.request_get(
             'emotionalneed-detail', urlargs=[eneed.id], auth_user=self.partner)
-        self.assertForbidden(response)
+        self.assertNotFound(response)
+
+    def test_get_as_partner_num_queries(self):
+        models.connect_partners(self.user, self.partner)
+        eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+        models.create_emotional_need_state(self.user, eneed, -1, None, 0, "", "")
+
+        # select visible need joined with its current state, outside of a transaction
+        with self.assertNumQueries(1):
+            response = self.request_get(
+                'emotionalneed-detail', urlargs=[eneed.id], auth_user=self.partner)
+        self.assertSuccess(response)
 
     def test_update_name_success(self):
         eneed = models.EmotionalNeed.objects.create(user=self.user, name='hugs', state_value_type=0)
@@ -682,6 +895,16 @@ class TestEmotionalNeedViewSet(ApiTestCase):
             models.EmotionalNeed.objects.get(id=eneed.id).name,
             'more_hugs')
 
+    def test_update_returns_current_state(self):
+        eneed = models.EmotionalNeed.objects.create(user=self.user, name='hugs', state_value_type=0)
+        ens = models.create_emotional_need_state(self.user, eneed, -10, None, 0, "", "")
+
+        response = self.request_put(
+            'emotionalneed-detail', urlargs=[eneed.id], data={'name': 'more_hugs'}, auth_user=self.user)
+        self.assertSuccess(response)
+
+        self.assertEqual(response.data['current_state']['id'], ens.id)
+
     def test_update_user_does_not_work(self):
         other_user = models.User.objects.create(email='joe@example.com')
         eneed = models.EmotionalNeed.objects.create(user=self.user, name='hugs', state_value_type=0)
@@ -712,7 +935,7 @@ class TestEmotionalNeedViewSet(ApiTestCase):
         updated_eneed = models.EmotionalNeed.objects.get(id=eneed.id)
         self.assertEqual(updated_eneed.name, 'hugs')
 
-    def test_update_unauthorized(self):
+    def test_update_other_user_not_found(self):
         other_user = models.User.objects.create(email='joe@example.com')
         eneed = models.EmotionalNeed.objects.create(user=self.user, name='hugs', state_value_type=0)
 
@@ -721,7 +944,7 @@ class TestEmotionalNeedViewSet(ApiTestCase):
             urlargs=[eneed.id],
             data={'name': 'more_hugs', 'user': other_user.id, 'user_id': other_user.id},
             auth_user=other_user)
-        self.assertForbidden(response)
+        self.assertNotFound(response)
 
         updated_eneed = models.EmotionalNeed.objects.get(id=eneed.id)
         self.assertEqual(updated_eneed.name, 'hugs')
@@ -736,13 +959,13 @@ class TestEmotionalNeedViewSet(ApiTestCase):
 
         self.assertEqual(models.EmotionalNeed.objects.count(), 0)
 
-    def test_delete_unauthorized(self):
+    def test_delete_other_user_not_found(self):
         other_user = models.User.objects.create(email='joe@example.com')
         eneed = models.EmotionalNeed.objects.create(user=self.user, name='hugs', state_value_type=0)
 
         response = self.request_delete(
             'emotionalneed-detail', urlargs=[eneed.id], auth_user=other_user)
-        self.assertForbidden(response)
+        self.assertNotFound(response)
 
         self.assertEqual(models.EmotionalNeed.objects.count(), 1)
 
@@ -802,7 +1025,7 @@ class TestEmotionalNeedStateViewSet(ApiTestCase):
              'value_rel': 1, 'value_abs': None, 'is_initial_state': False})
 
         self.assertEqual(eneed_status.status, -20)
-        self.assertTrue(eneed_status.is_current)
+        self.assertEqual(eneed.current_state_id, eneed_status.id)
         self.assertEqual(eneed_status.partner_user, partner)
 
     def test_create_no_partner_success(self):
@@ -829,7 +1052,7 @@ class TestEmotionalNeedStateViewSet(ApiTestCase):
              'value_rel': 1, 'value_abs': None, 'is_initial_state': False,})
 
         self.assertEqual(eneed_status.status, -20)
-        self.assertTrue(eneed_status.is_current)
+        self.assertEqual(eneed.current_state_id, eneed_status.id)
         self.assertIsNone(eneed_status.partner_user)
 
     def test_create_error_forbidden(self):
@@ -871,13 +1094,24 @@ class TestEmotionalNeedStateViewSet(ApiTestCase):
 
         self.assertEqual(models.EmotionalNeedState.objects.count(), 0)
 
-    def test_delete_forbidden(self):
+    def test_delete_current_state_moves_current_state(self):
+        previous_ens = models.create_emotional_need_state(self.user, self.eneed, -20, 0, 0, "", "")
+        ens = models.create_emotional_need_state(self.user, self.eneed, -10, 0, 0, "", "")
+
+        response = self.request_delete(
+            'emotionalneedstate-detail', urlargs=[ens.id], auth_user=self.user)
+        self.assertSuccess(response, expected_status_code=204)
+
+        self.eneed.refresh_from_db()
+        self.assertEqual(self.eneed.current_state_id, previous_ens.id)
+
+    def test_delete_other_user_not_found(self):
         other_user = models.User.objects.create(email='user2@example.com')
         ens = models.create_emotional_need_state(self.user, self.eneed, -10, 0, 0, "", "")
 
         response = self.request_delete(
             'emotionalneedstate-detail', urlargs=[ens.id], auth_user=other_user)
-        self.assertForbidden(response)
+        self.assertNotFound(response)
 
         self.assertEqual(models.EmotionalNeedState.objects.count(), 1)
 
@@ -935,7 +1169,7 @@ class TestEmotionalNeedStateViewSet(ApiTestCase):
         self.assertEqual(updated_ens.text, 'Please help')
         self.assertEqual(updated_ens.appreciation_text, 'I love you')
 
-    def test_update_forbidden(self):
+    def test_update_other_user_not_found(self):
         other_user = models.User.objects.create(email='user2@example.com')
         ens = models.create_emotional_need_state(self.user, self.eneed, -10, 0, 0, "", "")
 
@@ -950,7 +1184,7 @@ class TestEmotionalNeedStateViewSet(ApiTestCase):
             },
             auth_user=other_user,
         )
-        self.assertForbidden(response)
+        self.assertNotFound(response)
 
         updated_ens = models.EmotionalNeedState.objects.get()
         self.assertEqual(updated_ens.status, -10)
@@ -958,6 +1192,56 @@ class TestEmotionalNeedStateViewSet(ApiTestCase):
         self.assertEqual(updated_ens.text, '')
         self.assertEqual(updated_ens.appreciation_text, '')
 
+    def test_create_num_queries(self):
+        partner = models.User.objects.create(email='user2@example.com')
+        models.connect_partners(self.user, partner)
+
+        # savepoint, select emotional need, insert, point the need to the state, bump data versions,
+        # insert and update the day's rollup, update couple health summary, release savepoint
+        with self.assertNumQueries(9):
+            response = self.request_post(
+                'emotionalneedstate-list',
+                data={
+                    'emotional_need_id': self.eneed.id,
+                    'status': -20,
+                    'value_rel': 1,
+                    'text': 'Please help',
+                    'appreciation_text': 'I love you',
+                },
+                auth_user=self.user,
+            )
+        self.assertSuccess(response, expected_status_code=201)
+
+    def test_update_num_queries(self):
+        ens = models.create_emotional_need_state(self.user, self.eneed, -10, 0, 0, "", "")
+
+        # savepoint, select state joined with emotional need, update, bump data versions,
+        # select the day's states, update the day's rollup, update couple health summary, release savepoint
+        with self.assertNumQueries(8):
+            response = self.request_put(
+                'emotionalneedstate-detail',
+                urlargs=[ens.id],
+                data={
+                    'status': -20,
+                    'value_rel': 1,
+                    'text': 'Please help',
+                    'appreciation_text': 'I love you',
+                },
+                auth_user=self.user,
+            )
+        self.assertSuccess(response, expected_status_code=200)
+
+    def test_delete_num_queries(self):
+        ens = models.create_emotional_need_state(self.user, self.eneed, -10, 0, 0, "", "")
+
+        # savepoint, select state joined with emotional need, delete, point the need to its previous state,
+        # bump data versions, select the day's states, delete the day's rollup, update couple health summary,
+        # release savepoint
+        with self.assertNumQueries(9):
+            response = self.request_delete(
+                'emotionalneedstate-detail', urlargs=[ens.id], auth_user=self.user)
+        self.assertSuccess(response, expected_status_code=204)
+
 
 class TestEmotionalLetterViewSet(ApiTestCase):
 
@@ -1645,3 +1929,137 @@ class TestAppreciationsAPIView(ApiTestCase):
                     'emotional_need_id': self.eneed.id,
                 }
             })
+
+
+class TestConditionalGet(ApiTestCase):
+
+    def setUp(self):
+        self.user = models.User.objects.create(email='user1@example.com')
+        self.partner = models.User.objects.create(email='user2@example.com')
+        models.connect_partners(self.user, self.partner)
+
+        self.eneed = models.EmotionalNeed.objects.create(user=self.user, name='Hugs', state_value_type=0)
+
+    def request_get_if_none_match(self, urlname, etag, urlargs=None, auth_user=None):
+        client = APIClient()
+        client.force_authenticate(user=auth_user)
+
+        return client.get(reverse(urlname, args=urlargs), HTTP_IF_NONE_MATCH=etag)
+
+    def test_me_not_modified(self):
+        response = self.request_get('user-me', auth_user=self.user)
+        self.assertSuccess(response)
+
+        # select data versions, outside of a transaction
+        with self.assertNumQueries(1):
+            response = self.request_get_if_none_match('user-me', response['ETag'], auth_user=self.user)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_me_etag_changes_on_partner_write(self):
+        etag = self.request_get('user-me', auth_user=self.user)['ETag']
+
+        eneed = models.EmotionalNeed.objects.create(user=self.partner, name='Talks', state_value_type=0)
+        response = self.request_get_if_none_match('user-me', etag, auth_user=self.user)
+        self.assertSuccess(response)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        models.create_emotional_need_state(self.user, eneed, -10, None, 0, "", "")
+        response = self.request_get_if_none_match('user-me', etag, auth_user=self.user)
+        self.assertSuccess(response)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_stale_user_instance_does_not_reset_data_version(self):
+        stale_user = models.User.objects.get(id=self.user.id)
+        etag = self.request_get('user-me', auth_user=self.user)['ETag']
+
+        models.EmotionalLetter.objects.create(sender=self.partner, recipient=self.user)
+        stale_user.first_name = 'John'
+        stale_user.save()
+
+        response = self.request_get_if_none_match('user-me', etag, auth_user=self.user)
+        self.assertSuccess(response)
+        self.assertEqual(response.data['first_name'], 'John')
+        self.assertEqual(response.data['unread_letters_count'], 1)
+
+    def test_state_history_not_modified(self):
+        response = self.request_get('emotionalneed-state-history', urlargs=[self.eneed.id], auth_user=self.partner)
+        self.assertSuccess(response)
+
+        response = self.request_get_if_none_match(
+            'emotionalneed-state-history', response['ETag'], urlargs=[self.eneed.id], auth_user=self.partner)
+        self.assertEqual(response.status_code, 304)
+
+        models.create_emotional_need_state(self.partner, self.eneed, -10, None, 0, "", "")
+        response = self.request_get_if_none_match(
+            'emotionalneed-state-history', response['ETag'], urlargs=[self.eneed.id], auth_user=self.partner)
+        self.assertSuccess(response)
+        self.assertEqual(len(response.data), 1)
+
+    def test_state_history_other_user_not_found(self):
+        other_user = models.User.objects.create(email='user3@example.com')
+        etag = self.request_get('user-me', auth_user=other_user)['ETag']
+
+        response = self.request_get_if_none_match(
+            'emotionalneed-state-history', etag, urlargs=[self.eneed.id], auth_user=other_user)
+        self.assertNotFound(response)
+
+    def test_appreciations_not_modified(self):
+        response = self.request_get('appreciations', auth_user=self.user)
+        self.assertSuccess(response)
+
+        response = self.request_get_if_none_match('appreciations', response['ETag'], auth_user=self.user)
+        self.assertEqual(response.status_code, 304)
+
+        letter = models.EmotionalLetter.objects.create(
+            sender=self.partner, recipient=self.user, appreciation_text='thanks')
+        response = self.request_get_if_none_match('appreciations', response['ETag'], auth_user=self.user)
+        self.assertSuccess(response)
+        self.assertEqual(response.data[0]['id'], letter.id)
+
+        # Deletes are bumped by the viewset, not by signals
+        etag = response['ETag']
+        self.request_delete('emotionalletter-detail', urlargs=[letter.id], auth_user=self.partner)
+        response = self.request_get_if_none_match('appreciations', etag, auth_user=self.user)
+        self.assertSuccess(response, expected_data=[])
+
+
+class TestAtomicRequests(ApiTestCase):
+
+    def setUp(self):
+        self.user = models.User.objects.create(email='user1@example.com', first_name='John')
+
+    def get_queries(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertSuccess(response)
+
+        return [query['sql'] for query in queries]
+
+    def test_safe_requests_outside_of_transaction(self):
+        queries = self.get_queries(lambda: self.request_get('user-me', auth_user=self.user))
+        self.assertFalse([sql for sql in queries if sql.startswith('SAVEPOINT')])
+
+        queries = self.get_queries(lambda: self.request_post(
+            'check-user', data={'email': 'user1@example.com'}))
+        self.assertFalse([sql for sql in queries if sql.startswith('SAVEPOINT')])
+
+    def test_unsafe_requests_in_transaction(self):
+        queries = self.get_queries(lambda: self.request_patch(
+            'user-detail', urlargs=[self.user.id], auth_user=self.user, data={'first_name': 'Jon'}))
+        self.assertTrue(queries[0].startswith('SAVEPOINT'))
+        self.assertTrue(queries[-1].startswith('RELEASE SAVEPOINT'))
+
+    def test_unsafe_request_rolled_back_on_error(self):
+        def perform_update(serializer):
+            serializer.save()
+            raise exceptions.ValidationError('Rejected after the update')
+
+        with mock.patch.object(views.UserViewSet, 'perform_update', side_effect=perform_update):
+            response = self.request_patch(
+                'user-detail', urlargs=[self.user.id], auth_user=self.user, data={'first_name': 'Jon'})
+        self.assertBadRequest(response)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'John')
@@ -0,0 +1,145 @@
+"""
+Token bucket throttles of the unauthenticated endpoints, per client IP and
+per email of the request.
+
+DRF checks throttles before the view queries the database. The rates of a
+view are `<throttle_scope>_ip` and `<throttle_scope>_email` of
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']: "5/min" is a bucket of 5
+tokens refilled at 5 per minute, so bursts of up to 5 requests pass and
+then one per 12 seconds.
+
+Buckets and the counts of rejected requests are stored in the default
+cache, shared by the processes: files of the host by default, see
+sacred_garden_server.file_cache, or e.g. Redis. A bucket is read and
+written under a lock taken with cache.add, atomic in these caches and the
+local memory one of tests, so that concurrent requests don't all spend
+the same token.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# A bucket is locked for a few cache operations, requests still waiting for
+# it after the attempts are part of a burst and rejected
+LOCK_ATTEMPTS = 10
+LOCK_RETRY_SECONDS = 0.005
+# Released by then should its process die
+LOCK_TIMEOUT_SECONDS = 1
+
+
+def parse_rate(rate):
+    """(tokens, seconds) of a "5/min" rate."""
+    tokens, period = rate.split('/')
+    return int(tokens), DURATIONS[period[0]]
+
+
+def get_rejected_count_cache_key(scope):
+    return f'throttle-rejected-{scope}'
+
+
+def record_rejected(scope):
+    key = get_rejected_count_cache_key(scope)
+
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted in between
+        cache.set(key, 1, timeout=None)
+
+    logger.warning('Request throttled by %s', scope)
+
+
+def get_rejected_counts():
+    """Rejected requests per scope since the cache was cleared."""
+    scopes = api_settings.DEFAULT_THROTTLE_RATES.keys()
+    counts = cache.get_many([get_rejected_count_cache_key(scope) for scope in scopes])
+
+    return {scope: counts.get(get_rejected_count_cache_key(scope), 0) for scope in scopes}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle of the view's throttle_scope and of the key_name part of the request."""
+
+    key_name = None
+    timer = time.time
+
+    def get_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.scope = f'{view.throttle_scope}_{self.key_name}'
+
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        key = self.get_key(request)
+        if rate is None or key is None:
+            return True
+
+        self.capacity, self.duration = parse_rate(rate)
+        cache_key = f'throttle-{self.scope}-{key}'
+        lock_key = f'{cache_key}-lock'
+
+        for _ in range(LOCK_ATTEMPTS):
+            if cache.add(lock_key, True, timeout=LOCK_TIMEOUT_SECONDS):
+                break
+            time.sleep(LOCK_RETRY_SECONDS)
+        else:
+            self.tokens = None
+            record_rejected(self.scope)
+            return False
+
+        try:
+            return self.take_token(cache_key)
+        finally:
+            cache.delete(lock_key)
+
+    def take_token(self, cache_key):
+        now = self.timer()
+        tokens, updated_at = cache.get(cache_key, (self.capacity, now))
+        self.tokens = min(self.capacity, tokens + (now - updated_at) * self.capacity / self.duration)
+
+        if self.tokens < 1:
+            record_rejected(self.scope)
+            return False
+
+        # Expires once full again
+        cache.set(cache_key, (self.tokens - 1, now), timeout=self.duration)
+        return True
+
+    def wait(self):
+        if self.tokens is None:
+            # Rejected while the bucket was locked
+            return None
+
+        return (1 - self.tokens) * self.duration / self.capacity
+
+
+class IPThrottle(TokenBucketThrottle):
+    key_name = 'ip'
+
+    def get_key(self, request):
+        return self.get_ident(request)
+
+
+class EmailThrottle(TokenBucketThrottle):
+    key_name = 'email'
+
+    def get_key(self, request):
+        # Validated by the view, which answers 400 to other bodies
+        if not isinstance(request.data, dict):
+            return None
+
+        email = request.data.get('email')
+        if not isinstance(email, str) or not email.strip():
+            return None
+
+        # Bounded cache key, the view validates the email
+        return email.strip().lower()[:254]
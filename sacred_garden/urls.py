@@ -1,7 +1,8 @@
-from django.urls import path
+from django.urls import include, path
 from rest_framework_jwt.views import obtain_jwt_token, refresh_jwt_token
 from rest_framework import routers
 
+from sacred_garden import async_views
 from sacred_garden import views
 
 router = routers.SimpleRouter()
@@ -15,6 +16,12 @@ urlpatterns = [
     path('api-token-auth/', obtain_jwt_token),
     path('api-token-refresh/', refresh_jwt_token),
     path('appreciations/', views.AppreciationsAPIView.as_view(), name='appreciations'),
+    path('events/', views.EventsView.as_view(), name='events'),
+    path('export/', views.ExportView.as_view(), name='export'),
+    path('import/', views.ImportView.as_view(), name='import'),
+    path('jobs/<int:pk>/', views.JobView.as_view(), name='job-detail'),
+    path('profiles/<int:pk>/', views.RequestProfileView.as_view(), name='request-profile-detail'),
+    path('profiles/<int:pk>/download/', views.RequestProfileDownloadView.as_view(), name='request-profile-download'),
     path('check-user/', views.CheckUserView.as_view(), name='check-user'),
     path('registration/', views.RegistrationView.as_view(), name='registration'),
     path('join-wait-list/', views.JoinWaitListView.as_view(), name='join-wait-list'),
@@ -24,3 +31,16 @@ urlpatterns = [
 
 
 urlpatterns += router.urls
+
+# Read-only endpoints served by async views, see async_views
+async_urlpatterns = [
+    path('users/me/', async_views.me, name='async-user-me'),
+    path('emotional-needs/<int:pk>/state_history/', async_views.state_history,
+         name='async-emotionalneed-state-history'),
+    path('appreciations/', async_views.appreciations, name='async-appreciations'),
+    path('emotional-letters/', async_views.emotional_letters, name='async-emotionalletter-list'),
+]
+
+urlpatterns += [
+    path('async/', include(async_urlpatterns)),
+]
@@ -1,52 +1,123 @@
-from itertools import chain
+import codecs
+from contextlib import ExitStack
 
+from django.conf import settings
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.permissions import SAFE_METHODS
 
 from rest_framework_jwt.serializers import jwt_payload_handler, jwt_encode_handler
 
-from rest_framework import generics, mixins, viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework import permissions as drf_permissions
 from rest_framework import serializers as drf_serializers
 from rest_framework import views as drf_views
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from sacred_garden import archive
+from sacred_garden import authentication
+from sacred_garden import email_status
 from sacred_garden import emails
+from sacred_garden import events
+from sacred_garden import exports
+from sacred_garden import imports
+from sacred_garden import jobs
 from sacred_garden import models
-from sacred_garden import sample_data
+from sacred_garden import profiling
+from sacred_garden import routers
 from sacred_garden import serializers
+from sacred_garden import throttling
 
 
 INVITES_ENABLED = True
 
+# Checked before the views query the database
+UNAUTHENTICATED_THROTTLE_CLASSES = [throttling.IPThrottle, throttling.EmailThrottle]
 
-class UserViewSet(mixins.UpdateModelMixin, viewsets.GenericViewSet):
+# Part of every ETag, change it whenever the format of the responses changes
+ETAG_FORMAT_VERSION = 1
+
+
+def user_data_etag(request, *args, **kwargs):
+    """ETag of responses which only change when the user's or their partner's data changes."""
+    data_version, partner_user_id, partner_data_version = models.get_data_versions(request.user.id)
+    return f'"{ETAG_FORMAT_VERSION}-{request.user.id}-{data_version}-{partner_user_id}-{partner_data_version}"'
+
+
+def visible_emotional_need_etag(request, pk, *args, **kwargs):
+    # No ETag for needs the user can't see: the view will return 404
+    if not models.get_visible_emotional_needs(request.user).filter(pk=pk).exists():
+        return None
+
+    return user_data_etag(request)
+
+
+class AtomicUnsafeRequestsMixin:
+    """
+    Runs GET, HEAD and OPTIONS requests outside of the ATOMIC_REQUESTS
+    transaction, saving the BEGIN and COMMIT round trips of reads, and the
+    other requests in a transaction as before. Only for views whose safe
+    methods don't write, see benchmark_atomic_requests.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        return transaction.non_atomic_requests(super().as_view(*args, **kwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+
+        # Rolled back on errors handled by DRF as well, see rest_framework.views.set_rollback
+        with transaction.atomic():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaReadsMixin:
+    """
+    Reads safe requests of users who did not write recently from the read
+    replica, see sacred_garden.routers. The user is authenticated on the
+    default database.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self.replica_reads:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        if request.method in SAFE_METHODS and routers.can_read_from_replica(request.user.id):
+            self.replica_reads.enter_context(routers.replica_reads())
+
+
+class UserViewSet(AtomicUnsafeRequestsMixin, ReplicaReadsMixin, mixins.UpdateModelMixin, viewsets.GenericViewSet):
 
     queryset = models.User.objects.all()
     serializer_class = serializers.UserUpdateSerializer
 
+    def get_queryset(self):
+        return self.queryset.filter(id=self.request.user.id)
+
     @action(detail=False, methods=['GET'])
+    @method_decorator(condition(etag_func=user_data_etag))
     def me(self, request):
-        user = request.user
-        partner_user = user.partner_user
+        user = models.get_user_with_unread_letters_count(request.user.id).get()
 
-        emotional_needs = models.get_emotional_needs_with_prefetched_current_values(user)
-        eneeds_serializer = serializers.EmotionalNeedSerializer(
-            instance=emotional_needs, many=True)
+        emotional_needs, partner_emotional_needs = models.split_emotional_needs_for_viewer(
+            user, models.get_emotional_needs_for_viewer(user))
 
-        serializer = serializers.MeSerializer(request.user)
-        data = serializer.data
-        data['emotional_needs'] = eneeds_serializer.data
-
-        if partner_user:
-            partner_emotional_needs = models.get_emotional_needs_with_prefetched_current_values(partner_user, by_partner=user)
-            partner_eneeds_serializer = serializers.EmotionalNeedSerializer(
-                instance=partner_emotional_needs, many=True)
-            data['partner_user']['emotional_needs'] = partner_eneeds_serializer.data
+        return Response(serializers.serialize_me(user, emotional_needs, partner_emotional_needs))
 
-        return Response(data)
+    @action(detail=False, methods=['GET'])
+    def health_summary(self, request):
+        summary = generics.get_object_or_404(models.find_couple_health_summaries([request.user.id]))
+        return Response(serializers.CoupleHealthSummarySerializer(instance=summary).data)
 
     @action(detail=False, methods=['POST'])
     def connect_partner(self, request):
@@ -57,8 +128,9 @@ class UserViewSet(mixins.UpdateModelMixin, viewsets.GenericViewSet):
 
     @action(detail=False, methods=['POST'])
     def disconnect_partner(self, request):
-        user = request.user
-        partner_user = request.user.partner_user
+        # Not the user of the JWT cache, which may be stale
+        user = models.lock_users([request.user.id])[request.user.id]
+        partner_user = user.partner_user
 
         if not partner_user :
             raise drf_serializers.ValidationError('User has no partner', code='no_partner')
@@ -100,36 +172,81 @@ class SampleDataViewSet(viewsets.GenericViewSet):
         if self.request.user.partner_user:
             self.permission_denied(self.request)
 
-        sample_data.populate_sample_user_data(self.request.user)
-
-        return Response()
+        return self.enqueue_job('populate_sample_data')
 
     @action(detail=True, methods=['POST'])
     def clean_sample_data(self, *args, **kwargs):
-        sample_data.clean_sample_user_data(self.request.user)
-        return Response()
+        return self.enqueue_job('clean_sample_data')
+
+    def enqueue_job(self, name):
+        job = jobs.enqueue(self.request.user, name)
+
+        return Response(
+            serializers.JobSerializer(instance=job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('job-detail', args=[job.id])},
+        )
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class JobView(generics.RetrieveAPIView):
+    """Status of a job enqueued by one of the user's requests."""
+
+    serializer_class = serializers.JobSerializer
+
+    def get_queryset(self):
+        return models.Job.objects.filter(user=self.request.user)
 
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class RequestProfileView(generics.RetrieveAPIView):
+    """Query timings and time per module of a request profiled by profiling.ProfilingMiddleware."""
+
+    permission_classes = [drf_permissions.IsAdminUser]
+    serializer_class = serializers.RequestProfileSerializer
+    queryset = models.RequestProfile.objects.defer('stats')
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class RequestProfileDownloadView(generics.RetrieveAPIView):
+    """.prof file of a profiled request."""
+
+    permission_classes = [drf_permissions.IsAdminUser]
+    queryset = models.RequestProfile.objects.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        profile = self.get_object()
+
+        response = HttpResponse(profiling.get_prof_file_content(profile), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="request-profile-{profile.id}.prof"'
+        return response
+
+
+# Read-only despite POST
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class CheckUserView(drf_views.APIView):
 
     authentication_classes = []
     permission_classes = []
+    throttle_classes = UNAUTHENTICATED_THROTTLE_CLASSES
+    throttle_scope = 'check_user'
 
     def post(self, request):
         serializer = serializers.EmailSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        try:
-            user = models.User.objects.get(email=serializer.data['email'])
-        except models.User.DoesNotExist:
+        status = email_status.get_email_status(serializer.data['email'])
+
+        if status is None:
             if INVITES_ENABLED:
                 user_status = 'NON_EXISTING'
             else:
                 user_status = 'INVITED'
         else:
-            if not user.is_invited:
+            is_invited, is_active = status
+            if not is_invited:
                 user_status = 'NOT_INVITED'
-            elif not user.is_active:
+            elif not is_active:
                 user_status = 'INVITED'
             else:
                 user_status = 'ACTIVE'
@@ -143,6 +260,8 @@ class RequestResetPassword(drf_views.APIView):
 
     authentication_classes = []
     permission_classes = []
+    throttle_classes = UNAUTHENTICATED_THROTTLE_CLASSES
+    throttle_scope = 'request_password_reset'
 
     def post(self, request):
         serializer = serializers.EmailSerializer(data=request.data)
@@ -184,6 +303,8 @@ class JoinWaitListView(drf_views.APIView):
 
     authentication_classes = []
     permission_classes = []
+    throttle_classes = UNAUTHENTICATED_THROTTLE_CLASSES
+    throttle_scope = 'join_wait_list'
 
     def post(self, request):
         serializer = serializers.EmailSerializer(data=request.data)
@@ -192,15 +313,14 @@ class JoinWaitListView(drf_views.APIView):
 
         email = models.User.objects.normalize_email(data['email'])
 
+        # Insert unless the unique email exists, in a savepoint which the
+        # IntegrityError rolls back without breaking the request's transaction
         try:
-            models.User.objects.get(email=email)
-        except models.User.DoesNotExist:
-            pass
-        else:
+            with transaction.atomic():
+                models.User.objects.create(email=email, is_invited=False, is_active=False)
+        except IntegrityError:
             self.permission_denied(request)
 
-        models.User.objects.create(email=email, is_invited=False, is_active=False)
-
         return Response({})
 
 
@@ -208,6 +328,8 @@ class RegistrationView(drf_views.APIView):
 
     authentication_classes = []
     permission_classes = []
+    throttle_classes = UNAUTHENTICATED_THROTTLE_CLASSES
+    throttle_scope = 'registration'
 
     def post(self, request):
         serializer = serializers.RegistrationSerializer(data=request.data)
@@ -249,43 +371,80 @@ class EmotionalNeedPermission(drf_permissions.BasePermission):
         return True
 
     def has_object_permission(self, request, view, eneed):
-
-        if request.method == 'GET':
-            if eneed.user.partner_user == request.user or eneed.user.is_sample:
-                return True
-
-        if eneed.user == request.user:
+        # Visibility for reads is already enforced by EmotionalNeedViewSet.get_queryset
+        if request.method in SAFE_METHODS:
             return True
 
-        return False
+        return eneed.user_id == request.user.id
 
 
-class EmotionalNeedViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+class EmotionalNeedViewSet(AtomicUnsafeRequestsMixin, ReplicaReadsMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
 
     queryset = models.EmotionalNeed.objects.all()
     serializer_class = serializers.EmotionalNeedSerializer
 
     permission_classes = [drf_permissions.IsAuthenticated, EmotionalNeedPermission]
 
+    def get_queryset(self):
+        # current_state is serialized by retrieve and update
+        return models.get_visible_emotional_needs(self.request.user).select_related('current_state')
+
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return serializers.CreateEmotionalNeedSerializer
         return super().get_serializer_class()
 
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        models.bump_data_version([instance.user_id, instance.sample_user_partner_id])
+        models.refresh_couple_health_summary([instance.user_id])
+
     @action(detail=True, methods=['GET'])
+    @method_decorator(condition(etag_func=visible_emotional_need_etag))
     def state_history(self, request, *args, **kwargs):
         eneed = self.get_object()
 
-        if eneed.user == request.user:
-            eneed_statuses = models.find_emotional_need_statuses(eneed, user=request.user)
+        query_serializer = serializers.StateHistoryQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        since = query_serializer.validated_data.get('since')
+
+        # States of the sample partner's shared needs are shown shifted
+        shift = models.get_emotional_need_sample_data_shift(request.user, eneed)
+        if since is None:
+            # Without decompressing the archives
+            since = archive.get_unarchived_since(eneed.id)
+        else:
+            since -= shift
+
+        if eneed.user_id == request.user.id:
+            eneed_statuses = models.find_emotional_need_statuses(eneed, user=request.user, since=since)
         else:
-            eneed_statuses = models.find_emotional_need_statuses(eneed, partner_user=request.user)
+            eneed_statuses = models.find_emotional_need_statuses(eneed, partner_user=request.user, since=since)
+
+        eneed_statuses = archive.merge_archived_states(
+            archive.find_emotional_need_state_archives(eneed, since), eneed_statuses, since)
+        eneed_statuses = models.shift_created_at(eneed_statuses, shift)
 
         serializer = serializers.EmotionalNeedStateSerializer(
-            many=True, instance=eneed_statuses)
+            many=True, instance=eneed_statuses,
+            context={'previous_state': archive.get_previous_state(eneed.id, since)})
 
         return Response(serializer.data)
 
+    @action(detail=True, methods=['GET'])
+    @method_decorator(condition(etag_func=visible_emotional_need_etag))
+    def trends(self, request, *args, **kwargs):
+        eneed = self.get_object()
+
+        query_serializer = serializers.EmotionalNeedTrendsQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+
+        trends = models.find_emotional_need_trends(
+            eneed, query_serializer.validated_data['period'],
+            models.get_emotional_need_sample_data_shift(request.user, eneed))
+
+        return Response(serializers.EmotionalNeedTrendSerializer(many=True, instance=trends).data)
+
 
 class EmotionalNeedStatePermission(drf_permissions.BasePermission):
 
@@ -293,10 +452,11 @@ class EmotionalNeedStatePermission(drf_permissions.BasePermission):
         return True
 
     def has_object_permission(self, request, view, ens):
-        return ens.emotional_need.user == request.user
+        return ens.emotional_need.user_id == request.user.id
 
 
-class EmotionalNeedStateViewSet(mixins.CreateModelMixin,
+class EmotionalNeedStateViewSet(AtomicUnsafeRequestsMixin,
+                                mixins.CreateModelMixin,
                                 mixins.DestroyModelMixin,
                                 mixins.UpdateModelMixin,
                                 viewsets.GenericViewSet):
@@ -306,6 +466,26 @@ class EmotionalNeedStateViewSet(mixins.CreateModelMixin,
 
     permission_classes = [drf_permissions.IsAuthenticated, EmotionalNeedStatePermission]
 
+    def get_queryset(self):
+        # Ownership is checked against emotional_need.user_id, so load the need
+        # together with the state instead of lazily in the permission/serializer
+        return self.queryset.filter(
+            emotional_need__user=self.request.user,
+        ).select_related(
+            'emotional_need'
+        )
+
+    def perform_destroy(self, instance):
+        # Before the delete which resets the id
+        is_current = instance.emotional_need.current_state_id == instance.id
+
+        super().perform_destroy(instance)
+        if is_current:
+            models.refresh_emotional_need_current_states([instance.emotional_need_id])
+        models.bump_emotional_need_state_data_version(instance)
+        models.refresh_emotional_need_state_rollup(*instance.get_rollup_key())
+        models.refresh_couple_health_summary([instance.emotional_need.user_id])
+
 
 class EmotionalLetterPermission(drf_permissions.BasePermission):
 
@@ -322,7 +502,7 @@ class EmotionalLetterPermission(drf_permissions.BasePermission):
         return letter.sender == request.user
 
 
-class EmotionalLetterViewSet(viewsets.ModelViewSet):
+class EmotionalLetterViewSet(AtomicUnsafeRequestsMixin, ReplicaReadsMixin, viewsets.ModelViewSet):
 
     queryset = models.EmotionalLetter.objects.all()
     serializer_class = serializers.EmotionalLetterSerializer
@@ -330,11 +510,11 @@ class EmotionalLetterViewSet(viewsets.ModelViewSet):
     permission_classes = [drf_permissions.IsAuthenticated, EmotionalLetterPermission]
 
     def get_queryset(self):
-        return self.queryset.filter(
-            Q(sender=self.request.user) | Q(recipient=self.request.user)
-        ).order_by(
-            '-created_at'
-        )
+        return models.find_emotional_letters(self.request.user)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        models.bump_data_version([instance.sender_id, instance.recipient_id])
 
     @action(detail=True, methods=['PUT'])
     def mark_as_read(self, request, *args, **kwargs):
@@ -354,23 +534,80 @@ class EmotionalLetterViewSet(viewsets.ModelViewSet):
         return Response()
 
 
-class AppreciationsAPIView(drf_views.APIView):
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class AppreciationsAPIView(ReplicaReadsMixin, drf_views.APIView):
+
+    @method_decorator(condition(etag_func=user_data_etag))
+    def get(self, request):
+        letters, eneed_states = models.find_received_appreciations(request.user)
+        eneed_states = models.shift_received_sample_states(request.user, eneed_states)
+        return Response(serializers.serialize_appreciations(letters, eneed_states))
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class ExportView(drf_views.APIView):
+    """Streams all of the user's emotional needs, states and letters as NDJSON or CSV."""
 
     def get(self, request):
-        letters = models.EmotionalLetter.objects.filter(recipient=self.request.user)
+        serializer = serializers.ExportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        export_format = serializer.validated_data['export_format']
+
+        content_type, iter_content = exports.EXPORT_FORMATS[export_format]
+
+        response = StreamingHttpResponse(iter_content(request.user), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="sacred-garden-export.{export_format}"'
+
+        return response
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class ImportView(drf_views.APIView):
+    """
+    Imports an uploaded NDJSON or CSV export into the user's history,
+    in a transaction per batch of rows, see imports.HistoryImporter. Only
+    the user's own rows are imported, never letters from the partner.
+    """
 
-        eneed_states = models.EmotionalNeedState.objects.filter(
-            partner_user=self.request.user,
-        ).exclude(
-            Q(appreciation_text__isnull=True)|Q(appreciation_text='')
+    def post(self, request):
+        serializer = serializers.ImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        result = imports.import_history(
+            request.user,
+            codecs.iterdecode(data['file'], 'utf-8'),
+            data['import_format'],
+            source_user_id=data.get('source_user_id'),
         )
 
-        instances = sorted(
-            chain(letters, eneed_states),
-            key=lambda x: x.created_at,
-            reverse=True,
+        return Response(result.as_dict())
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class EventsView(drf_views.APIView):
+    """
+    Server-sent events about the user's and their partner's updates.
+
+    Every open stream holds a worker thread, so serve it from threaded
+    workers (e.g. gunicorn --threads), Django 4.1 iterates streaming
+    responses synchronously even under ASGI.
+    """
+
+    authentication_classes = [
+        authentication.CachedJSONWebTokenAuthentication,
+        authentication.QueryParamJSONWebTokenAuthentication,
+    ]
+
+    def get(self, request):
+        subscription = events.get_broker().subscribe(request.user.id)
+
+        response = StreamingHttpResponse(
+            events.stream(subscription, settings.EVENTS_HEARTBEAT_SECONDS),
+            content_type='text/event-stream',
         )
+        response['Cache-Control'] = 'no-cache'
+        # Do not let nginx buffer the stream
+        response['X-Accel-Buffering'] = 'no'
 
-        serializer = serializers.AppreciationSerializer(
-            instance=instances , many=True)
-        return Response(serializer.data)
+        return response
@@ -0,0 +1,83 @@
+"""
+File based cache shared by the processes of a host, the default cache
+outside of tests, see settings.CACHES.
+
+Django's FileBasedCache implements add and incr with a read then a write,
+so two processes may both add the same key or lose an increment. Here add
+links the new file in place, which fails if another process created it
+meanwhile, and incr replaces the file under an exclusive lock of the
+file it read, so that the throttles' bucket locks and rejected counts
+hold across processes.
+"""
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache as DjangoFileBasedCache
+from django.core.files import locks
+
+
+class FileBasedCache(DjangoFileBasedCache):
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Removes the file of an expired value
+        if self.has_key(key, version):
+            return False
+
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            # Unlike a rename, fails when the file exists
+            os.link(tmp_path, fname)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+
+        while True:
+            try:
+                f = open(fname, 'rb')
+            except FileNotFoundError:
+                raise ValueError(f"Key '{key}' not found")
+
+            with f:
+                locks.lock(f, locks.LOCK_EX)
+                try:
+                    # Replaced by another increment while waiting for the lock
+                    try:
+                        if os.stat(fname).st_ino != os.fstat(f.fileno()).st_ino:
+                            continue
+                    except FileNotFoundError:
+                        raise ValueError(f"Key '{key}' not found")
+
+                    expiry = pickle.load(f)
+                    if expiry is not None and expiry < time.time():
+                        raise ValueError(f"Key '{key}' not found")
+                    value = pickle.loads(zlib.decompress(f.read())) + delta
+
+                    # Replaced rather than rewritten, readers don't lock
+                    fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+                    try:
+                        with open(fd, 'wb') as tmp_file:
+                            tmp_file.write(pickle.dumps(expiry, self.pickle_protocol))
+                            tmp_file.write(zlib.compress(pickle.dumps(value, self.pickle_protocol)))
+                        os.replace(tmp_path, fname)
+                    except BaseException:
+                        os.remove(tmp_path)
+                        raise
+
+                    return value
+                finally:
+                    locks.unlock(f)
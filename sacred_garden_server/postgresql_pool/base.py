@@ -0,0 +1,101 @@
+"""
+PostgreSQL backend which keeps connections in an in-process pool.
+
+Django still closes the connection at the end of every request
+(CONN_MAX_AGE = 0), but instead of dropping the socket the psycopg2
+connection is returned to the pool and reused by the next request
+handled by the same process.
+
+Extra DATABASES settings:
+    POOL_SIZE - max number of idle connections kept per process (default 10)
+    CONN_HEALTH_CHECKS - run `SELECT 1` before reusing a pooled connection
+"""
+import os
+import queue
+import threading
+
+from django.db.backends.postgresql import base
+
+
+class ConnectionPool:
+
+    def __init__(self, size):
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return None
+
+    def put(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, size):
+    with _pools_lock:
+        pool = _pools.get(alias)
+
+        # Connections inherited from the parent process (e.g. gunicorn master)
+        # must not be shared with it
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[alias] = ConnectionPool(size)
+
+        return pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get('POOL_SIZE', 10))
+
+    def get_new_connection(self, conn_params):
+        while (connection := self.pool.get()) is not None:
+            if self.is_reusable(connection):
+                self.isolation_level = self.settings_dict['OPTIONS'].get(
+                    'isolation_level', connection.isolation_level)
+                return connection
+
+            connection.close()
+
+        return super().get_new_connection(conn_params)
+
+    def is_reusable(self, connection):
+        if connection.closed:
+            return False
+
+        if not self.settings_dict['CONN_HEALTH_CHECKS']:
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+
+        return True
+
+    def _close(self):
+        connection = self.connection
+
+        if connection.closed:
+            return
+
+        try:
+            # Do not hand an open transaction to the next request
+            connection.rollback()
+            connection.autocommit = True
+        except base.Database.Error:
+            connection.close()
+            return
+
+        self.pool.put(connection)
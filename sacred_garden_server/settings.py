@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from pathlib import Path
+from corsheaders.defaults import default_headers as default_cors_headers
 import datetime
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -33,6 +36,11 @@ if ALLOWED_HOSTS == ['']:
     ALLOWED_HOSTS = []
 
 
+# API-only profile: serve the JWT API without admin, sessions, CSRF and messages.
+# Run a separate instance without it when the admin is needed.
+API_ONLY = int(os.environ.get("API_ONLY", default=0))
+
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -60,6 +68,22 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+API_ONLY_EXCLUDED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+]
+
+API_ONLY_MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+if API_ONLY:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_ONLY_EXCLUDED_APPS]
+    MIDDLEWARE = API_ONLY_MIDDLEWARE
+
 ROOT_URLCONF = 'sacred_garden_server.urls'
 
 TEMPLATES = [
@@ -78,6 +102,11 @@ TEMPLATES = [
     },
 ]
 
+if API_ONLY:
+    TEMPLATES[0]['OPTIONS']['context_processors'] = [
+        'django.template.context_processors.request',
+    ]
+
 WSGI_APPLICATION = 'sacred_garden_server.wsgi.application'
 
 
@@ -93,6 +122,58 @@ DATABASES = {
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
         'ATOMIC_REQUESTS': True,
+        # Keep connections open between requests and check them before reuse
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": bool(int(os.environ.get("SQL_CONN_HEALTH_CHECKS", 1))),
+        # Max idle connections per process when SQL_CONN_POOL is enabled
+        "POOL_SIZE": int(os.environ.get("SQL_POOL_SIZE", 10)),
+    }
+}
+
+# In-process connection pool (PostgreSQL only): connections are returned to
+# the pool at the end of every request instead of staying bound to a thread
+if int(os.environ.get("SQL_CONN_POOL", 0)):
+    DATABASES["default"]["ENGINE"] = "sacred_garden_server.postgresql_pool"
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+
+# Read replica of the default database for the read-only endpoints, see
+# sacred_garden.routers. For SQLite SQL_REPLICA_DATABASE is the file of a copy.
+if os.environ.get("SQL_REPLICA_HOST") or os.environ.get("SQL_REPLICA_DATABASE"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get("SQL_REPLICA_DATABASE", DATABASES["default"]["NAME"]),
+        "HOST": os.environ.get("SQL_REPLICA_HOST", DATABASES["default"]["HOST"]),
+        "PORT": os.environ.get("SQL_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "ATOMIC_REQUESTS": False,
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["sacred_garden.routers.ReplicaRouter"]
+
+# Off by default in tests, whose uncommitted data the replica connection doesn't see
+REPLICA_READS = int(os.environ.get(
+    "REPLICA_READS", default="replica" in DATABASES and sys.argv[1:2] != ['test']))
+
+# Seconds the reads of a user stay on the default database after a write visible to them
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 5))
+
+# Per-process cache of the statuses of the emails checked by check-user, see
+# sacred_garden.email_status. Off by default in tests, whose rolled back users
+# the cache would outlive
+EMAIL_STATUS_CACHE_TTL = int(os.environ.get(
+    "EMAIL_STATUS_CACHE_TTL", default=0 if sys.argv[1:2] == ['test'] else 10))
+EMAIL_STATUS_CACHE_SIZE = int(os.environ.get("EMAIL_STATUS_CACHE_SIZE", 10000))
+
+# Shared by the processes, e.g. the throttles' buckets: by default files in a
+# directory of the host, "django.core.cache.backends.redis.RedisCache" across
+# hosts. Local memory in tests.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", default=(
+            "django.core.cache.backends.locmem.LocMemCache" if sys.argv[1:2] == ['test']
+            else "sacred_garden_server.file_cache.FileBasedCache")),
+        "LOCATION": os.environ.get("CACHE_LOCATION", default=(
+            "" if sys.argv[1:2] == ['test'] else os.path.join(tempfile.gettempdir(), "sacred_garden_cache"))),
     }
 }
 
@@ -116,6 +197,33 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/4.1/topics/auth/passwords/
+#
+# The policy hasher is used for new passwords, the other hashers only verify
+# existing hashes, which Django rehashes with the policy hasher (and its current
+# cost parameters) on the next successful login. "argon2" needs argon2-cffi.
+
+PASSWORD_HASHING_POLICY = os.environ.get("PASSWORD_HASHING_POLICY", "pbkdf2")
+
+PASSWORD_HASHING_PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_HASHING_PBKDF2_ITERATIONS", 390000))
+PASSWORD_HASHING_SCRYPT_WORK_FACTOR = int(os.environ.get("PASSWORD_HASHING_SCRYPT_WORK_FACTOR", 2**14))
+PASSWORD_HASHING_ARGON2_TIME_COST = int(os.environ.get("PASSWORD_HASHING_ARGON2_TIME_COST", 2))
+PASSWORD_HASHING_ARGON2_MEMORY_COST = int(os.environ.get("PASSWORD_HASHING_ARGON2_MEMORY_COST", 102400))
+PASSWORD_HASHING_ARGON2_PARALLELISM = int(os.environ.get("PASSWORD_HASHING_ARGON2_PARALLELISM", 1))
+
+PASSWORD_HASHERS_BY_POLICY = {
+    'pbkdf2': 'sacred_garden.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'sacred_garden.hashers.TunedScryptPasswordHasher',
+    'argon2': 'sacred_garden.hashers.TunedArgon2PasswordHasher',
+}
+
+PASSWORD_HASHERS = [PASSWORD_HASHERS_BY_POLICY[PASSWORD_HASHING_POLICY]] + [
+    hasher for policy, hasher in PASSWORD_HASHERS_BY_POLICY.items()
+    if policy != PASSWORD_HASHING_POLICY
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -144,17 +252,79 @@ JWT_AUTH = {
     'JWT_EXPIRATION_DELTA': datetime.timedelta(days=10),
 }
 
+# Seconds a user resolved from a JWT stays in the per-process cache, of at most
+# JWT_USER_CACHE_SIZE users
+JWT_USER_CACHE_TTL = int(os.environ.get("JWT_USER_CACHE_TTL", 30))
+JWT_USER_CACHE_SIZE = int(os.environ.get("JWT_USER_CACHE_SIZE", 10000))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'sacred_garden.authentication.CachedJSONWebTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
+    # Token buckets of the unauthenticated endpoints, see sacred_garden.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'check_user_ip': os.environ.get("THROTTLE_CHECK_USER_IP", "60/min"),
+        'check_user_email': os.environ.get("THROTTLE_CHECK_USER_EMAIL", "10/min"),
+        'join_wait_list_ip': os.environ.get("THROTTLE_JOIN_WAIT_LIST_IP", "10/min"),
+        'join_wait_list_email': os.environ.get("THROTTLE_JOIN_WAIT_LIST_EMAIL", "5/hour"),
+        'request_password_reset_ip': os.environ.get("THROTTLE_REQUEST_PASSWORD_RESET_IP", "10/min"),
+        'request_password_reset_email': os.environ.get("THROTTLE_REQUEST_PASSWORD_RESET_EMAIL", "5/hour"),
+        'registration_ip': os.environ.get("THROTTLE_REGISTRATION_IP", "10/min"),
+        'registration_email': os.environ.get("THROTTLE_REGISTRATION_EMAIL", "10/hour"),
+    },
 }
 
+# Proxies in front of the API, whose X-Forwarded-For gives the client IP of the throttles
+if os.environ.get("NUM_PROXIES"):
+    REST_FRAMEWORK['NUM_PROXIES'] = int(os.environ["NUM_PROXIES"])
+
+# Session and Basic auth are only useful with the admin / browsable API,
+# and Basic auth costs a password hash on every request that sends it
+API_ONLY_AUTHENTICATION_CLASSES = (
+    'sacred_garden.authentication.CachedJSONWebTokenAuthentication',
+)
+
+if API_ONLY:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = API_ONLY_AUTHENTICATION_CLASSES
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+        'rest_framework.renderers.JSONRenderer',
+    )
+
+# Raise instead of querying when EmotionalNeed.current_state was not loaded
+# with select_related, on by default in tests so that N+1 queries fail them
+STRICT_CURRENT_STATE_LOADING = int(os.environ.get(
+    "STRICT_CURRENT_STATE_LOADING", default=DEBUG or sys.argv[1:2] == ['test']))
+
+# States older than this, except the current one, are moved to compressed
+# archives by the archive_emotional_need_states command
+EMOTIONAL_NEED_STATE_ARCHIVE_DAYS = int(os.environ.get("EMOTIONAL_NEED_STATE_ARCHIVE_DAYS", 365))
+
+# Jobs enqueued by requests and run by the run_jobs command, see sacred_garden.jobs
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", 4))
+JOBS_POLL_INTERVAL_SECONDS = float(os.environ.get("JOBS_POLL_INTERVAL_SECONDS", 1))
+JOBS_LEASE_SECONDS = int(os.environ.get("JOBS_LEASE_SECONDS", 600))
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 3))
+JOBS_RETRY_DELAY_SECONDS = int(os.environ.get("JOBS_RETRY_DELAY_SECONDS", 30))
+
+# Installs sacred_garden.profiling.ProfilingMiddleware, which profiles the requests of
+# staff users sent with the X-Profile header and a PROFILING_SAMPLE_RATE fraction of all
+# requests. Sync only, enable it on WSGI workers
+PROFILING_ENABLED = int(os.environ.get("PROFILING_ENABLED", 0))
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+
+if PROFILING_ENABLED:
+    MIDDLEWARE = ['sacred_garden.profiling.ProfilingMiddleware'] + MIDDLEWARE
+
+# Delivery of events streamed by /events/: "sacred_garden.events.InProcessBroker"
+# (single process) or "sacred_garden.events.PostgresBroker" (LISTEN/NOTIFY)
+EVENTS_BROKER = os.environ.get("EVENTS_BROKER", "sacred_garden.events.InProcessBroker")
+EVENTS_HEARTBEAT_SECONDS = 15
+
 CORS_ALLOWED_ORIGINS = os.environ.get(
     "DJANGO_CORS_ALLOWED_ORIGINS",
     "http://localhost:4200",
@@ -178,6 +348,10 @@ DEFAULT_FROM_EMAIL = "no-reply@sacredgarden.love"
 PASSWORD_RESET_FROM_EMAIL = "no-reply@sacredgarden.love"
 PASSWORD_INVITE_FROM_EMAIL = "no-reply@sacredgarden.love"
 
+# Conditional GET support for the UI
+CORS_ALLOW_HEADERS = list(default_cors_headers) + ["if-none-match"]
+CORS_EXPOSE_HEADERS = ["ETag", "X-Profile-Id"]
+
 UI_DOMAIN = CORS_ALLOWED_ORIGINS[0]
 
 EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.filebased.EmailBackend")
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
@@ -5,6 +6,8 @@ from sacred_garden import urls
 
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/sacred_garden/v1/', include(urls.urlpatterns)),
 ]
+
+if not settings.API_ONLY:
+    urlpatterns.append(path('admin/', admin.site.urls))